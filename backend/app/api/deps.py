@@ -1,16 +1,28 @@
 # backend/app/api/deps.py
+import asyncio
+from typing import Any, AsyncIterator, Dict
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer # Chỉ cần import cái này
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 
 from .. import models, schemas, crud # Đảm bảo các import này đúng
 from ..config import settings
-from ..db.session import SessionLocal
+from ..core.cache import LRUCache
+from ..db.session import SessionLocal, get_async_sessionmaker
 
 # Định nghĩa scheme xác thực - ĐÂY LÀ CHỖ QUAN TRỌNG NHẤT
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
+# Người dùng đã xác thực, theo "sub" (email) của token. Object User được tách khỏi session
+# (chỉ các cột đã nạp, không lazy-load quan hệ) và dùng chung giữa các request.
+_user_cache = LRUCache(
+    max_entries=settings.AUTH_USER_CACHE_MAX_ENTRIES, ttl_seconds=settings.AUTH_USER_CACHE_TTL_SECONDS
+)
+# Truy vấn người dùng đang chạy, theo email: các request đồng thời trượt cache cùng một người dùng
+# (ví dụ khi TTL vừa hết) chờ chung một truy vấn thay vì mỗi request một kết nối
+_user_loads: Dict[str, "asyncio.Task[models.User | None]"] = {}
+
 def get_db():
     db = SessionLocal()
     try:
@@ -18,24 +30,58 @@ def get_db():
     finally:
         db.close()
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme) # Sử dụng oauth2_scheme ở đây
-) -> models.User:
-    credentials_exception = HTTPException(
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _token_subject(token: str) -> str:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str | None = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            raise _credentials_exception()
         # Không cần TokenData ở đây nếu chỉ lấy email
     except JWTError:
-        raise credentials_exception
-    
-    user = crud.crud_user.get_user_by_email(db, email=email) # Sửa lại cách lấy email
+        raise _credentials_exception()
+    return email
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> models.User:
+    """
+    Xác thực token và trả về người dùng. Chữ ký và hạn của token luôn được kiểm tra; người dùng được lấy
+    từ cache (AUTH_USER_CACHE_*) nếu có, nên request lặp lại không tốn truy vấn database nào.
+    Session chỉ được mở khi cache trượt.
+    """
+    email = _token_subject(token)
+    if not settings.AUTH_USER_CACHE_ENABLED:
+        user = await _load_user(email)
+    else:
+        user = _user_cache.get(email)
+        if user is None:
+            load = _user_loads.get(email)
+            if load is None:
+                load = asyncio.ensure_future(_load_user(email))
+                _user_loads[email] = load
+                load.add_done_callback(lambda _: _user_loads.pop(email, None))
+            # shield: request bị hủy (client ngắt kết nối) không hủy truy vấn mà request khác đang chờ
+            user = await asyncio.shield(load)
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        raise _credentials_exception()
+    return user
+
+async def _load_user(email: str) -> models.User | None:
+    async with get_async_sessionmaker()() as db:
+        user = await crud.crud_user.aget_user_by_email(db, email=email)
+    # Không cache kết quả rỗng: token hợp lệ của người dùng vừa đăng ký phải dùng được ngay
+    if user is not None and settings.AUTH_USER_CACHE_ENABLED:
+        _user_cache.set(email, user)
+    return user
+
+def get_auth_cache_stats() -> Dict[str, Any]:
+    return {"enabled": settings.AUTH_USER_CACHE_ENABLED, **_user_cache.stats()}
@@ -1,8 +1,9 @@
 # backend/app/api/v1/endpoints/auth.py
+import asyncio
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .... import crud, schemas
 from ....api import deps
@@ -12,23 +13,24 @@ from ....config import settings
 router = APIRouter()
 
 @router.post("/register", response_model=schemas.UserResponse)
-def register_user(user_in: schemas.UserCreate, db: Session = Depends(deps.get_db)):
-    user = crud.crud_user.get_user_by_email(db, email=user_in.email)
+async def register_user(user_in: schemas.UserCreate, db: AsyncSession = Depends(deps.get_async_db)):
+    user = await crud.crud_user.aget_user_by_email(db, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
-    user = crud.crud_user.create_user(db=db, user=user_in)
+    user = await crud.crud_user.acreate_user(db=db, user=user_in)
     return user
 
 @router.post("/login", response_model=schemas.Token)
-def login_for_access_token(
-    db: Session = Depends(deps.get_db),
+async def login_for_access_token(
+    db: AsyncSession = Depends(deps.get_async_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
-    user = crud.crud_user.get_user_by_email(db, email=form_data.username) # OAuth2 form dùng "username" cho email
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await crud.crud_user.aget_user_by_email(db, email=form_data.username) # OAuth2 form dùng "username" cho email
+    # bcrypt tốn CPU, chạy ngoài event loop
+    if not user or not await asyncio.to_thread(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
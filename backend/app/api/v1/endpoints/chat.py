@@ -1,8 +1,10 @@
 # backend/app/api/v1/endpoints/chat.py
 
+from typing import AsyncIterator
 from fastapi import APIRouter, Depends
-from ....schemas.chat import ChatRequest, ChatResponse
-from ....core.rag import get_agentic_rag_response
+from fastapi.responses import StreamingResponse
+from ....schemas.chat import ChatRequest, ChatResponse, ChatStreamEvent
+from ....core.rag import get_agentic_rag_response, stream_agentic_rag_response
 from ....api import deps
 from .... import models
 
@@ -25,4 +27,33 @@ async def chat_with_document(
         user_id=current_user.id # <-- Truyền user_id vào logic RAG
     )
     
-    return ChatResponse(**response_data)
\ No newline at end of file
+    return ChatResponse(**response_data)
+
+@router.post("/stream", response_class=StreamingResponse)
+async def chat_with_document_stream(
+    request: ChatRequest,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Phiên bản streaming của endpoint chat (NDJSON, mỗi dòng là một ChatStreamEvent).
+    - Gửi danh sách nguồn ngay khi truy xuất và rerank xong.
+    - Sau đó stream từng phần câu trả lời của LLM.
+    """
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for event in stream_agentic_rag_response(
+                query=request.query,
+                history=request.history,
+                document_id=request.document_id,
+                user_id=current_user.id
+            ):
+                yield ChatStreamEvent(**event).model_dump_json(exclude_none=True) + "\n"
+        except Exception as e:
+            print(f"Lỗi khi stream câu trả lời: {e}")
+            yield ChatStreamEvent(type="error", content="Lỗi khi tạo câu trả lời. Vui lòng thử lại.").model_dump_json(exclude_none=True) + "\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
\ No newline at end of file
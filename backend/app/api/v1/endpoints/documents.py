@@ -1,17 +1,19 @@
 # backend/app/api/v1/endpoints/documents.py
 
-import shutil
+import asyncio
+import hashlib
 from pathlib import Path
 import time
 import uuid
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, BackgroundTasks, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, BackgroundTasks, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 from ....core.rag import delete_vectors_for_document
 from typing import List
 from .... import crud, models, schemas
 from ....api import deps
 from ....core.ingestion import process_document_and_embed
+from ....config import settings
 
 router = APIRouter()
 
@@ -22,21 +24,40 @@ STORAGE_PATH.mkdir(exist_ok=True)
 # Định nghĩa các loại file được chấp nhận
 ALLOWED_CONTENT_TYPES = ["application/pdf"]
 
+def _save_upload(file: UploadFile, saved_filepath: Path) -> str:
+    """
+    Ghi file upload xuống đĩa theo từng khối 1 MiB, trả về SHA-256 nội dung.
+    """
+    digest = hashlib.sha256()
+    try:
+        with saved_filepath.open("wb") as buffer:
+            for block in iter(lambda: file.file.read(1 << 20), b""):
+                digest.update(block)
+                buffer.write(block)
+    finally:
+        file.file.close()
+    return digest.hexdigest()
+
 @router.post("/upload", response_model=schemas.DocumentResponse)
-def upload_document(
+async def upload_document(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: models.User = Depends(deps.get_current_user),
     background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    replace_document_id: int | None = Form(None),
 ):
     """
     Upload một tài liệu PDF.
     - Yêu cầu người dùng phải đăng nhập.
     - Tự động tạo một tên file duy nhất trên server để tránh trùng lặp.
     - Lưu file vào thư mục cục bộ.
-    - Tạo một record trong database để theo dõi.
-    - Kích hoạt tác vụ nền để xử lý tài liệu.
+    - Tạo một record trong database để theo dõi. File trùng nội dung (SHA-256) với tài liệu đã có
+      không được xử lý lại.
+    - Gửi kèm `replace_document_id` để upload phiên bản mới của một tài liệu đã có (chỉ các chunk thay đổi
+      được embed lại); nếu không, file luôn tạo tài liệu mới, kể cả khi trùng tên.
+    - Đưa tài liệu vào hàng đợi ingest (xử lý bởi `python -m app.worker`),
+      hoặc chạy bằng tác vụ nền khi INGESTION_MODE="background".
     """
     # 1. Kiểm tra loại file
     if file.content_type not in ALLOWED_CONTENT_TYPES:
@@ -48,6 +69,17 @@ def upload_document(
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file name provided.")
 
+    # Tài liệu được thay thế phải tồn tại, thuộc về người dùng và không đang được xử lý
+    previous_version = None
+    if replace_document_id is not None:
+        previous_version = await crud.crud_document.aget_document(db, document_id=replace_document_id)
+        if not previous_version:
+            raise HTTPException(status_code=404, detail="Tài liệu cần thay thế không tồn tại.")
+        if previous_version.owner_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Không có quyền thay thế tài liệu này.")
+        if previous_version.status == models.DocumentStatus.PROCESSING:
+            raise HTTPException(status_code=409, detail="Phiên bản trước của tài liệu đang được xử lý, vui lòng thử lại sau.")
+
     # 2. Tạo tên file duy nhất
     # Lấy phần mở rộng của file (ví dụ: .pdf)
     file_extension = Path(file.filename).suffix
@@ -57,47 +89,81 @@ def upload_document(
     
     saved_filepath = STORAGE_PATH / unique_filename
 
-    # 3. Lưu file vật lý
-    try:
-        with saved_filepath.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    finally:
-        file.file.close()
-        
-    # 4. Tạo record trong database
-    # `filename` sẽ lưu tên file gốc để hiển thị cho người dùng.
-    # `filepath` sẽ lưu đường dẫn duy nhất trên server.
-    document_in = schemas.DocumentCreate(
-        filename=file.filename,
-        filepath=str(saved_filepath)
-    )
-    
-    db_document = crud.crud_document.create_document(
-        db=db, document_in=document_in, owner_id=current_user.id
-    )
+    # 3. Lưu file vật lý, đồng thời tính SHA-256 nội dung (IO đĩa chạy ngoài event loop)
+    content_hash = await asyncio.to_thread(_save_upload, file, saved_filepath)
+
+    # 4. Bỏ qua file trùng nội dung; nếu có `replace_document_id`, file là phiên bản mới của tài liệu đó
+    duplicate = await crud.crud_document.aget_document_by_content_hash(db, owner_id=current_user.id, content_hash=content_hash)
+    if duplicate:
+        os.remove(saved_filepath)
+        if duplicate.status != models.DocumentStatus.FAILED:
+            return duplicate
+        # Lần xử lý trước thất bại: thử lại với file đã lưu
+        db_document = await crud.crud_document.arequeue_document(db, duplicate)
+    else:
+        if previous_version:
+            # Worker có thể đã nhận tài liệu trong lúc lưu file
+            await db.refresh(previous_version)
+            if previous_version.status == models.DocumentStatus.PROCESSING:
+                os.remove(saved_filepath)
+                raise HTTPException(status_code=409, detail="Phiên bản trước của tài liệu đang được xử lý, vui lòng thử lại sau.")
+            # Chỉ các chunk thay đổi được embed lại; chunk không còn trong file mới bị xóa khỏi Qdrant
+            old_filepath = previous_version.filepath
+            previous_version.filename = file.filename
+            db_document = await crud.crud_document.arequeue_document(
+                db, previous_version, filepath=str(saved_filepath), content_hash=content_hash
+            )
+            if os.path.exists(old_filepath):
+                os.remove(old_filepath)
+        else:
+            # `filename` sẽ lưu tên file gốc để hiển thị cho người dùng.
+            # `filepath` sẽ lưu đường dẫn duy nhất trên server.
+            document_in = schemas.DocumentCreate(
+                filename=file.filename,
+                filepath=str(saved_filepath),
+                content_hash=content_hash,
+            )
+            db_document = await crud.crud_document.acreate_document(
+                db=db, document_in=document_in, owner_id=current_user.id
+            )
     
-    # 5. Kích hoạt tác vụ nền
-    background_tasks.add_task(process_document_and_embed, document_id=db_document.id)
+    # 5. Record ở trạng thái UPLOADING chính là job trong hàng đợi; worker sẽ nhận và xử lý.
+    if settings.INGESTION_MODE == "background":
+        background_tasks.add_task(process_document_and_embed, document_id=db_document.id)
 
     return db_document
 
 @router.get("/", response_model=List[schemas.DocumentResponse])
-def read_documents(
-    db: Session = Depends(deps.get_db),
+async def read_documents(
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: models.User = Depends(deps.get_current_user),
-    skip: int = 0, # Tùy chọn cho phân trang
-    limit: int = 100 # Tùy chọn cho phân trang
+    limit: int = Query(100, ge=1, le=settings.DOCUMENT_LIST_MAX_LIMIT),
+    cursor: str | None = None,
+    status_filter: models.DocumentStatus | None = Query(None, alias="status"),
 ):
     """
-    Lấy danh sách các tài liệu của người dùng hiện tại.
+    Lấy danh sách các tài liệu của người dùng hiện tại, mới nhất trước, tối đa `limit` tài liệu mỗi trang.
+    - Nếu còn trang sau, header `X-Next-Cursor` chứa con trỏ; gửi lại qua `?cursor=` để lấy trang tiếp theo.
+    - `?status=` chỉ lấy tài liệu ở trạng thái đó.
     """
-    documents = crud.crud_document.get_documents_by_owner(db=db, owner_id=current_user.id)
+    after = None
+    if cursor:
+        try:
+            after = crud.crud_document.decode_document_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Con trỏ phân trang không hợp lệ.")
+    documents, next_after = await crud.crud_document.aget_documents_page(
+        db, owner_id=current_user.id, limit=limit, after=after, status=status_filter
+    )
+    if next_after:
+        response.headers["X-Next-Cursor"] = crud.crud_document.encode_document_cursor(*next_after)
     return documents
 
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_document(
+async def delete_document(
     document_id: int,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: models.User = Depends(deps.get_current_user)
 ):
     """
@@ -106,7 +172,7 @@ def delete_document(
     - Chỉ chủ sở hữu mới có thể xóa tài liệu của mình.
     - Xóa file vật lý, các vector liên quan và record trong database.
     """
-    db_document = crud.crud_document.get_document(db, document_id=document_id)
+    db_document = await crud.crud_document.aget_document(db, document_id=document_id)
 
     # 1. Kiểm tra xem tài liệu có tồn tại không
     if not db_document:
@@ -126,10 +192,10 @@ def delete_document(
         # Có thể quyết định dừng lại hoặc tiếp tục xóa dữ liệu khác
         
     # 4. Xóa các vector liên quan trong Qdrant
-    delete_vectors_for_document(document_id=document_id)
+    await asyncio.to_thread(delete_vectors_for_document, document_id=document_id, owner_id=db_document.owner_id)
 
     # 5. Xóa record trong database PostgreSQL
-    crud.crud_document.delete_document(db=db, document_id=document_id)
+    await crud.crud_document.adelete_document(db=db, document_id=document_id)
     
     # Trả về 204 No Content, không cần body
     return
\ No newline at end of file
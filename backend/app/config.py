@@ -34,5 +34,187 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Cấu hình tải model/client (xem app/core/registry.py)
+    # "eager": warm-up toàn bộ thành phần (truy vấn + ingestion) khi server khởi động.
+    # "lazy": chỉ warm-up thành phần truy vấn; thành phần chỉ dùng cho ingestion
+    #         (ví dụ partition_pdf) được tải khi có tài liệu cần xử lý lần đầu.
+    MODEL_LOADING_MODE: str = "eager"
+
+    # Số luồng tối đa cho các tác vụ CPU (encode, rerank) trong luồng chat
+    INFERENCE_MAX_WORKERS: int = 4
+
+    # Micro-batching: gom các lời gọi encode/rerank đồng thời thành một batch
+    MICRO_BATCHING_ENABLED: bool = True
+    ENCODE_BATCH_MAX_SIZE: int = 32  # số câu truy vấn tối đa mỗi batch encode
+    RERANK_BATCH_MAX_SIZE: int = 256  # số cặp (query, chunk) tối đa mỗi batch rerank
+    MICRO_BATCH_MAX_WAIT_MS: float = 5.0
+
+    # Cache câu trả lời (exact-match + semantic) cho các câu hỏi lặp lại
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: float = 3600
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+
+    # Cache embedding truy vấn và kết quả truy xuất (đã rerank)
+    # CACHE_BACKEND: "memory" (trong tiến trình) hoặc "redis" (chia sẻ giữa các worker)
+    CACHE_BACKEND: str = "memory"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    CORPUS_VERSION_REFRESH_SECONDS: float = 1.0
+    QUERY_EMBEDDING_CACHE_ENABLED: bool = True
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES: int = 10000
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 2000
+    RETRIEVAL_CACHE_TTL_SECONDS: float = 600
+
+    # Định tuyến công cụ (document_search / web_search) khi không chỉ định tài liệu
+    # "llm": luôn hỏi LLM; "local": chỉ dùng bộ định tuyến cục bộ;
+    # "hybrid": dùng bộ định tuyến cục bộ, chỉ hỏi LLM khi chưa chắc chắn.
+    ROUTER_MODE: str = "hybrid"
+    ROUTER_EMBEDDING_MARGIN: float = 0.05
+    ROUTER_RERANK_CONFIDENCE: float = 0.5
+
+    # Rút gọn câu hỏi theo lịch sử trò chuyện
+    # Bỏ qua lời gọi LLM khi câu hỏi đã đủ nghĩa (không có đại từ/từ chỉ định trỏ về lịch sử)
+    CONDENSE_SKIP_SELF_CONTAINED: bool = True
+    # Giới hạn kích thước lịch sử đưa vào prompt (ước lượng số token)
+    CONDENSE_HISTORY_MAX_TOKENS: int = 1500
+    # Cache câu hỏi đã rút gọn theo (lịch sử, câu hỏi) để retry/regenerate không gọi lại LLM
+    CONDENSE_CACHE_ENABLED: bool = True
+    CONDENSE_CACHE_MAX_ENTRIES: int = 5000
+    CONDENSE_CACHE_TTL_SECONDS: float = 3600
+
+    # Chế độ thực thi cho câu hỏi không chỉ định tài liệu
+    # "sequential": định tuyến rồi mới truy xuất; "speculative": truy xuất song song với định tuyến
+    CHAT_EXECUTION_MODE: str = "sequential"
+    # Trong chế độ speculative, chạy cả web search song song (tốn thêm lời gọi Tavily)
+    SPECULATIVE_WEB_SEARCH: bool = False
+
+    # Ingest tài liệu
+    # "queue": tài liệu upload được đưa vào hàng đợi (bảng documents), xử lý bởi worker riêng
+    #          (`python -m app.worker`); "background": xử lý bằng BackgroundTasks trong tiến trình API.
+    INGESTION_MODE: str = "queue"
+    # Số tiến trình xử lý tài liệu song song của một worker
+    INGESTION_WORKER_CONCURRENCY: int = 2
+    INGESTION_POLL_INTERVAL_SECONDS: float = 2.0
+    # Thử lại job lỗi: tối đa INGESTION_MAX_ATTEMPTS lần, chờ BACKOFF * 2^(lần thử - 1) giây
+    INGESTION_MAX_ATTEMPTS: int = 3
+    INGESTION_RETRY_BACKOFF_SECONDS: float = 30
+    # Job PROCESSING không có heartbeat quá lâu (worker bị crash) được đưa lại hàng đợi
+    INGESTION_JOB_STALE_SECONDS: float = 900
+    # Tiến trình chính của worker làm mới heartbeat của các job đang chạy sau mỗi khoảng này
+    INGESTION_HEARTBEAT_SECONDS: float = 30
+    # Pipeline ingest streaming: số trang đọc mỗi lần, số chunk mỗi lượt embed/upsert,
+    # và số nhóm trang được đọc trước trong khi đang embed (giới hạn bộ nhớ)
+    INGESTION_PAGES_PER_BATCH: int = 10
+    INGESTION_EMBED_BATCH_SIZE: int = 64
+    INGESTION_PARSE_PREFETCH: int = 1
+
+    # Cache embedding trên đĩa cho ingest (theo model và nội dung chunk), dùng chung giữa các tài liệu
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = "storage/embedding_cache"
+    # Số vector tối đa cho mỗi model; khi đầy, mục lâu nhất chưa dùng bị thay thế (LRU)
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 100000
+
+    # Ghi vector vào Qdrant khi ingest (xem app/core/qdrant_writer.py)
+    QDRANT_UPSERT_BATCH_SIZE: int = 256
+    QDRANT_UPSERT_PARALLELISM: int = 4
+    QDRANT_UPSERT_MAX_RETRIES: int = 3
+    QDRANT_UPSERT_RETRY_BACKOFF_SECONDS: float = 0.5
+    # "each": mọi batch chờ Qdrant index xong (wait=True); "barrier": chỉ chờ ở cuối mỗi tài liệu
+    QDRANT_UPSERT_WAIT_MODE: str = "barrier"
+    # Dùng gRPC (port 6334) thay cho REST cho các client Qdrant
+    QDRANT_PREFER_GRPC: bool = False
+
+    # Layout collection Qdrant (xem app/core/qdrant_collection.py). Chỉ áp dụng khi tạo collection;
+    # collection đã có thì chạy scripts/migrate_qdrant_collection.py.
+    QDRANT_PAYLOAD_INDEXES: bool = True  # index owner_id, document_id
+    # HNSW theo tenant: không có graph toàn cục (m=0), mỗi owner_id/document_id một graph (payload_m=QDRANT_HNSW_M)
+    QDRANT_TENANT_HNSW: bool = False
+    QDRANT_HNSW_M: int = 16
+    QDRANT_HNSW_EF: int = 0  # ef khi search (0: mặc định của Qdrant)
+    # Lượng tử hóa vector dense: "" (không), "scalar" (int8) hoặc "binary" (chỉ hợp với model nhiều chiều)
+    QDRANT_QUANTIZATION: str = ""
+    # Chấm lại top ứng viên bằng vector gốc; lấy oversampling * limit ứng viên trước khi chấm lại
+    QDRANT_QUANTIZATION_RESCORE: bool = True
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = 2.0
+    # Để vector dense gốc trên đĩa (memmap); bản lượng tử hóa (nếu có) vẫn nằm trong RAM
+    QDRANT_DENSE_ON_DISK: bool = False
+
+    # Nơi lưu nội dung chunk: "postgres" (bảng document_chunks, payload Qdrant chỉ giữ id và các trường lọc)
+    # hoặc "payload" (text và filename trong payload Qdrant như trước đây). Chunk chưa có trong bảng được lấy
+    # từ payload, nên collection cũ vẫn dùng được; chuyển dữ liệu cũ bằng scripts/migrate_chunk_store.py.
+    CHUNK_STORE: str = "postgres"
+
+    # Cách tạo sparse vector (xem app/core/sparse.py):
+    # "legacy": SentenceTransformer, lọc các phần tử > 0 từ vector dense;
+    # "native": SparseEncoder (SPLADE) trả về sparse tensor trên vocabulary. Đổi chế độ cần ingest lại.
+    SPARSE_ENCODING_MODE: str = "legacy"
+
+    # Nhánh sparse của hybrid search: "model" (sparse vector "text" trong Qdrant, cần SPARSE_VECTOR_MODEL_NAME)
+    # hoặc "bm25" (chỉ mục BM25 cục bộ, không cần model; xem app/core/bm25.py).
+    # Khi chuyển sang "bm25" cho kho tài liệu đã có, chạy scripts/build_bm25_index.py.
+    SPARSE_BACKEND: str = "model"
+    BM25_INDEX_DIR: str = "storage/bm25_index"
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    # Thêm bigram âm tiết (từ ghép tiếng Việt) và/hoặc bỏ dấu khi tách term; đổi cần xây lại chỉ mục
+    BM25_USE_BIGRAMS: bool = True
+    BM25_FOLD_DIACRITICS: bool = False
+    # Journal lớn hơn ngưỡng này (byte) thì được gộp vào snapshot mới
+    BM25_COMPACT_JOURNAL_BYTES: int = 64 * 1024 * 1024
+
+    # Gộp kết quả dense và sparse trước khi rerank (xem app/core/fusion.py):
+    # "rrf" (reciprocal rank fusion), "weighted" (tổng điểm đã chuẩn hóa) hoặc "none" (hợp theo id, không cắt bớt)
+    FUSION_MODE: str = "rrf"
+    RRF_K: int = 60
+    FUSION_DENSE_WEIGHT: float = 0.5  # trọng số nhánh dense khi FUSION_MODE="weighted"
+    # Số ứng viên đưa vào cross-encoder = top_k * giá trị này (0: không giới hạn)
+    RERANK_CANDIDATES_PER_RESULT: int = 5
+
+    # Backend cho reranker (xem app/core/model_backends.py): "torch", "onnx" hoặc "openvino"
+    RERANKER_BACKEND: str = "torch"
+    # Lượng tử hóa int8: "" (không); với "onnx": "avx512_vnni", "avx2", "arm64"...; với "openvino": "int8"
+    RERANKER_ONNX_QUANTIZATION: str = ""
+    # Số token tối đa của cặp (query, chunk) khi rerank; chunk dài hơn bị cắt (0: theo model)
+    RERANKER_MAX_LENGTH: int = 512
+    # Cascade: chấm điểm ứng viên bằng cosine dense (bi-encoder) trước, chỉ chạy cross-encoder trên
+    # các ứng viên có điểm >= điểm thứ top_k - MARGIN (tối đa top_k * HEAD_PER_RESULT ứng viên)
+    RERANK_CASCADE_ENABLED: bool = False
+    RERANK_CASCADE_MARGIN: float = 0.05
+    RERANK_CASCADE_HEAD_PER_RESULT: int = 3
+
+    # Backend suy luận cho model embedding dense và sparse (xem app/core/model_backends.py):
+    # "torch" (fp32), "onnx" (ONNX Runtime) hoặc "openvino". Kiểm tra độ lệch so với torch bằng
+    # scripts/check_embedding_equivalence.py trước khi đổi; vector đã ingest vẫn dùng được nếu độ lệch nhỏ.
+    EMBEDDING_BACKEND: str = "torch"
+    # Lượng tử hóa int8: "" (không); với "onnx": "avx512_vnni", "avx2", "arm64"...; với "openvino": "int8"
+    EMBEDDING_QUANTIZATION: str = ""
+    # Số luồng suy luận (0: mặc định của backend)
+    EMBEDDING_NUM_THREADS: int = 0
+    # Batch size khi encode chunk lúc ingest
+    EMBEDDING_ENCODE_BATCH_SIZE: int = 32
+    # Thư mục lưu model đã lượng tử hóa (embedding và reranker)
+    MODEL_EXPORT_DIR: str = "storage/models"
+
+    # Database bất đồng bộ cho API (SQLAlchemy asyncio + asyncpg, xem app/db/session.py).
+    # Bỏ trống DATABASE_ASYNC_URL: dùng DATABASE_URL với driver postgresql+asyncpg.
+    # Worker, script và ingestion vẫn dùng engine đồng bộ (psycopg2).
+    DATABASE_ASYNC_URL: str = ""
+    # Pool kết nối của engine bất đồng bộ (mỗi tiến trình API): tối đa POOL_SIZE + MAX_OVERFLOW kết nối
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 20
+    DATABASE_POOL_TIMEOUT_SECONDS: float = 30.0
+    # Đóng và mở lại kết nối sau số giây này (tránh kết nối bị proxy/PgBouncer cắt)
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800
+
+    # Cache người dùng đã xác thực (theo "sub" của token) trong tiến trình: request chat liên tiếp
+    # không truy vấn bảng users. Thay đổi tài khoản có hiệu lực sau tối đa TTL giây.
+    AUTH_USER_CACHE_ENABLED: bool = True
+    AUTH_USER_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_USER_CACHE_TTL_SECONDS: float = 60
+
+    # Số tài liệu tối đa mỗi trang của GET /documents/ (phân trang keyset, con trỏ trong header X-Next-Cursor)
+    DOCUMENT_LIST_MAX_LIMIT: int = 500
+
 # Khởi tạo một đối tượng settings để sử dụng trong toàn bộ ứng dụng
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,155 @@
+# backend/app/core/answer_cache.py
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .cache import LRUCache
+
+# Scope của một câu trả lời: (owner_id được phép truy cập, document_id hoặc None)
+Scope = Tuple[int, int | None]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Chuẩn hóa câu hỏi cho tầng exact-match: chữ thường, gộp khoảng trắng,
+    bỏ dấu câu ở cuối.
+    """
+    normalized = re.sub(r"\s+", " ", query.strip().lower())
+    return normalized.rstrip(" ?!.")
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[Any]
+    query: str
+    scope: Scope
+    version: Tuple[int, int]
+    embedding: np.ndarray | None = None
+    stored_at: float = field(default_factory=time.monotonic)
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời hai tầng cho get_agentic_rag_response:
+    - Tầng exact-match: LRU theo (câu hỏi độc lập đã chuẩn hóa, scope, phiên bản kho tài liệu).
+    - Tầng semantic: tìm câu hỏi trước đó trong cùng scope có cosine similarity
+      giữa dense embedding >= ngưỡng.
+    Cả hai tầng có TTL và giới hạn số phần tử. Khi phiên bản kho tài liệu của owner
+    thay đổi (ingest/xóa tài liệu), các mục cũ không còn khớp và bị loại bỏ dần.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float) -> None:
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._exact = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        # Tầng semantic: OrderedDict để loại bỏ theo LRU
+        self._semantic: "OrderedDict[Tuple, CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Mỗi lần tra cache bắt đầu bằng tầng exact (exact_hits + exact_misses = số lần tra);
+        # semantic_misses chỉ đếm các lần tầng semantic được tra mà không trúng
+        self.exact_hits = 0
+        self.exact_misses = 0
+        self.semantic_hits = 0
+        self.semantic_misses = 0
+
+    # `version`: phiên bản kho tài liệu của scope (cache.get_corpus_version), do luồng chat đọc một lần mỗi request
+    def _exact_key(self, query: str, scope: Scope, version: Tuple) -> Tuple:
+        return (normalize_query(query), scope, version)
+
+    def get_exact(self, query: str, scope: Scope, version: Tuple) -> CachedAnswer | None:
+        entry = self._exact.get(self._exact_key(query, scope, version))
+        if entry is not None:
+            self.exact_hits += 1
+        else:
+            self.exact_misses += 1
+        return entry
+
+    def get_semantic(self, embedding: np.ndarray, scope: Scope, version: Tuple) -> CachedAnswer | None:
+        query_vector = _normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            candidates: List[Tuple[Tuple, CachedAnswer]] = []
+            for key in list(self._semantic.keys()):
+                entry = self._semantic[key]
+                if entry.scope != scope:
+                    continue
+                if entry.version != version or now - entry.stored_at > self.ttl_seconds:
+                    # Kho tài liệu đã thay đổi hoặc đã hết hạn
+                    del self._semantic[key]
+                    continue
+                candidates.append((key, entry))
+            if candidates:
+                scores = np.stack([entry.embedding for _, entry in candidates]) @ query_vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._semantic.move_to_end(key)
+                    self.semantic_hits += 1
+                    print(f"Answer cache (semantic): khớp với '{entry.query}' (similarity={scores[best]:.3f})")
+                    return entry
+        self.semantic_misses += 1
+        return None
+
+    def set(
+        self, query: str, scope: Scope, version: Tuple, answer: str, sources: List[Any], embedding: np.ndarray | None
+    ) -> None:
+        key = self._exact_key(query, scope, version)
+        entry = CachedAnswer(
+            answer=answer,
+            sources=sources,
+            query=query,
+            scope=scope,
+            version=key[2],
+            embedding=_normalize(embedding) if embedding is not None else None,
+        )
+        self._exact.set(key, entry)
+        if entry.embedding is None:
+            return
+        with self._lock:
+            self._semantic[key] = entry
+            self._semantic.move_to_end(key)
+            while len(self._semantic) > self.max_entries:
+                self._semantic.popitem(last=False)
+
+    def clear(self) -> None:
+        self._exact.clear()
+        with self._lock:
+            self._semantic.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.exact_misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "semantic_misses": self.semantic_misses,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "exact_entries": len(self._exact),
+            "semantic_entries": len(self._semantic),
+            "max_entries": self.max_entries,
+            "similarity_threshold": self.similarity_threshold,
+        }
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+)
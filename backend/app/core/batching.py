@@ -0,0 +1,118 @@
+# backend/app/core/batching.py
+
+import asyncio
+from typing import Any, Callable, Dict, List, Sequence, Set, Tuple
+
+from .executor import run_in_inference_executor
+
+
+class MicroBatcher:
+    """
+    Gom các lời gọi encode/rerank đồng thời từ nhiều request thành một lượt
+    forward duy nhất của model.
+
+    - Mỗi lời gọi `submit(items)` nhận về một Future chứa kết quả cho đúng các item của nó.
+    - Một batch được gửi đi khi đủ `max_batch_size` item hoặc khi item đầu tiên
+      đã chờ `max_wait_ms` mili-giây.
+    - `process_batch` là hàm đồng bộ, chạy trong executor suy luận và phải trả về
+      một sequence có cùng độ dài với danh sách item đầu vào (list, numpy array...).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+    ) -> None:
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: List[Tuple[List[Any], asyncio.Future]] = []
+        self._pending_size = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # Event loop chỉ giữ tham chiếu yếu tới task: giữ task của các batch đang chạy cho đến khi xong
+        self._tasks: Set[asyncio.Task] = set()
+
+        self._batches = 0
+        self._items = 0
+        self._requests = 0
+
+    def submit(self, items: List[Any]) -> asyncio.Future:
+        """
+        Đưa các item vào hàng đợi và trả về Future của kết quả tương ứng.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Event loop mới (ví dụ khi chạy script/benchmark nhiều lần): bỏ trạng thái cũ
+            self._loop = loop
+            self._pending = []
+            self._pending_size = 0
+            self._flush_handle = None
+            self._tasks = set()
+
+        future = loop.create_future()
+        if not items:
+            future.set_result([])
+            return future
+
+        self._pending.append((list(items), future))
+        self._pending_size += len(items)
+        self._requests += 1
+
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        while self._pending:
+            # Lấy các request cho đến khi đủ max_batch_size item.
+            # Một request lớn hơn max_batch_size vẫn được xử lý nguyên vẹn trong batch riêng.
+            batch: List[Tuple[List[Any], asyncio.Future]] = []
+            batch_size = 0
+            while self._pending and (not batch or batch_size + len(self._pending[0][0]) <= self.max_batch_size):
+                items, future = self._pending.pop(0)
+                batch.append((items, future))
+                batch_size += len(items)
+            self._pending_size -= batch_size
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[List[Any], asyncio.Future]]) -> None:
+        flat_items = [item for items, _ in batch for item in items]
+        self._batches += 1
+        self._items += len(flat_items)
+        try:
+            results = await run_in_inference_executor(self.process_batch, flat_items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for items, future in batch:
+            if not future.done():
+                future.set_result(results[offset:offset + len(items)])
+            offset += len(items)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "requests": self._requests,
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+        }
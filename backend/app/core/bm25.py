@@ -0,0 +1,475 @@
+# backend/app/core/bm25.py
+
+import array
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có khóa file giữa các tiến trình
+    fcntl = None
+
+# Chỉ mục BM25 cục bộ, dùng làm nhánh "sparse" của hybrid search khi SPARSE_BACKEND="bm25":
+# không cần model sparse khi ingest lẫn khi truy vấn.
+
+_SEGMENT_SPLIT_PATTERN = re.compile(r"[^\w\s]+")  # dấu câu ngắt cụm từ
+_SYLLABLE_PATTERN = re.compile(r"[^\W_]+")
+
+
+def fold_diacritics(text: str) -> str:
+    """
+    Bỏ dấu tiếng Việt: "đường" -> "duong".
+    """
+    text = text.replace("đ", "d").replace("Đ", "D")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tách text thành các term cho BM25, có tính đến đặc điểm tiếng Việt:
+    - Chuẩn hóa Unicode NFC (text trích từ PDF thường trộn dạng dựng sẵn và tổ hợp) và chữ thường.
+    - Tiếng Việt viết theo âm tiết, từ ghép gồm nhiều âm tiết ("học sinh"): mỗi âm tiết là một term,
+      kèm bigram các âm tiết liền kề trong cùng cụm (không vượt qua dấu câu), ví dụ "học_sinh".
+    - Tùy chọn bỏ dấu (BM25_FOLD_DIACRITICS) để khớp với truy vấn gõ không dấu.
+    """
+    text = unicodedata.normalize("NFC", text).lower()
+    if settings.BM25_FOLD_DIACRITICS:
+        text = fold_diacritics(text)
+    terms: List[str] = []
+    for segment in _SEGMENT_SPLIT_PATTERN.split(text):
+        syllables = _SYLLABLE_PATTERN.findall(segment)
+        terms.extend(syllables)
+        if settings.BM25_USE_BIGRAMS:
+            terms.extend(f"{first}_{second}" for first, second in zip(syllables, syllables[1:]))
+    return terms
+
+
+class Bm25Index:
+    """
+    Chỉ mục ngược BM25 trong bộ nhớ, postings lưu bằng mảng số nguyên:
+    - Mỗi chunk là một entry có số thứ tự; thông tin entry (độ dài, document_id, owner_id,
+      content_hash) nằm trong các array.array song song.
+    - Postings của snapshot là CSR numpy (offsets, docs, tfs), có thể memory-map từ đĩa;
+      postings thêm sau snapshot nằm trong một array.array cho mỗi term.
+    - Ghi đè/xóa chỉ đánh dấu entry chết (tombstone); postings chết được loại khi lưu snapshot.
+    """
+
+    def __init__(self) -> None:
+        self.terms: Dict[str, int] = {}
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+        self._base_docs = np.zeros(0, dtype=np.uint32)
+        self._base_tfs = np.zeros(0, dtype=np.uint16)
+        self._delta_docs: Dict[int, array.array] = {}
+        self._delta_tfs: Dict[int, array.array] = {}
+
+        self.point_ids: List[str] = []
+        self._ordinals: Dict[str, int] = {}
+        self._lengths = array.array("I")
+        self._document_ids = array.array("q")
+        self._owner_ids = array.array("q")
+        self._hash_ids = array.array("I")
+        self._alive = bytearray()
+        self._hashes: List[str] = []
+        self._hash_index: Dict[str, int] = {}
+
+        self.alive_count = 0
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+    def _hash_id(self, content_hash: str | None) -> int:
+        content_hash = content_hash or ""
+        hash_id = self._hash_index.get(content_hash)
+        if hash_id is None:
+            hash_id = self._hash_index[content_hash] = len(self._hashes)
+            self._hashes.append(content_hash)
+        return hash_id
+
+    def _tombstone(self, ordinal: int) -> None:
+        if self._alive[ordinal]:
+            self._alive[ordinal] = 0
+            self.alive_count -= 1
+            self.total_length -= self._lengths[ordinal]
+            self._ordinals.pop(self.point_ids[ordinal], None)
+
+    def upsert(
+        self, point_id: str, document_id: int, owner_id: int, content_hash: str | None, term_counts: Dict[str, int]
+    ) -> None:
+        with self._lock:
+            ordinal = self._ordinals.get(point_id)
+            if ordinal is not None and self._document_ids[ordinal] == document_id and self._owner_ids[ordinal] == owner_id:
+                # Id điểm suy ra từ nội dung chunk: cùng id -> cùng term, chỉ cần cập nhật content_hash
+                self._hash_ids[ordinal] = self._hash_id(content_hash)
+                return
+            if ordinal is not None:
+                self._tombstone(ordinal)
+            ordinal = len(self.point_ids)
+            length = sum(term_counts.values())
+            self.point_ids.append(point_id)
+            self._ordinals[point_id] = ordinal
+            self._lengths.append(length)
+            self._document_ids.append(document_id)
+            self._owner_ids.append(owner_id)
+            self._hash_ids.append(self._hash_id(content_hash))
+            self._alive.append(1)
+            self.alive_count += 1
+            self.total_length += length
+            for term, count in term_counts.items():
+                term_id = self.terms.get(term)
+                if term_id is None:
+                    term_id = self.terms[term] = len(self.terms)
+                if term_id not in self._delta_docs:
+                    self._delta_docs[term_id] = array.array("I")
+                    self._delta_tfs[term_id] = array.array("H")
+                self._delta_docs[term_id].append(ordinal)
+                self._delta_tfs[term_id].append(min(count, 0xFFFF))
+
+    def delete_document(self, document_id: int, keep_content_hash: str | None = None) -> int:
+        """
+        Xóa các entry của tài liệu; nếu có `keep_content_hash` thì giữ lại entry của phiên bản đó.
+        """
+        with self._lock:
+            mask = np.frombuffer(self._alive, dtype=np.bool_) & (
+                np.frombuffer(self._document_ids, dtype=np.int64) == document_id
+            )
+            if keep_content_hash is not None and keep_content_hash in self._hash_index:
+                mask &= np.frombuffer(self._hash_ids, dtype=np.uint32) != self._hash_index[keep_content_hash]
+            ordinals = np.flatnonzero(mask).tolist()
+            for ordinal in ordinals:
+                self._tombstone(ordinal)
+            return len(ordinals)
+
+    def apply(self, operation: Dict[str, Any]) -> None:
+        if operation["op"] == "upsert":
+            self.upsert(
+                operation["id"], operation["document_id"], operation["owner_id"],
+                operation.get("content_hash"), operation["terms"],
+            )
+        elif operation["op"] == "delete":
+            self.delete_document(operation["document_id"], operation.get("keep_content_hash"))
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        if term_id + 1 < len(self._base_offsets):
+            start, end = self._base_offsets[term_id], self._base_offsets[term_id + 1]
+            docs, tfs = self._base_docs[start:end], self._base_tfs[start:end]
+        else:
+            docs, tfs = self._base_docs[:0], self._base_tfs[:0]
+        if term_id in self._delta_docs:
+            docs = np.concatenate([docs, np.frombuffer(self._delta_docs[term_id], dtype=np.uint32)])
+            tfs = np.concatenate([tfs, np.frombuffer(self._delta_tfs[term_id], dtype=np.uint16)])
+        return docs, tfs
+
+    def search(
+        self, terms: Iterable[str], limit: int, owner_id: int | None = None, document_id: int | None = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Trả về tối đa `limit` cặp (point_id, điểm BM25) giảm dần, lọc theo owner_id/document_id.
+        """
+        with self._lock:
+            # Các view numpy trên array.array phải được giải phóng trước khi nhả khóa
+            # (array.array không thể mở rộng khi đang có view)
+            return self._search_locked(set(terms), limit, owner_id, document_id)
+
+    def _search_locked(
+        self, terms: set, limit: int, owner_id: int | None, document_id: int | None
+    ) -> List[Tuple[str, float]]:
+        if not self.alive_count or limit <= 0:
+            return []
+        alive = np.frombuffer(self._alive, dtype=np.bool_)
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+        owner_ids = np.frombuffer(self._owner_ids, dtype=np.int64)
+        document_ids = np.frombuffer(self._document_ids, dtype=np.int64)
+        k1, b = settings.BM25_K1, settings.BM25_B
+        average_length = self.total_length / self.alive_count
+
+        matched_ids: List[np.ndarray] = []
+        matched_scores: List[np.ndarray] = []
+        for term in terms:
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            docs, tfs = self._postings(term_id)
+            live = alive[docs]
+            document_frequency = int(np.count_nonzero(live))
+            if not document_frequency:
+                continue
+            if owner_id is not None:
+                live &= owner_ids[docs] == owner_id
+            if document_id is not None:
+                live &= document_ids[docs] == document_id
+            docs, tfs = docs[live], tfs[live].astype(np.float32)
+            if not len(docs):
+                continue
+            idf = math.log(1 + (self.alive_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = k1 * (1 - b + b * lengths[docs] / average_length)
+            matched_ids.append(docs)
+            matched_scores.append(idf * tfs * (k1 + 1) / (tfs + norm))
+        if not matched_ids:
+            return []
+
+        unique_ids, inverse = np.unique(np.concatenate(matched_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_scores))
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.point_ids[unique_ids[i]], float(scores[i])) for i in top]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            delta_postings = sum(len(docs) for docs in self._delta_docs.values())
+            return {
+                "entries": self.alive_count,
+                "dead_entries": len(self.point_ids) - self.alive_count,
+                "terms": len(self.terms),
+                "postings": int(len(self._base_docs) + delta_postings),
+            }
+
+    def save(self, directory: Path) -> None:
+        """
+        Ghi snapshot đã compact (chỉ các entry còn sống) vào `directory`.
+        """
+        with self._lock:
+            directory.mkdir(parents=True, exist_ok=True)
+            alive = np.frombuffer(self._alive, dtype=np.bool_).copy()
+            new_ordinals = (np.cumsum(alive) - 1).astype(np.uint32)
+            vocabulary: List[str] = []
+            docs_parts: List[np.ndarray] = []
+            tfs_parts: List[np.ndarray] = []
+            for term, term_id in self.terms.items():
+                docs, tfs = self._postings(term_id)
+                keep = alive[docs]
+                if not keep.any():
+                    continue
+                vocabulary.append(term)
+                docs_parts.append(new_ordinals[docs[keep]])
+                tfs_parts.append(tfs[keep])
+            offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(part) for part in docs_parts], dtype=np.int64)
+
+            hash_ids = np.frombuffer(self._hash_ids, dtype=np.uint32)[alive]
+            used_hash_ids, new_hash_ids = np.unique(hash_ids, return_inverse=True)
+            np.save(directory / "offsets.npy", offsets)
+            np.save(directory / "docs.npy", np.concatenate(docs_parts) if docs_parts else np.zeros(0, np.uint32))
+            np.save(directory / "tfs.npy", np.concatenate(tfs_parts) if tfs_parts else np.zeros(0, np.uint16))
+            np.save(directory / "lengths.npy", np.frombuffer(self._lengths, dtype=np.uint32)[alive])
+            np.save(directory / "document_ids.npy", np.frombuffer(self._document_ids, dtype=np.int64)[alive])
+            np.save(directory / "owner_ids.npy", np.frombuffer(self._owner_ids, dtype=np.int64)[alive])
+            np.save(directory / "hash_ids.npy", new_hash_ids.astype(np.uint32))
+            meta = {
+                "vocabulary": vocabulary,
+                "point_ids": [point_id for point_id, is_alive in zip(self.point_ids, alive) if is_alive],
+                "hashes": [self._hashes[i] for i in used_hash_ids.tolist()],
+            }
+            (directory / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, directory: Path) -> "Bm25Index":
+        index = cls()
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        index.terms = {term: term_id for term_id, term in enumerate(meta["vocabulary"])}
+        index._base_offsets = np.load(directory / "offsets.npy")
+        index._base_docs = np.load(directory / "docs.npy", mmap_mode="r")
+        index._base_tfs = np.load(directory / "tfs.npy", mmap_mode="r")
+        index.point_ids = meta["point_ids"]
+        index._ordinals = {point_id: ordinal for ordinal, point_id in enumerate(index.point_ids)}
+        for name, target in (
+            ("lengths", index._lengths), ("document_ids", index._document_ids),
+            ("owner_ids", index._owner_ids), ("hash_ids", index._hash_ids),
+        ):
+            target.frombytes(np.load(directory / f"{name}.npy").tobytes())
+        index._hashes = meta["hashes"]
+        index._hash_index = {content_hash: i for i, content_hash in enumerate(index._hashes)}
+        index._alive = bytearray(b"\x01" * len(index.point_ids))
+        index.alive_count = len(index.point_ids)
+        index.total_length = int(np.frombuffer(index._lengths, dtype=np.uint32).sum())
+        return index
+
+
+class Bm25Store:
+    """
+    Chỉ mục BM25 dùng chung giữa các tiến trình (API, worker ingest) qua thư mục BM25_INDEX_DIR:
+    - snapshot-<gen>/: chỉ mục đã compact, các mảng được memory-map khi đọc.
+    - journal-<gen>.jsonl: các thao tác upsert/xóa ghi thêm sau snapshot đó; worker chỉ append.
+    - CURRENT: số generation hiện tại (ghi nguyên tử bằng os.replace).
+    Trước mỗi lần tìm kiếm, tiến trình đọc chỉ áp dụng phần journal mới (hoặc nạp snapshot mới
+    nếu generation đã đổi). Khi journal vượt BM25_COMPACT_JOURNAL_BYTES, tiến trình ghi gộp
+    snapshot và journal thành generation tiếp theo.
+    """
+
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._index = Bm25Index()
+        self._generation: int | None = None
+        self._offset = 0
+        self._refresh_lock = threading.Lock()
+
+    def _snapshot_path(self, generation: int) -> Path:
+        return self.directory / f"snapshot-{generation}"
+
+    def _journal_path(self, generation: int) -> Path:
+        return self.directory / f"journal-{generation}.jsonl"
+
+    def _current_generation(self) -> int:
+        try:
+            return int((self.directory / "CURRENT").read_text())
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.directory / "lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self) -> Bm25Index:
+        """
+        Đồng bộ chỉ mục trong bộ nhớ với đĩa và trả về nó.
+        """
+        with self._refresh_lock:
+            generation = self._current_generation()
+            if generation != self._generation:
+                snapshot = self._snapshot_path(generation)
+                self._index = Bm25Index.load(snapshot) if snapshot.exists() else Bm25Index()
+                self._generation, self._offset = generation, 0
+            journal = self._journal_path(generation)
+            size = journal.stat().st_size if journal.exists() else 0
+            if size > self._offset:
+                with open(journal, "rb") as f:
+                    f.seek(self._offset)
+                    data = f.read(size - self._offset)
+                # Chỉ áp dụng các dòng đã được ghi trọn vẹn
+                complete = data.rfind(b"\n") + 1
+                for line in data[:complete].splitlines():
+                    if line:
+                        self._index.apply(json.loads(line))
+                self._offset += complete
+            return self._index
+
+    def append(self, operations: List[Dict[str, Any]]) -> None:
+        if not operations:
+            return
+        payload = "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in operations).encode("utf-8")
+        with self._file_lock():
+            journal = self._journal_path(self._current_generation())
+            with open(journal, "ab") as f:
+                self._truncate_partial_line(f)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            if size > settings.BM25_COMPACT_JOURNAL_BYTES:
+                self._compact_locked()
+
+    @staticmethod
+    def _truncate_partial_line(f) -> None:
+        # Một tiến trình bị dừng giữa lúc ghi có thể để lại dòng dở dang ở cuối journal
+        size = f.seek(0, os.SEEK_END)
+        if not size:
+            return
+        with open(f.name, "rb") as reader:
+            reader.seek(max(0, size - 65536))
+            tail = reader.read()
+        if tail.endswith(b"\n"):
+            return
+        cut = tail.rfind(b"\n")
+        f.truncate(size - len(tail) + cut + 1 if cut >= 0 else max(0, size - len(tail)))
+        f.seek(0, os.SEEK_END)
+
+    def compact(self) -> None:
+        with self._file_lock():
+            self._compact_locked()
+
+    def replace(self, index: Bm25Index) -> None:
+        """
+        Thay toàn bộ chỉ mục (dùng khi xây lại từ Qdrant). Thao tác ghi vào journal trong lúc
+        xây lại sẽ bị bỏ qua, nên chỉ chạy khi không có job ingest nào đang chạy.
+        """
+        with self._file_lock():
+            self._publish_locked(index, self._current_generation() + 1)
+
+    def _compact_locked(self) -> None:
+        index = self.refresh()
+        self._publish_locked(index, self._generation + 1)
+
+    def _publish_locked(self, index: Bm25Index, generation: int) -> None:
+        target = self._snapshot_path(generation)
+        staging = self.directory / f".snapshot-{generation}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(target, ignore_errors=True)
+        index.save(staging)
+        os.replace(staging, target)
+        self._journal_path(generation).write_bytes(b"")
+        current_tmp = self.directory / "CURRENT.tmp"
+        current_tmp.write_text(str(generation))
+        os.replace(current_tmp, self.directory / "CURRENT")
+        # Giữ lại generation liền trước cho các tiến trình đang đọc dở
+        shutil.rmtree(self._snapshot_path(generation - 2), ignore_errors=True)
+        self._journal_path(generation - 2).unlink(missing_ok=True)
+        print(f"BM25: đã ghi snapshot generation {generation} ({index.stats()}).")
+
+    def search(
+        self, query: str, limit: int, owner_id: int | None = None, document_id: int | None = None
+    ) -> List[Tuple[str, float]]:
+        return self.refresh().search(tokenize(query), limit, owner_id=owner_id, document_id=document_id)
+
+
+class Bm25IndexWriter:
+    """
+    Gom các thao tác của một job ingest và ghi chúng vào journal khi `flush()`
+    (gọi tại mỗi checkpoint, sau khi Qdrant đã xác nhận các điểm tương ứng).
+    Upsert theo id điểm là idempotent nên chạy lại từ checkpoint không tạo entry trùng.
+    """
+
+    def __init__(self, store: Bm25Store | None = None) -> None:
+        self.store = store or get_bm25_store()
+        self._pending: List[Dict[str, Any]] = []
+        self.operations_written = 0
+
+    def upsert(self, point_id: str, document_id: int, owner_id: int, content_hash: str | None, text: str) -> None:
+        self._pending.append({
+            "op": "upsert", "id": point_id, "document_id": document_id, "owner_id": owner_id,
+            "content_hash": content_hash, "terms": dict(Counter(tokenize(text))),
+        })
+
+    def delete_document(self, document_id: int, keep_content_hash: str | None = None) -> None:
+        self._pending.append({"op": "delete", "document_id": document_id, "keep_content_hash": keep_content_hash})
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        self.store.append(pending)
+        self.operations_written += len(pending)
+
+
+_store: Bm25Store | None = None
+_store_lock = threading.Lock()
+
+
+def get_bm25_store() -> Bm25Store:
+    """
+    Chỉ mục BM25 của tiến trình hiện tại (một instance, đồng bộ với đĩa khi tìm kiếm).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = Bm25Store(settings.BM25_INDEX_DIR)
+        return _store
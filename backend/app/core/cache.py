@@ -0,0 +1,260 @@
+# backend/app/core/cache.py
+
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+from .. import crud
+from ..config import settings
+from ..db.session import get_async_sessionmaker
+
+
+class LRUCache:
+    """
+    Cache LRU trong bộ nhớ, có giới hạn số phần tử và thời gian sống (TTL).
+    An toàn khi dùng từ nhiều luồng (event loop + executor).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float | None = None) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            stored_at, value = item
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# ==============================================================================
+# BACKEND CACHE CHO CÁC STAGE TRUY XUẤT (IN-MEMORY HOẶC REDIS)
+# ==============================================================================
+
+def hash_key(*parts: Any) -> str:
+    """
+    Tạo khóa cache ngắn, ổn định từ các thành phần (text, bộ lọc, phiên bản...).
+    """
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+class InMemoryCacheBackend:
+    """
+    Backend cache trong bộ nhớ của tiến trình (LRU + TTL).
+    Dùng mặc định và làm stand-in cho Redis khi kiểm thử.
+    """
+
+    def __init__(self, namespace: str, max_entries: int, ttl_seconds: float | None) -> None:
+        self.namespace = namespace
+        self._cache = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    async def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any) -> None:
+        self._cache.set(key, value)
+
+    async def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"namespace": self.namespace, "backend": "memory", **self._cache.stats()}
+
+
+_REDIS_IMPORT_HINT = "CACHE_BACKEND='redis' cần cài thêm gói `redis` (poetry install -E redis)."
+
+
+class RedisCacheBackend:
+    """
+    Backend cache dùng Redis, chia sẻ giữa nhiều worker.
+    Giá trị được pickle; giới hạn kích thước do chính sách maxmemory của Redis quản lý.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: float | None) -> None:
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError as e:
+            raise ImportError(_REDIS_IMPORT_HINT) from e
+        self.namespace = namespace
+        self.ttl_seconds = int(ttl_seconds) if ttl_seconds else None
+        self._client = redis_asyncio.from_url(settings.REDIS_URL)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"rag:{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Any:
+        raw = await self._client.get(self._key(key))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(raw)
+
+    async def set(self, key: str, value: Any) -> None:
+        await self._client.set(self._key(key), pickle.dumps(value), ex=self.ttl_seconds)
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(match=self._key("*")):
+            await self._client.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_cache_backend(namespace: str, max_entries: int, ttl_seconds: float | None):
+    """
+    Tạo backend cache theo cấu hình CACHE_BACKEND ("memory" hoặc "redis").
+    """
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCacheBackend(namespace, ttl_seconds)
+    return InMemoryCacheBackend(namespace, max_entries, ttl_seconds)
+
+
+# ==============================================================================
+# PHIÊN BẢN KHO TÀI LIỆU (CORPUS VERSION)
+# ==============================================================================
+# Mỗi owner_id có một số phiên bản, tăng lên mỗi khi tài liệu của owner đó được
+# thêm/xóa vector trong Qdrant. Các cache dùng phiên bản này trong khóa, nên kết quả
+# cũ tự động không còn khớp sau khi kho tài liệu thay đổi.
+# Nếu không biết owner_id (ví dụ chỉ có document_id), tăng "epoch" chung để vô hiệu hóa mọi scope.
+# Khi CACHE_BACKEND="redis", phiên bản được lưu trong Redis để mọi worker/tiến trình
+# (kể cả tiến trình ingest) cùng thấy; mỗi tiến trình chỉ đọc lại sau CORPUS_VERSION_REFRESH_SECONDS.
+# Khi CACHE_BACKEND="memory", bộ đếm chỉ nằm trong tiến trình, trong khi tài liệu được ingest ở tiến trình
+# khác (worker của INGESTION_MODE="queue", scripts/bulk_ingest.py). Vì vậy phiên bản còn gồm một dấu đọc từ
+# bảng documents (số tài liệu, updated_at lớn nhất của owner), cũng được đọc lại sau CORPUS_VERSION_REFRESH_SECONDS:
+# mỗi batch chunk ghi vào Qdrant đều cập nhật tiến độ (updated_at) của tài liệu, upload/xóa đổi số tài liệu.
+
+_corpus_versions: Dict[int, int] = {}
+_corpus_epoch = 0
+_corpus_versions_lock = threading.Lock()
+_redis_version_client = None
+_async_redis_version_client = None
+_redis_version_memo: Dict[Any, Tuple[float, int]] = {}
+_database_version_memo: Dict[int, Tuple[float, Tuple]] = {}
+_EPOCH = "epoch"
+
+
+def _get_redis_version_client():
+    # Client đồng bộ: chỉ dùng để tăng phiên bản (worker, script, luồng executor)
+    global _redis_version_client
+    if _redis_version_client is None:
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(_REDIS_IMPORT_HINT) from e
+        _redis_version_client = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis_version_client
+
+
+def _get_async_redis_version_client():
+    # Client bất đồng bộ: đọc phiên bản trong luồng chat mà không chặn event loop
+    global _async_redis_version_client
+    if _async_redis_version_client is None:
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError as e:
+            raise ImportError(_REDIS_IMPORT_HINT) from e
+        _async_redis_version_client = redis_asyncio.from_url(settings.REDIS_URL)
+    return _async_redis_version_client
+
+
+async def _read_redis_version(name: Any) -> int:
+    now = time.monotonic()
+    memo = _redis_version_memo.get(name)
+    if memo and now - memo[0] < settings.CORPUS_VERSION_REFRESH_SECONDS:
+        return memo[1]
+    raw = await _get_async_redis_version_client().get(f"rag:corpus_version:{name}")
+    value = int(raw) if raw is not None else 0
+    _redis_version_memo[name] = (now, value)
+    return value
+
+
+async def _read_database_version(owner_id: int) -> Tuple:
+    now = time.monotonic()
+    memo = _database_version_memo.get(owner_id)
+    if memo and now - memo[0] < settings.CORPUS_VERSION_REFRESH_SECONDS:
+        return memo[1]
+    try:
+        async with get_async_sessionmaker()() as db:
+            value = await crud.crud_document.aget_corpus_marker(db, owner_id)
+    except Exception as e:
+        # Không kiểm tra được kho tài liệu: trả về giá trị mới mỗi lần để không dùng lại kết quả cache
+        print(f"Lỗi khi đọc phiên bản kho tài liệu từ database (owner_id={owner_id}): {e}")
+        return ("unavailable", now)
+    _database_version_memo[owner_id] = (now, value)
+    return value
+
+
+async def get_corpus_version(owner_id: int) -> Tuple:
+    if settings.CACHE_BACKEND == "redis":
+        return (await _read_redis_version(_EPOCH), await _read_redis_version(owner_id))
+    return (_corpus_epoch, _corpus_versions.get(owner_id, 0), await _read_database_version(owner_id))
+
+
+def bump_corpus_version(owner_id: int | None) -> None:
+    global _corpus_epoch
+    if settings.CACHE_BACKEND == "redis":
+        name = _EPOCH if owner_id is None else owner_id
+        value = _get_redis_version_client().incr(f"rag:corpus_version:{name}")
+        _redis_version_memo[name] = (time.monotonic(), int(value))
+        return
+    with _corpus_versions_lock:
+        if owner_id is None:
+            _corpus_epoch += 1
+        else:
+            _corpus_versions[owner_id] = _corpus_versions.get(owner_id, 0) + 1
@@ -0,0 +1,108 @@
+# backend/app/core/condense.py
+
+import re
+import unicodedata
+from typing import List, Tuple
+
+from ..config import settings
+
+# Các từ/cụm từ cho thấy câu hỏi phụ thuộc vào ngữ cảnh trước đó (đại từ, từ chỉ định,
+# câu hỏi nối tiếp). Nếu câu hỏi không chứa từ nào trong số này thì được coi là độc lập.
+_VI_REFERENCE_PATTERN = re.compile(
+    r"\b(nó|chúng|họ|ông ấy|bà ấy|anh ấy|chị ấy|cái đó|điều đó|việc đó|vấn đề đó|"
+    r"đó|này|kia|ấy|trên|vừa rồi|vừa nãy|như vậy|như thế|thế còn|vậy còn|"
+    r"còn|tiếp|tiếp theo|thêm|nữa|cụ thể hơn|chi tiết hơn|giải thích|tại sao vậy)\b"
+)
+_EN_REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|this|that|these|those|he|she|him|her|his|"
+    r"above|previous|earlier|former|latter|same|more|else|also|again|"
+    r"what about|how about|and then|why)\b"
+)
+# Câu hỏi quá ngắn thường là câu nối tiếp ("Còn năm 2023?", "Why?")
+_MIN_SELF_CONTAINED_WORDS = 4
+
+
+def is_self_contained(query: str) -> bool:
+    """
+    Heuristic: câu hỏi có đủ nghĩa khi đứng một mình hay không.
+    Trả về False (cần rút gọn bằng LLM) khi câu hỏi quá ngắn hoặc chứa đại từ/từ chỉ định
+    có thể trỏ về lịch sử trò chuyện. Heuristic thiên về an toàn: khi nghi ngờ thì vẫn gọi LLM.
+    """
+    normalized = unicodedata.normalize("NFC", query).lower().strip()
+    if len(normalized.split()) < _MIN_SELF_CONTAINED_WORDS:
+        return False
+    if _VI_REFERENCE_PATTERN.search(normalized) or _EN_REFERENCE_PATTERN.search(normalized):
+        return False
+    return True
+
+
+_token_encoder = None
+
+
+def load_token_encoder() -> None:
+    """
+    Tải tokenizer tiktoken (cl100k_base). Lần đầu tiktoken tải file BPE qua mạng, nên hàm này chỉ được
+    gọi lúc khởi động, ngoài event loop. Nếu không tải được (ví dụ triển khai offline), hoặc chưa tải,
+    số token được ước lượng theo số ký tự.
+    """
+    global _token_encoder
+    if _token_encoder is not None:
+        return
+    try:
+        import tiktoken
+        _token_encoder = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Không tải được tokenizer tiktoken, dùng ước lượng ~4 ký tự/token: {e}")
+
+
+def _get_token_encoder():
+    # Không bao giờ tải ở đây: hàm được gọi trong luồng chat (event loop)
+    return _token_encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Đếm (gần đúng) số token của một đoạn text, dùng để giới hạn kích thước prompt.
+    """
+    encoder = _get_token_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def window_history(history: List[Tuple[str, str]], max_tokens: int) -> List[Tuple[str, str]]:
+    """
+    Giữ lại các lượt trò chuyện gần nhất sao cho tổng số token ước lượng không vượt quá `max_tokens`.
+    Lượt gần nhất luôn được giữ; nếu nó quá dài thì câu trả lời của trợ lý bị cắt bớt.
+    """
+    window: List[Tuple[str, str]] = []
+    used = 0
+    for user_msg, bot_msg in reversed(history):
+        cost = estimate_tokens(user_msg) + estimate_tokens(bot_msg)
+        if used + cost > max_tokens:
+            if not window:
+                window.append((user_msg, _truncate_to_tokens(bot_msg, max(0, max_tokens - estimate_tokens(user_msg)))))
+            break
+        window.append((user_msg, bot_msg))
+        used += cost
+    window.reverse()
+    return window
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoder = _get_token_encoder()
+    if encoder is not None:
+        return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def format_history(history: List[Tuple[str, str]]) -> str:
+    return "\n".join([f"Người dùng: {user_msg}\nTrợ lý: {bot_msg}" for user_msg, bot_msg in history])
+
+
+def should_condense(query: str, history: List[Tuple[str, str]]) -> bool:
+    if not history:
+        return False
+    if settings.CONDENSE_SKIP_SELF_CONTAINED and is_self_contained(query):
+        return False
+    return True
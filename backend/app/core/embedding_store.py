@@ -0,0 +1,347 @@
+# backend/app/core/embedding_store.py
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from qdrant_client import models
+
+from ..config import settings
+
+
+class DiskEmbeddingCache:
+    """
+    Cache embedding trên đĩa cho một model, dùng chung giữa các tài liệu, các lần ingest lại
+    và các tiến trình worker trên cùng máy.
+    - Vector được lưu trong một file float32 memory-mapped có `max_entries` slot cố định.
+    - Chỉ mục SQLite ánh xạ sha256(text) -> slot, kèm thời điểm dùng gần nhất để loại bỏ theo LRU
+      khi cache đầy.
+    - Mỗi slot lưu thêm fingerprint của khóa trong một mảng memory-mapped riêng; khi ghi, fingerprint
+      được xóa trước và đặt lại sau khi ghi vector; khi đọc, vector chỉ được dùng nếu fingerprint khớp
+      cả trước và sau khi sao chép (phòng trường hợp slot đang bị tiến trình khác ghi đè).
+    Kích thước vector được xác định ở lần ghi đầu tiên.
+    """
+
+    def __init__(self, directory: str | Path, model_name: str, max_entries: int) -> None:
+        self.model_name = model_name
+        self.max_entries = max_entries
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self._vectors_path = directory / f"{slug}.f32"
+        self._fingerprints_path = directory / f"{slug}.fp"
+        # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khi cấp phát slot)
+        self._index = sqlite3.connect(
+            directory / f"{slug}.sqlite", timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._index.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._index.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._lock = threading.Lock()
+        self._vectors: np.memmap | None = None
+        self._fingerprints: np.memmap | None = None
+        self.dim: int | None = None
+        row = self._index.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        if row:
+            self._open(row[0])
+
+    def _open(self, dim: int) -> None:
+        mode = "r+" if self._vectors_path.exists() else "w+"
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(self.max_entries, dim))
+        mode = "r+" if self._fingerprints_path.exists() else "w+"
+        self._fingerprints = np.memmap(self._fingerprints_path, dtype=np.uint64, mode=mode, shape=(self.max_entries,))
+        self.dim = dim
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _fingerprint(key: str) -> np.uint64:
+        return np.uint64(int(key[:16], 16))
+
+    def get_many(self, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """
+        Trả về {vị trí trong `texts`: vector} cho các text đã có trong cache.
+        """
+        if self._vectors is None or not texts:
+            return {}
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            placeholders = ",".join("?" * len(set(keys)))
+            rows = dict(self._index.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", list(set(keys))
+            ).fetchall())
+            found: Dict[int, np.ndarray] = {}
+            for position, key in enumerate(keys):
+                slot = rows.get(key)
+                if slot is None:
+                    continue
+                fingerprint = self._fingerprint(key)
+                if self._fingerprints[slot] != fingerprint:
+                    continue
+                vector = np.array(self._vectors[slot])
+                # Kiểm tra lại sau khi sao chép: tiến trình khác có thể đã ghi đè slot trong lúc đọc
+                if self._fingerprints[slot] == fingerprint:
+                    found[position] = vector
+            if rows:
+                now = time.time()
+                self._index.execute("BEGIN")
+                self._index.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in rows])
+                self._index.commit()
+        return found
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        if not len(texts):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None:
+                self._index.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (vectors.shape[1],))
+                self._open(self._index.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()[0])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Kích thước vector {vectors.shape[1]} không khớp với cache ({self.dim}).")
+            # BEGIN IMMEDIATE: cấp phát slot độc quyền giữa các tiến trình
+            self._index.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                for text, vector in zip(texts, vectors):
+                    key = self._key(text)
+                    if self._index.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                        continue
+                    slot = self._allocate_slot()
+                    # Xóa fingerprint trước khi ghi vector, đặt lại sau: người đọc không bao giờ thấy
+                    # fingerprint hợp lệ đi kèm một vector đang ghi dở
+                    self._fingerprints[slot] = 0
+                    self._vectors[slot] = vector
+                    self._fingerprints[slot] = self._fingerprint(key)
+                    self._index.execute("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", (key, slot, now))
+                self._vectors.flush()
+                self._fingerprints.flush()
+                self._index.commit()
+            except BaseException:
+                self._index.rollback()
+                raise
+
+    def _allocate_slot(self) -> int:
+        # Slot được cấp liên tiếp từ 0; mục chỉ bị xóa khi slot của nó được dùng lại ngay
+        row = self._index.execute("SELECT MAX(slot) FROM entries").fetchone()
+        next_slot = 0 if row[0] is None else row[0] + 1
+        if next_slot < self.max_entries:
+            return next_slot
+        # Cache đầy: dùng lại slot của mục lâu nhất chưa được dùng
+        key, slot = self._index.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT 1").fetchone()
+        self._index.execute("DELETE FROM entries WHERE key = ?", (key,))
+        return slot
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            count = self._index.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"model": self.model_name, "entries": count, "max_entries": self.max_entries, "dim": self.dim}
+
+
+class DiskSparseCache:
+    """
+    Cache sparse vector (chế độ "native") trên đĩa cho một model. Sparse vector có độ dài thay đổi nên
+    được lưu trực tiếp trong SQLite (indices uint32, values float32 dạng blob), cùng khóa sha256(text)
+    như cache dense; khi vượt `max_entries`, các mục lâu nhất chưa được dùng bị xóa (LRU).
+    """
+
+    def __init__(self, directory: str | Path, model_name: str, max_entries: int) -> None:
+        self.model_name = model_name
+        self.max_entries = max_entries
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self._index = sqlite3.connect(
+            directory / f"{slug}.sparse.sqlite", timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, indices BLOB NOT NULL, vals BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._index.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._lock = threading.Lock()
+
+    def get_many(self, texts: Sequence[str]) -> Dict[int, models.SparseVector]:
+        """
+        Trả về {vị trí trong `texts`: sparse vector} cho các text đã có trong cache.
+        """
+        if not texts:
+            return {}
+        keys = [DiskEmbeddingCache._key(text) for text in texts]
+        with self._lock:
+            placeholders = ",".join("?" * len(set(keys)))
+            rows = {
+                key: (indices, values) for key, indices, values in self._index.execute(
+                    f"SELECT key, indices, vals FROM entries WHERE key IN ({placeholders})", list(set(keys))
+                ).fetchall()
+            }
+            if rows:
+                now = time.time()
+                self._index.execute("BEGIN")
+                self._index.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in rows])
+                self._index.commit()
+        found: Dict[int, models.SparseVector] = {}
+        for position, key in enumerate(keys):
+            if key in rows:
+                indices, values = rows[key]
+                found[position] = models.SparseVector(
+                    indices=np.frombuffer(indices, dtype=np.uint32).tolist(),
+                    values=np.frombuffer(values, dtype=np.float32).tolist(),
+                )
+        return found
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[models.SparseVector]) -> None:
+        if not len(texts):
+            return
+        now = time.time()
+        rows = [
+            (
+                DiskEmbeddingCache._key(text),
+                np.asarray(vector.indices, dtype=np.uint32).tobytes(),
+                np.asarray(vector.values, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._index.execute("BEGIN IMMEDIATE")
+            try:
+                self._index.executemany("INSERT OR IGNORE INTO entries (key, indices, vals, last_used) VALUES (?, ?, ?, ?)", rows)
+                excess = self._index.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    self._index.execute(
+                        "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used LIMIT ?)", (excess,)
+                    )
+                self._index.commit()
+            except BaseException:
+                self._index.rollback()
+                raise
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            count = self._index.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"model": self.model_name, "entries": count, "max_entries": self.max_entries}
+
+
+_caches: Dict[str, DiskEmbeddingCache] = {}
+_sparse_caches: Dict[str, DiskSparseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str) -> DiskEmbeddingCache | None:
+    """
+    Cache embedding trên đĩa cho `model_name` (một instance cho mỗi tiến trình), hoặc None nếu tắt.
+    """
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = DiskEmbeddingCache(
+                settings.EMBEDDING_CACHE_DIR, model_name, settings.EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        return _caches[model_name]
+
+
+def get_sparse_cache(model_name: str) -> DiskSparseCache | None:
+    """
+    Cache sparse vector trên đĩa cho `model_name` (một instance cho mỗi tiến trình), hoặc None nếu tắt.
+    """
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        if model_name not in _sparse_caches:
+            _sparse_caches[model_name] = DiskSparseCache(
+                settings.EMBEDDING_CACHE_DIR, model_name, settings.EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        return _sparse_caches[model_name]
+
+
+class EmbeddingCacheStats:
+    """
+    Thống kê số lần trúng/trượt cache embedding trong một job ingest.
+    """
+
+    def __init__(self) -> None:
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def record(self, model_name: str, hits: int, misses: int) -> None:
+        self.hits[model_name] = self.hits.get(model_name, 0) + hits
+        self.misses[model_name] = self.misses.get(model_name, 0) + misses
+
+    @property
+    def lookups(self) -> int:
+        """
+        Tổng số text đã tra cache (trúng + trượt) trong job.
+        """
+        return sum(self.hits.values()) + sum(self.misses.values())
+
+    def report(self) -> str:
+        parts = []
+        for model_name in self.hits:
+            hits, misses = self.hits[model_name], self.misses[model_name]
+            total = hits + misses
+            parts.append(f"{model_name}: {hits}/{total} trúng ({hits / total:.0%})" if total else f"{model_name}: 0/0")
+        return "; ".join(parts)
+
+
+def encode_with_cache(
+    encode: Callable[[List[str]], np.ndarray],
+    model_name: str,
+    texts: List[str],
+    stats: EmbeddingCacheStats | None = None,
+) -> np.ndarray:
+    """
+    Encode `texts`, chỉ gọi model cho các text chưa có trong cache trên đĩa.
+    """
+    cache = get_embedding_cache(model_name)
+    if cache is None:
+        return np.asarray(encode(texts))
+    found = cache.get_many(texts)
+    missing = [i for i in range(len(texts)) if i not in found]
+    if stats is not None:
+        stats.record(model_name, len(found), len(missing))
+    if missing:
+        # Mỗi text chưa có chỉ được encode một lần, kể cả khi lặp lại trong batch
+        unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+        encoded = np.asarray(encode(unique_texts), dtype=np.float32)
+        cache.put_many(unique_texts, encoded)
+        by_text = dict(zip(unique_texts, encoded))
+        found.update((i, by_text[texts[i]]) for i in missing)
+    return np.stack([found[i] for i in range(len(texts))])
+
+
+def encode_sparse_with_cache(
+    encode: Callable[[List[str]], List[models.SparseVector]],
+    model_name: str,
+    texts: List[str],
+    stats: EmbeddingCacheStats | None = None,
+) -> List[models.SparseVector]:
+    """
+    Như `encode_with_cache`, cho sparse vector dạng (indices, values).
+    """
+    cache = get_sparse_cache(model_name)
+    if cache is None:
+        return encode(texts)
+    found = cache.get_many(texts)
+    missing = [i for i in range(len(texts)) if i not in found]
+    if stats is not None:
+        stats.record(model_name, len(found), len(missing))
+    if missing:
+        unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+        encoded = encode(unique_texts)
+        cache.put_many(unique_texts, encoded)
+        by_text = dict(zip(unique_texts, encoded))
+        found.update((i, by_text[texts[i]]) for i in missing)
+    return [found[i] for i in range(len(texts))]
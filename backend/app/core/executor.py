@@ -0,0 +1,40 @@
+# backend/app/core/executor.py
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from ..config import settings
+
+# Executor có giới hạn số luồng cho các tác vụ nặng về CPU (encode, rerank).
+# Dùng riêng thay vì threadpool mặc định của event loop để một loạt request chat
+# không chiếm hết luồng mà FastAPI cần cho các endpoint đồng bộ.
+_inference_executor: ThreadPoolExecutor | None = None
+
+
+def get_inference_executor() -> ThreadPoolExecutor:
+    global _inference_executor
+    if _inference_executor is None:
+        _inference_executor = ThreadPoolExecutor(
+            max_workers=settings.INFERENCE_MAX_WORKERS,
+            thread_name_prefix="inference",
+        )
+    return _inference_executor
+
+
+async def run_in_inference_executor(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Chạy một hàm đồng bộ (blocking) trong executor suy luận mà không chặn event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_inference_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def shutdown_inference_executor() -> None:
+    global _inference_executor
+    if _inference_executor is not None:
+        _inference_executor.shutdown(wait=False, cancel_futures=True)
+        _inference_executor = None
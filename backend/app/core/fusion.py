@@ -0,0 +1,67 @@
+# backend/app/core/fusion.py
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+from ..config import settings
+
+# Gộp các danh sách kết quả (dense, sparse/BM25) thành một thứ hạng chung trước khi rerank,
+# để chỉ một số ứng viên tốt nhất (RERANK_CANDIDATES_PER_RESULT * top_k) được đưa vào cross-encoder.
+# Mỗi phần tử cần có `.id` và `.score` (ScoredPoint của Qdrant); danh sách đã sắp xếp giảm dần.
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[Sequence[Any]], k: int = 60) -> List[Tuple[Any, float]]:
+    """
+    RRF: điểm = tổng 1 / (k + hạng) qua các danh sách. Chỉ dùng thứ hạng nên không cần
+    chuẩn hóa thang điểm giữa dense (cosine) và sparse/BM25.
+    """
+    scores: Dict[str, float] = {}
+    points: Dict[str, Any] = {}
+    for results in result_lists:
+        for rank, point in enumerate(results, start=1):
+            point_id = str(point.id)
+            scores[point_id] = scores.get(point_id, 0.0) + 1.0 / (k + rank)
+            points.setdefault(point_id, point)
+    return sorted(((points[pid], score) for pid, score in scores.items()), key=lambda item: item[1], reverse=True)
+
+
+def weighted_score_fusion(result_lists: Sequence[Sequence[Any]], weights: Sequence[float]) -> List[Tuple[Any, float]]:
+    """
+    Tổng có trọng số của điểm đã chuẩn hóa min-max trong từng danh sách (thiếu trong danh sách nào thì tính 0).
+    """
+    scores: Dict[str, float] = {}
+    points: Dict[str, Any] = {}
+    for results, weight in zip(result_lists, weights):
+        if not results:
+            continue
+        raw_scores = [point.score for point in results]
+        low, high = min(raw_scores), max(raw_scores)
+        for point, raw_score in zip(results, raw_scores):
+            point_id = str(point.id)
+            normalized = (raw_score - low) / (high - low) if high > low else 1.0
+            scores[point_id] = scores.get(point_id, 0.0) + weight * normalized
+            points.setdefault(point_id, point)
+    return sorted(((points[pid], score) for pid, score in scores.items()), key=lambda item: item[1], reverse=True)
+
+
+def fuse_candidates(result_lists: Sequence[Sequence[Any]], budget: int, mode: str | None = None) -> List[Any]:
+    """
+    Gộp kết quả theo FUSION_MODE và giữ tối đa `budget` ứng viên (budget <= 0: giữ tất cả).
+    - "rrf": reciprocal rank fusion (mặc định).
+    - "weighted": trọng số FUSION_DENSE_WEIGHT cho danh sách đầu (dense), phần còn lại chia đều cho các danh sách khác.
+    - "none": hợp các danh sách theo id như trước đây, không cắt bớt.
+    """
+    mode = mode or settings.FUSION_MODE
+    if mode == "none":
+        union: Dict[str, Any] = {}
+        for results in result_lists:
+            for point in results:
+                union[str(point.id)] = point
+        return list(union.values())
+    if mode == "weighted":
+        others = max(1, len(result_lists) - 1)
+        weights = [settings.FUSION_DENSE_WEIGHT] + [(1 - settings.FUSION_DENSE_WEIGHT) / others] * others
+        fused = weighted_score_fusion(result_lists, weights)
+    else:
+        fused = reciprocal_rank_fusion(result_lists, k=settings.RRF_K)
+    candidates = [point for point, _ in fused]
+    return candidates[:budget] if budget > 0 else candidates
@@ -1,44 +1,50 @@
 # backend/app/core/ingestion.py
 
+import hashlib
+import os
+import queue
+import tempfile
+import threading
 import uuid
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Tuple, TypeVar
 import numpy as np
 from sqlalchemy.orm import Session
-from qdrant_client import QdrantClient, models
-from sentence_transformers import SentenceTransformer
+from qdrant_client import models
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from unstructured.partition.pdf import partition_pdf
 
 from .. import crud, models as db_models
 from ..config import settings
 from ..db.session import SessionLocal
+from .registry import (
+    get_dense_embedding_model,
+    get_sparse_embedding_model,
+    get_qdrant_client,
+    get_pdf_partitioner,
+)
+from .cache import bump_corpus_version
+from .embedding_store import EmbeddingCacheStats, encode_sparse_with_cache, encode_with_cache
+from .model_backends import embedding_model_key
+from .qdrant_writer import QdrantBatchWriter
+from .qdrant_collection import CollectionLayout, apply_layout, create_collection
+from .sparse import encode_sparse, sparse_model_key, uses_sparse_model
+from .bm25 import Bm25IndexWriter
 
-# --- KHỞI TẠO CÁC THÀNH PHẦN MỘT LẦN ---
-try:
-    print("Đang tải Dense Embedding Model (Semantic Search)...")
-    dense_embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
-    print("Tải Dense Embedding Model thành công.")
-    
-    print("Đang tải Sparse Embedding Model (Keyword Search)...")
-    sparse_embedding_model = SentenceTransformer(settings.SPARSE_VECTOR_MODEL_NAME)
-    print("Tải Sparse Embedding Model thành công.")
-    
-    print("Đang kết nối tới Qdrant...")
-    qdrant_client = QdrantClient(url=settings.QDRANT_URL)
-    print("Kết nối Qdrant thành công.")
+T = TypeVar("T")
 
-except Exception as e:
-    print(f"Lỗi nghiêm trọng khi khởi tạo các thành phần Ingestion: {e}")
-    dense_embedding_model = None
-    sparse_embedding_model = None
-    qdrant_client = None
+# Các model và client dùng chung với rag.py thông qua registry (app/core/registry.py).
+# partition_pdf (unstructured) chỉ được import khi tiến trình thực sự xử lý tài liệu.
 
 def ensure_qdrant_collection_exists():
     """
     Đảm bảo collection trong Qdrant tồn tại.
-    Nếu chưa có, tạo mới. Nếu đã có, không làm gì cả.
+    Nếu chưa có, tạo mới theo layout trong Settings. Nếu đã có, chỉ cảnh báo khi layout khác cấu hình.
     """
+    qdrant_client = get_qdrant_client()
     if not qdrant_client:
         raise ConnectionError("Qdrant client chưa được khởi tạo.")
+    layout = CollectionLayout.from_settings()
     
     try:
         # Thử lấy thông tin của collection. Nếu thành công, nghĩa là nó đã tồn tại.
@@ -48,108 +54,391 @@ def ensure_qdrant_collection_exists():
         # Nếu có lỗi (thường là lỗi 404 Not Found), nghĩa là collection chưa tồn tại.
         print(f"Collection '{settings.QDRANT_COLLECTION_NAME}' không tồn tại. Đang tạo mới...")
         
+        dense_embedding_model = get_dense_embedding_model()
         if not dense_embedding_model:
             raise ValueError("Dense embedding model chưa được khởi tạo.")
             
         # Chỉ tạo collection khi nó chưa có
-        qdrant_client.create_collection(
-            collection_name=settings.QDRANT_COLLECTION_NAME,
-            vectors_config={
-                "dense": models.VectorParams(
-                    size=dense_embedding_model.get_sentence_embedding_dimension(),
-                    distance=models.Distance.COSINE
-                )
-            },
-            sparse_vectors_config={
-                "text": models.SparseVectorParams(
-                    index=models.SparseIndexParams(on_disk=False)
-                )
-            }
+        create_collection(
+            qdrant_client, settings.QDRANT_COLLECTION_NAME,
+            dense_embedding_model.get_sentence_embedding_dimension(), layout,
         )
         print("Tạo collection mới thành công.")
+        return
+
+    pending = apply_layout(qdrant_client, settings.QDRANT_COLLECTION_NAME, layout, dry_run=True)
+    if pending:
+        print(
+            f"Cảnh báo: layout collection khác cấu hình ({'; '.join(pending)}). "
+            "Chạy scripts/migrate_qdrant_collection.py để áp dụng."
+        )
         
-def process_document_and_embed(document_id: int):
+class EmptyDocumentError(ValueError):
+    """Tài liệu không có nội dung để chia chunk; thử lại cũng không có ích."""
+
+# Các lỗi không nên thử lại (dữ liệu đầu vào hỏng, file đã bị xóa...)
+NON_RETRYABLE_ERRORS = (EmptyDocumentError, FileNotFoundError)
+
+# Namespace cố định để sinh id điểm (uuid5) ổn định: upsert lại cùng một chunk sẽ ghi đè thay vì nhân bản
+POINT_ID_NAMESPACE = uuid.UUID("5d7c1f0e-8f3a-4d8e-9a57-3f1c2b6e4a90")
+
+def file_sha256(filepath: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_point_id(document_id: int, chunk: str) -> str:
     """
-    Tác vụ nền chính: đọc, chunk, tạo dense & sparse vectors và lưu vào Qdrant.
+    Id điểm Qdrant suy ra từ nội dung chunk: cùng tài liệu + cùng nội dung -> cùng id.
+    Nhờ vậy khi ingest lại một phiên bản mới, chỉ các chunk mới cần embed.
     """
-    db = SessionLocal()
+    chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{document_id}:{chunk_hash}"))
+
+@dataclass
+class PageBatch:
+    first_page: int  # chỉ số trang bắt đầu (0-based)
+    end_page: int  # chỉ số trang kết thúc (không bao gồm)
+    text: str
+
+def get_page_count(filepath: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(filepath) as source:
+        return source.page_count
+
+def parse_page_range(filepath: str, first_page: int, end_page: int) -> str:
+    """
+    Trích xuất nội dung các trang [first_page, end_page): tách các trang đó ra một file PDF tạm
+    bằng PyMuPDF rồi chạy partition_pdf (unstructured) trên file đó.
+    """
+    import pymupdf
+
+    partition_pdf = get_pdf_partitioner()
+    if not partition_pdf:
+        raise ValueError("Lỗi: partition_pdf chưa được khởi tạo.")
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp_path = tmp.name
     try:
-        print(f"BACKGROUND TASK: Bắt đầu xử lý document ID: {document_id}")
-        
-        if not all([dense_embedding_model, sparse_embedding_model, qdrant_client]):
-            raise ValueError("Lỗi: Một trong các thành phần (dense, sparse, qdrant) chưa được khởi tạo.")
+        with pymupdf.open(filepath) as source, pymupdf.open() as part:
+            part.insert_pdf(source, from_page=first_page, to_page=end_page - 1)
+            part.save(tmp_path)
+        elements = partition_pdf(filename=tmp_path, infer_table_structure=True)
+        return "\n\n".join([str(el) for el in elements])
+    finally:
+        os.remove(tmp_path)
 
-        db_document = crud.crud_document.get_document(db, document_id=document_id)
-        if not db_document:
-            print(f"Lỗi: Không tìm thấy document với ID {document_id}")
-            return
-            
-        crud.crud_document.update_document_status(db, document_id=document_id, status=db_models.DocumentStatus.PROCESSING)
+def iter_page_batches(filepath: str, start_page: int = 0, pages_per_batch: int = 10) -> Iterator[PageBatch]:
+    """
+    Đọc PDF theo từng nhóm `pages_per_batch` trang.
+    Bộ nhớ chỉ phụ thuộc vào kích thước một nhóm trang, không phụ thuộc độ dài tài liệu.
+    """
+    page_count = get_page_count(filepath)
+    for first_page in range(start_page, page_count, pages_per_batch):
+        end_page = min(first_page + pages_per_batch, page_count)
+        yield PageBatch(first_page, end_page, parse_page_range(filepath, first_page, end_page))
+
+def prefetch(iterator: Iterable[T], max_buffered: int) -> Iterator[T]:
+    """
+    Chạy `iterator` trong một luồng nền, giữ tối đa `max_buffered` phần tử chờ tiêu thụ.
+    Khi bộ đệm đầy, luồng nền bị chặn (backpressure), nên bước đọc PDF chạy song song
+    với bước embed/upsert mà không tích lũy dữ liệu.
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize=max(1, max_buffered))
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterator:
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(done)
+        except BaseException as e:
+            buffer.put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def split_into_chunks(text: str) -> List[str]:
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=100, length_function=len,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    return text_splitter.split_text(text)
+
+def parse_and_split_page_range(filepath: str, first_page: int, end_page: int) -> List[str]:
+    """
+    Đọc và chia chunk các trang [first_page, end_page). Dùng làm tác vụ cho process pool khi ingest hàng loạt.
+    """
+    return split_into_chunks(parse_page_range(filepath, first_page, end_page))
+
+def encode_chunks(
+    chunks: List[str], cache_stats: EmbeddingCacheStats | None = None
+) -> Tuple[np.ndarray, List[models.SparseVector | None]]:
+    """
+    Tạo dense & sparse vectors cho một batch chunk (dùng cache embedding trên đĩa nếu có).
+    Ở chế độ sparse "native", sparse vector (indices, values) được cache riêng theo độ dài thay đổi;
+    ở chế độ "legacy" model trả về hàng rộng bằng cả vocabulary, quá lớn để cache, nên luôn được encode
+    trực tiếp (chỉ cho các chunk mới, vốn đã được lọc theo content hash).
+    Với SPARSE_BACKEND="bm25" không tạo sparse vector (phần tử là None).
+    """
+    batch_size = settings.EMBEDDING_ENCODE_BATCH_SIZE
+    dense_embeddings = encode_with_cache(
+        partial(get_dense_embedding_model().encode, batch_size=batch_size),
+        embedding_model_key(settings.EMBEDDING_MODEL_NAME), chunks, cache_stats,
+    )
+    if not uses_sparse_model():
+        sparse_vectors = [None] * len(chunks)
+    else:
+        encode = partial(encode_sparse, get_sparse_embedding_model(), batch_size=batch_size)
+        if settings.SPARSE_ENCODING_MODE == "native":
+            sparse_vectors = encode_sparse_with_cache(encode, sparse_model_key(), chunks, cache_stats)
+        else:
+            sparse_vectors = encode(chunks)
+    return dense_embeddings, sparse_vectors
 
-        print(f"Đang phân tích và trích xuất nội dung từ {db_document.filepath} bằng unstructured...")
-        elements = partition_pdf(filename=db_document.filepath, infer_table_structure=True)
-        full_text = "\n\n".join([str(el) for el in elements])
+def build_point(
+    db_document: db_models.Document, point_id: str, chunk: str,
+    dense_embedding: np.ndarray, sparse_vector: models.SparseVector | None
+) -> models.PointStruct:
+    vector = {"dense": dense_embedding.tolist()}
+    if sparse_vector is not None:
+        vector["text"] = sparse_vector
+    payload = {
+        "document_id": db_document.id,
+        "owner_id": db_document.owner_id,
+        "content_hash": db_document.content_hash,
+    }
+    if settings.CHUNK_STORE == "payload":
+        payload.update({"filename": db_document.filename, "text": chunk})
+    return models.PointStruct(id=point_id, vector=vector, payload=payload)
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=100, length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
+def store_chunks(db: Session, db_document: db_models.Document, chunks: List[str]) -> None:
+    """
+    Ghi text của mọi chunk trong batch vào kho chunk (CHUNK_STORE="postgres") trước khi điểm được
+    upsert vào Qdrant, để mọi điểm tìm thấy đều có text. Idempotent như index_chunks_bm25.
+    """
+    if settings.CHUNK_STORE != "postgres":
+        return
+    crud.crud_chunk.upsert_chunks(
+        db, db_document.id, db_document.content_hash,
+        {chunk_point_id(db_document.id, chunk): chunk for chunk in chunks},
+    )
+
+def select_new_chunks(db_document: db_models.Document, chunks: List[str]) -> Dict[str, str]:
+    """
+    So khớp một batch chunk với Qdrant: chunk đã có (cùng id nội dung) chỉ được gắn
+    content_hash của phiên bản hiện tại. Trả về {point_id: chunk} cho các chunk mới cần embed.
+    """
+    qdrant_client = get_qdrant_client()
+    # Loại các chunk trùng nội dung trong cùng batch (cùng id)
+    by_id = {chunk_point_id(db_document.id, chunk): chunk for chunk in chunks}
+    existing = qdrant_client.retrieve(
+        collection_name=settings.QDRANT_COLLECTION_NAME,
+        ids=list(by_id), with_payload=["content_hash"], with_vectors=False,
+    )
+    outdated_ids = [
+        point.id for point in existing
+        if (point.payload or {}).get("content_hash") != db_document.content_hash
+    ]
+    if outdated_ids:
+        qdrant_client.set_payload(
+            collection_name=settings.QDRANT_COLLECTION_NAME,
+            payload={"content_hash": db_document.content_hash},
+            points=outdated_ids,
+            wait=True,
         )
-        chunks = text_splitter.split_text(full_text)
+    existing_ids = {str(point.id) for point in existing}
+    return {point_id: chunk for point_id, chunk in by_id.items() if point_id not in existing_ids}
 
-        if not chunks:
-            print(f"Cảnh báo: Tài liệu {db_document.filename} không có nội dung hoặc không thể chia chunks.")
-            crud.crud_document.update_document_status(db, document_id=document_id, status=db_models.DocumentStatus.FAILED, reason="No content to process")
-            return
-            
-        print(f"Tài liệu được chia thành {len(chunks)} chunks.")
+def index_chunks_bm25(db_document: db_models.Document, chunks: List[str], bm25_writer: Bm25IndexWriter) -> None:
+    """
+    Đưa mọi chunk của batch (kể cả chunk đã có trong Qdrant) vào chỉ mục BM25. Tách term rẻ và upsert
+    theo id điểm là idempotent, nên chạy lại từ checkpoint vẫn không bỏ sót chunk nào.
+    """
+    for chunk in dict.fromkeys(chunks):
+        bm25_writer.upsert(
+            chunk_point_id(db_document.id, chunk), db_document.id, db_document.owner_id, db_document.content_hash, chunk
+        )
 
-        print("Đang tạo dense vectors (embeddings)...")
-        dense_embeddings = dense_embedding_model.encode(chunks, show_progress_bar=True)
-        
-        print("Đang tạo sparse vectors...")
-        sparse_embeddings_raw = sparse_embedding_model.encode(chunks, show_progress_bar=True)
-
-        print("Đang chuẩn bị và lưu các vectors vào Qdrant...")
-        points_to_upsert = []
-        for i, (dense_embedding, sparse_embedding_raw) in enumerate(zip(dense_embeddings, sparse_embeddings_raw)):
-            # Tìm các chỉ số của các phần tử khác không trong sparse vector
-            indices = np.where(sparse_embedding_raw > 0)[0].tolist()
-            # Lấy các giá trị tương ứng với các chỉ số đó
-            values = sparse_embedding_raw[indices].tolist()
-
-            points_to_upsert.append(
-                models.PointStruct(
-                    id=str(uuid.uuid4()),
-                    vector={
-                        "dense": dense_embedding.tolist(),
-                        "text": models.SparseVector(
-                            indices=indices,
-                            values=values
-                        )
-                    },
-                    payload={
-                        "document_id": document_id,
-                        "filename": db_document.filename,
-                        "text": chunks[i],
-                        "owner_id": db_document.owner_id
-                    }
-                )
+def _sync_chunk_batch(
+    db: Session, db_document: db_models.Document, chunks: List[str], cache_stats: EmbeddingCacheStats,
+    writer: QdrantBatchWriter, bm25_writer: Bm25IndexWriter | None = None,
+) -> int:
+    """
+    Embed các chunk mới trong batch và đưa vào writer. Trả về số chunk đã embed.
+    """
+    store_chunks(db, db_document, chunks)
+    if bm25_writer is not None:
+        index_chunks_bm25(db_document, chunks, bm25_writer)
+    new_chunks = select_new_chunks(db_document, chunks)
+    if not new_chunks:
+        return 0
+    dense_embeddings, sparse_vectors = encode_chunks(list(new_chunks.values()), cache_stats)
+    writer.add([
+        build_point(db_document, point_id, chunk, dense_embedding, sparse_vector)
+        for (point_id, chunk), dense_embedding, sparse_vector
+        in zip(new_chunks.items(), dense_embeddings, sparse_vectors)
+    ])
+    return len(new_chunks)
+
+def delete_stale_chunks(db: Session, db_document: db_models.Document) -> None:
+    """
+    Xóa các chunk của tài liệu không thuộc phiên bản nội dung hiện tại (đã biến mất khỏi file mới).
+    """
+    get_qdrant_client().delete(
+        collection_name=settings.QDRANT_COLLECTION_NAME,
+        points_selector=models.FilterSelector(
+            filter=models.Filter(
+                must=[models.FieldCondition(key="document_id", match=models.MatchValue(value=db_document.id))],
+                must_not=[models.FieldCondition(key="content_hash", match=models.MatchValue(value=db_document.content_hash))],
             )
+        ),
+        wait=True,
+    )
+    # Xóa khỏi kho chunk sau Qdrant: điểm còn tìm thấy được thì vẫn còn text
+    if settings.CHUNK_STORE == "postgres":
+        crud.crud_chunk.delete_stale_chunks(db, db_document.id, db_document.content_hash)
+
+def ingest_document(db: Session, db_document: db_models.Document) -> int:
+    """
+    Pipeline ingest dạng streaming: nhóm trang -> chunk -> embed -> upsert, từng batch có kích thước giới hạn.
+    - Sau mỗi nhóm trang, mọi chunk của nhóm đó đã nằm trong Qdrant (tìm kiếm được ngay)
+      và `pages_processed` được lưu làm checkpoint; lần thử lại tiếp tục từ checkpoint.
+    - Id điểm suy ra từ nội dung chunk: khi ingest lại một phiên bản đã sửa, chunk không đổi được
+      giữ nguyên (không embed lại), chunk mới được thêm, và cuối cùng các chunk không còn trong
+      phiên bản mới bị xóa.
+    Trả về số chunk đã embed trong lần chạy này.
+    """
+    document_id = db_document.id
+    sparse_ready = get_sparse_embedding_model() if uses_sparse_model() else True
+    if not all([get_dense_embedding_model(), sparse_ready, get_qdrant_client(), get_pdf_partitioner()]):
+        raise ValueError("Lỗi: Một trong các thành phần (dense, sparse, qdrant, partitioner) chưa được khởi tạo.")
+
+    if not db_document.content_hash:
+        # Tài liệu tạo trước khi có content_hash
+        db_document.content_hash = file_sha256(db_document.filepath)
+        crud.crud_document.update_document_content_hash(db, document_id, db_document.content_hash)
 
-        if points_to_upsert:
-            qdrant_client.upsert(
-                collection_name=settings.QDRANT_COLLECTION_NAME,
-                points=points_to_upsert,
-                wait=True
+    page_count = get_page_count(db_document.filepath)
+    start_page = min(db_document.pages_processed or 0, page_count)
+    if start_page:
+        print(f"Tiếp tục xử lý {db_document.filename} từ trang {start_page + 1}/{page_count}.")
+    crud.crud_document.update_document_progress(
+        db, document_id, int(start_page / page_count * 100) if page_count else 0, page_count=page_count
+    )
+
+    batch_size = settings.INGESTION_EMBED_BATCH_SIZE
+    total_chunks = 0
+    embedded_chunks = 0
+    cache_stats = EmbeddingCacheStats()
+    bm25_writer = None if uses_sparse_model() else Bm25IndexWriter()
+    page_batches = prefetch(
+        iter_page_batches(db_document.filepath, start_page, settings.INGESTION_PAGES_PER_BATCH),
+        settings.INGESTION_PARSE_PREFETCH,
+    )
+    with QdrantBatchWriter(get_qdrant_client()) as writer:
+        for page_batch in page_batches:
+            chunks = split_into_chunks(page_batch.text)
+            batch_embedded = 0
+            for offset in range(0, len(chunks), batch_size):
+                batch_embedded += _sync_chunk_batch(
+                    db, db_document, chunks[offset:offset + batch_size], cache_stats, writer, bm25_writer
+                )
+            # Checkpoint chỉ tiến lên khi Qdrant (và chỉ mục BM25) đã ghi nhận mọi điểm của nhóm trang
+            writer.flush()
+            if bm25_writer is not None:
+                bm25_writer.flush()
+            if batch_embedded:
+                # Kho tài liệu của owner đã thay đổi: vô hiệu hóa các câu trả lời đã cache
+                bump_corpus_version(db_document.owner_id)
+            total_chunks += len(chunks)
+            embedded_chunks += batch_embedded
+            crud.crud_document.update_document_progress(
+                db, document_id, min(99, int(page_batch.end_page / page_count * 100)),
+                pages_processed=page_batch.end_page,
             )
-            print(f"Lưu thành công {len(points_to_upsert)} vector vào Qdrant.")
-        
-        crud.crud_document.update_document_status(db, document_id=document_id, status=db_models.DocumentStatus.COMPLETED)
-        print(f"BACKGROUND TASK: Hoàn tất xử lý document ID: {document_id}")
+            print(f"Đã xử lý trang {page_batch.end_page}/{page_count} ({len(chunks)} chunks, {batch_embedded} chunk mới).")
+    print(f"Qdrant upsert: {writer.report()}")
 
+    if total_chunks == 0 and start_page == 0:
+        print(f"Cảnh báo: Tài liệu {db_document.filename} không có nội dung hoặc không thể chia chunks.")
+        raise EmptyDocumentError("No content to process")
+
+    delete_stale_chunks(db, db_document)
+    if bm25_writer is not None:
+        bm25_writer.delete_document(document_id, keep_content_hash=db_document.content_hash)
+        bm25_writer.flush()
+    bump_corpus_version(db_document.owner_id)
+    print(f"Hoàn tất: {total_chunks} chunks, {embedded_chunks} chunk được embed mới, {total_chunks - embedded_chunks} chunk dùng lại.")
+    if cache_stats.lookups:
+        print(f"Cache embedding: {cache_stats.report()}")
+    return embedded_chunks
+
+def run_ingestion_job(document_id: int, worker_id: str, retry: bool = True) -> bool:
+    """
+    Xử lý một tài liệu đã được `worker_id` nhận (trạng thái PROCESSING) và ghi nhận kết quả:
+    COMPLETED nếu thành công; nếu lỗi thì đưa lại hàng đợi (khi `retry` và còn lượt thử) hoặc FAILED.
+    Kết quả bị bỏ qua nếu job đã bị đưa lại hàng đợi trong lúc xử lý (worker khác có thể đang giữ).
+    Được gọi trong tiến trình con của worker (app/worker.py) hoặc trực tiếp.
+    """
+    db = SessionLocal()
+    try:
+        print(f"INGESTION JOB: Bắt đầu xử lý document ID: {document_id}")
+        db_document = crud.crud_document.get_document(db, document_id=document_id)
+        if not db_document:
+            print(f"Lỗi: Không tìm thấy document với ID {document_id}")
+            return False
+        ingest_document(db, db_document)
+        if crud.crud_document.complete_document_job(db, document_id, worker_id) is None:
+            print(f"INGESTION JOB: Document ID {document_id} không còn do {worker_id} giữ, bỏ qua kết quả.")
+            return False
+        print(f"INGESTION JOB: Hoàn tất xử lý document ID: {document_id}")
+        return True
     except Exception as e:
-        print(f"LỖI trong tác vụ nền khi xử lý document ID {document_id}: {e}")
-        crud.crud_document.update_document_status(db, document_id=document_id, status=db_models.DocumentStatus.FAILED, reason=str(e))
+        print(f"LỖI khi xử lý document ID {document_id}: {e}")
+        db.rollback()
+        failed = crud.crud_document.fail_document_job(
+            db, document_id, worker_id, reason=str(e), retry=retry and not isinstance(e, NON_RETRYABLE_ERRORS)
+        )
+        if failed is not None and failed.status == db_models.DocumentStatus.UPLOADING:
+            print(f"Document ID {document_id} sẽ được thử lại lúc {failed.next_attempt_at} (lần thử {failed.attempts}).")
+        return False
+    finally:
+        db.close()
+
+def process_document_and_embed(document_id: int):
+    """
+    Xử lý trực tiếp một tài liệu đang chờ, không qua worker
+    (INGESTION_MODE="background" hoặc các script). Không thử lại khi lỗi.
+    """
+    worker_id = f"inline:{os.getpid()}"
+    db = SessionLocal()
+    try:
+        claimed = crud.crud_document.claim_document(db, document_id, worker_id=worker_id)
     finally:
         db.close()
-        print(f"BACKGROUND TASK: Đóng DB session cho document ID: {document_id}")
\ No newline at end of file
+    if not claimed:
+        print(f"Document ID {document_id} không ở trạng thái chờ xử lý (có thể worker khác đã nhận). Bỏ qua.")
+        return
+    run_ingestion_job(document_id, worker_id, retry=False)
@@ -0,0 +1,118 @@
+# backend/app/core/model_backends.py
+
+import importlib
+import re
+from pathlib import Path
+from typing import Any, Dict
+
+from ..config import settings
+
+# Tải các model sentence-transformers (SentenceTransformer, SparseEncoder, CrossEncoder) trên
+# backend suy luận khác nhau:
+# - "torch": PyTorch fp32 (mặc định).
+# - "onnx": ONNX Runtime. quantization = cấu hình lượng tử hóa int8 động ("avx512_vnni", "avx2", "arm64"...).
+# - "openvino": OpenVINO. quantization = "int8" (lượng tử hóa tĩnh, cần tải dữ liệu calibration lần đầu).
+# Model lượng tử hóa được tạo một lần và lưu trong MODEL_EXPORT_DIR để các tiến trình sau dùng lại.
+
+_BACKEND_REQUIREMENTS = {
+    "onnx": (("onnxruntime", "optimum"), "sentence-transformers[onnx]"),
+    "openvino": (("openvino", "optimum.intel"), "sentence-transformers[openvino]"),
+}
+
+
+def _require(backend: str) -> None:
+    modules, extra = _BACKEND_REQUIREMENTS[backend]
+    try:
+        for module in modules:
+            importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(f"Backend '{backend}' cần các gói {', '.join(modules)} (pip install '{extra}').") from e
+
+
+def _backend_model_kwargs(backend: str, num_threads: int) -> Dict[str, Any]:
+    if not num_threads:
+        return {}
+    if backend == "onnx":
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = num_threads
+        return {"session_options": session_options}
+    return {"ov_config": {"INFERENCE_NUM_THREADS": str(num_threads)}}
+
+
+def _quantized_file_name(backend: str, quantization: str) -> str:
+    if backend == "onnx":
+        return f"onnx/model_qint8_{quantization}.onnx"
+    return "openvino/openvino_model_qint8_quantized.xml"
+
+
+def _export_quantized(model, backend: str, quantization: str, target: Path) -> None:
+    if backend == "onnx":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        export_dynamic_quantized_onnx_model(model, quantization, str(target))
+    else:
+        from optimum.intel import OVQuantizationConfig
+        from sentence_transformers import export_static_quantized_openvino_model
+
+        export_static_quantized_openvino_model(model, OVQuantizationConfig(), str(target))
+
+
+def load_model(
+    model_class,
+    model_name: str,
+    backend: str = "torch",
+    quantization: str = "",
+    num_threads: int = 0,
+    export_dir: str | Path | None = None,
+    **kwargs,
+):
+    """
+    Tạo `model_class(model_name, **kwargs)` trên backend đã chọn.
+    `num_threads` > 0 giới hạn số luồng suy luận (torch: toàn tiến trình; onnx/openvino: theo session).
+    """
+    if backend == "torch":
+        if num_threads:
+            import torch
+
+            torch.set_num_threads(num_threads)
+        return model_class(model_name, **kwargs)
+    if backend not in _BACKEND_REQUIREMENTS:
+        raise ValueError(f"Backend không hợp lệ: {backend}")
+    _require(backend)
+    model_kwargs = _backend_model_kwargs(backend, num_threads)
+    if not quantization:
+        return model_class(model_name, backend=backend, model_kwargs=model_kwargs, **kwargs)
+
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    target = Path(export_dir or settings.MODEL_EXPORT_DIR) / f"{slug}-{backend}"
+    file_name = _quantized_file_name(backend, quantization)
+    if not (target / file_name).exists():
+        print(f"Đang lượng tử hóa int8 ({backend}, {quantization}) model '{model_name}' vào {target}...")
+        model = model_class(model_name, backend=backend)
+        model.save_pretrained(str(target))
+        _export_quantized(model, backend, quantization, target)
+    return model_class(str(target), backend=backend, model_kwargs={**model_kwargs, "file_name": file_name}, **kwargs)
+
+
+def embedding_backend_options() -> Dict[str, Any]:
+    """
+    Tham số `load_model` cho các model embedding (dense và sparse) theo Settings.
+    """
+    return {
+        "backend": settings.EMBEDDING_BACKEND,
+        "quantization": settings.EMBEDDING_QUANTIZATION,
+        "num_threads": settings.EMBEDDING_NUM_THREADS,
+        "export_dir": settings.MODEL_EXPORT_DIR,
+    }
+
+
+def embedding_model_key(model_name: str) -> str:
+    """
+    Tên model dùng trong khóa cache embedding: vector từ backend/lượng tử hóa khác nhau
+    lệch nhau một chút nên không dùng chung cache.
+    """
+    if settings.EMBEDDING_BACKEND == "torch":
+        return model_name
+    return f"{model_name}#{settings.EMBEDDING_BACKEND}-{settings.EMBEDDING_QUANTIZATION or 'fp32'}"
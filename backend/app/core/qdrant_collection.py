@@ -0,0 +1,163 @@
+# backend/app/core/qdrant_collection.py
+
+from dataclasses import dataclass
+from typing import List
+
+from qdrant_client import QdrantClient, models
+
+from ..config import settings
+
+# Cấu hình collection Qdrant (các biến QDRANT_* trong config.py):
+# - Payload index cho owner_id và document_id: mọi truy vấn đều lọc theo owner_id (và có thể document_id),
+#   thiếu index thì Qdrant phải đọc payload của từng ứng viên để lọc.
+# - HNSW theo tenant: tắt graph toàn cục (m=0) và xây graph riêng cho từng giá trị owner_id/document_id
+#   (payload_m), nên search có lọc chỉ duyệt graph của tenant đó. Truy vấn không lọc theo owner_id
+#   hoặc document_id sẽ thành full scan.
+# - Lượng tử hóa vector dense (scalar int8 hoặc binary), bản lượng tử hóa luôn nằm trong RAM; vector gốc
+#   có thể để trên đĩa và chỉ được đọc khi rescore.
+
+# Các trường payload được index; đều là số nguyên và chỉ cần tra cứu theo giá trị (không lọc theo khoảng)
+INDEXED_PAYLOAD_FIELDS = ("owner_id", "document_id")
+
+
+def _quantization_kind(config) -> str:
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    if isinstance(config, models.ProductQuantization):
+        return "product"
+    return ""
+
+
+@dataclass
+class CollectionLayout:
+    payload_indexes: bool = True
+    tenant_hnsw: bool = False
+    hnsw_m: int = 16
+    quantization: str = ""  # "", "scalar" hoặc "binary"
+    dense_on_disk: bool = False
+
+    @classmethod
+    def from_settings(cls) -> "CollectionLayout":
+        return cls(
+            payload_indexes=settings.QDRANT_PAYLOAD_INDEXES,
+            tenant_hnsw=settings.QDRANT_TENANT_HNSW,
+            hnsw_m=settings.QDRANT_HNSW_M,
+            quantization=settings.QDRANT_QUANTIZATION,
+            dense_on_disk=settings.QDRANT_DENSE_ON_DISK,
+        )
+
+    def hnsw_config(self) -> models.HnswConfigDiff:
+        if self.tenant_hnsw:
+            return models.HnswConfigDiff(m=0, payload_m=self.hnsw_m)
+        return models.HnswConfigDiff(m=self.hnsw_m)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        if self.quantization:
+            raise ValueError(f"QDRANT_QUANTIZATION không hợp lệ: {self.quantization}")
+        return None
+
+    def dense_vector_params(self, size: int) -> models.VectorParams:
+        return models.VectorParams(
+            size=size,
+            distance=models.Distance.COSINE,
+            quantization_config=self.quantization_config(),
+            on_disk=self.dense_on_disk or None,
+        )
+
+
+def create_collection(client: QdrantClient, collection_name: str, dense_size: int, layout: CollectionLayout) -> None:
+    """
+    Tạo collection (vector "dense" và sparse vector "text") theo layout. Payload index được tạo ngay
+    khi collection còn trống, để graph theo tenant được xây cùng lúc với dữ liệu.
+    """
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={"dense": layout.dense_vector_params(dense_size)},
+        sparse_vectors_config={
+            "text": models.SparseVectorParams(
+                index=models.SparseIndexParams(on_disk=False)
+            )
+        },
+        hnsw_config=layout.hnsw_config(),
+    )
+    if layout.payload_indexes:
+        for field in INDEXED_PAYLOAD_FIELDS:
+            _create_payload_index(client, collection_name, field)
+
+
+def _create_payload_index(client: QdrantClient, collection_name: str, field: str) -> None:
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name=field,
+        field_schema=models.IntegerIndexParams(type=models.IntegerIndexType.INTEGER, lookup=True, range=False),
+        wait=True,
+    )
+
+
+def apply_layout(
+    client: QdrantClient, collection_name: str, layout: CollectionLayout, dry_run: bool = False
+) -> List[str]:
+    """
+    Đưa một collection đã có về layout mong muốn. Trả về mô tả các thay đổi (đã hoặc, với dry_run, sẽ áp dụng).
+    Payload index được tạo trước khi đổi HNSW để các segment được tối ưu lại với graph theo tenant.
+    Qdrant xây lại index/lượng tử hóa ở nền; collection vẫn phục vụ search trong lúc đó.
+    """
+    info = client.get_collection(collection_name=collection_name)
+    changes: List[str] = []
+
+    if layout.payload_indexes:
+        for field in INDEXED_PAYLOAD_FIELDS:
+            if field not in (info.payload_schema or {}):
+                changes.append(f"tạo payload index integer cho '{field}'")
+                if not dry_run:
+                    _create_payload_index(client, collection_name, field)
+
+    target_hnsw = layout.hnsw_config()
+    current_hnsw = info.config.hnsw_config
+    if current_hnsw.m != target_hnsw.m or (
+        target_hnsw.payload_m is not None and current_hnsw.payload_m != target_hnsw.payload_m
+    ):
+        changes.append(
+            f"HNSW m={current_hnsw.m}, payload_m={current_hnsw.payload_m} -> m={target_hnsw.m}, payload_m={target_hnsw.payload_m}"
+        )
+        if not dry_run:
+            client.update_collection(collection_name=collection_name, hnsw_config=target_hnsw)
+
+    dense_params = info.config.params.vectors["dense"]
+    vector_diff = {}
+    current_quantization = _quantization_kind(dense_params.quantization_config or info.config.quantization_config)
+    if current_quantization != layout.quantization:
+        changes.append(f"lượng tử hóa dense '{current_quantization or 'không'}' -> '{layout.quantization or 'không'}'")
+        vector_diff["quantization_config"] = layout.quantization_config() or models.Disabled.DISABLED
+    if bool(dense_params.on_disk) != layout.dense_on_disk:
+        changes.append(f"vector dense on_disk={bool(dense_params.on_disk)} -> {layout.dense_on_disk}")
+        vector_diff["on_disk"] = layout.dense_on_disk
+    if vector_diff and not dry_run:
+        client.update_collection(
+            collection_name=collection_name, vectors_config={"dense": models.VectorParamsDiff(**vector_diff)}
+        )
+    return changes
+
+
+def dense_search_params() -> models.SearchParams | None:
+    """
+    Tham số search cho nhánh dense: hnsw_ef và rescore khi vector được lượng tử hóa
+    (lấy oversampling * limit ứng viên bằng vector lượng tử hóa, chấm lại bằng vector gốc).
+    """
+    quantization = None
+    if settings.QDRANT_QUANTIZATION:
+        quantization = models.QuantizationSearchParams(
+            rescore=settings.QDRANT_QUANTIZATION_RESCORE,
+            oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING,
+        )
+    if quantization is None and not settings.QDRANT_HNSW_EF:
+        return None
+    return models.SearchParams(hnsw_ef=settings.QDRANT_HNSW_EF or None, quantization=quantization)
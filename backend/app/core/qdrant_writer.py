@@ -0,0 +1,156 @@
+# backend/app/core/qdrant_writer.py
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence
+
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+from ..config import settings
+
+# Mã HTTP được coi là lỗi tạm thời (quá tải, timeout, lỗi phía server)
+_TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code in _TRANSIENT_STATUS_CODES
+    if isinstance(error, (ResponseHandlingException, ConnectionError, TimeoutError)):
+        return True
+    try:
+        import grpc
+    except ImportError:
+        return False
+    if isinstance(error, grpc.RpcError):
+        return error.code() in (
+            grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.RESOURCE_EXHAUSTED
+        )
+    return False
+
+
+class QdrantBatchWriter:
+    """
+    Ghi điểm vào Qdrant theo batch, song song có giới hạn và có thử lại.
+    - `add(points)` chia điểm thành các batch `batch_size` và gửi trên tối đa `parallelism` luồng;
+      khi đã có `parallelism * 2` batch đang chờ, `add` bị chặn (backpressure).
+    - Lỗi tạm thời được thử lại với thời gian chờ tăng dần. Upsert theo id cố định nên gửi lại là an toàn.
+    - wait_mode="each": mọi batch dùng wait=True. wait_mode="barrier": các batch dùng wait=False
+      (chỉ chờ Qdrant ghi nhận vào WAL), `close()` gửi lại batch cuối với wait=True làm barrier:
+      Qdrant áp dụng thao tác theo thứ tự nên khi barrier xong, mọi batch trước đó cũng đã được áp dụng.
+    """
+
+    def __init__(
+        self,
+        client,
+        collection_name: str | None = None,
+        batch_size: int | None = None,
+        parallelism: int | None = None,
+        max_retries: int | None = None,
+        retry_backoff_seconds: float | None = None,
+        wait_mode: str | None = None,
+    ) -> None:
+        self.client = client
+        self.collection_name = collection_name or settings.QDRANT_COLLECTION_NAME
+        self.batch_size = batch_size or settings.QDRANT_UPSERT_BATCH_SIZE
+        self.parallelism = parallelism or settings.QDRANT_UPSERT_PARALLELISM
+        self.max_retries = settings.QDRANT_UPSERT_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff_seconds = (
+            settings.QDRANT_UPSERT_RETRY_BACKOFF_SECONDS if retry_backoff_seconds is None else retry_backoff_seconds
+        )
+        self.wait_mode = wait_mode or settings.QDRANT_UPSERT_WAIT_MODE
+
+        self._pool = ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="qdrant-writer")
+        self._slots = threading.BoundedSemaphore(self.parallelism * 2)
+        self._in_flight: List[Future] = []
+        self._last_batch: Sequence[Any] | None = None
+        self._lock = threading.Lock()
+        self._started_at: float | None = None
+
+        self.points_written = 0
+        self.batches_written = 0
+        self.retries = 0
+        self.request_seconds = 0.0
+
+    def __enter__(self) -> "QdrantBatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(wait=True)
+
+    def add(self, points: Sequence[Any]) -> None:
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+        for offset in range(0, len(points), self.batch_size):
+            batch = list(points[offset:offset + self.batch_size])
+            self._slots.acquire()
+            future = self._pool.submit(self._send, batch, self.wait_mode == "each")
+            future.add_done_callback(lambda _: self._slots.release())
+            with self._lock:
+                self._in_flight.append(future)
+                self._last_batch = batch
+
+    def flush(self) -> None:
+        """
+        Chờ mọi batch đã gửi được Qdrant xác nhận; ném lỗi nếu có batch thất bại sau khi đã thử lại.
+        """
+        with self._lock:
+            in_flight, self._in_flight = self._in_flight, []
+        for future in in_flight:
+            future.result()
+
+    def close(self) -> None:
+        """
+        Flush và (với wait_mode="barrier") chờ Qdrant áp dụng xong mọi batch đã ghi.
+        """
+        try:
+            self.flush()
+            if self.wait_mode == "barrier" and self._last_batch:
+                self._send(self._last_batch, wait=True, count=False)
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def _send(self, batch: Sequence[Any], wait: bool, count: bool = True) -> None:
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                self.client.upsert(collection_name=self.collection_name, points=batch, wait=wait)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                delay = self.retry_backoff_seconds * (2 ** (attempt - 1))
+                print(f"Qdrant upsert lỗi tạm thời ({e}); thử lại lần {attempt} sau {delay:.1f}s...")
+                time.sleep(delay)
+            finally:
+                with self._lock:
+                    self.request_seconds += time.perf_counter() - start
+        if count:
+            with self._lock:
+                self.points_written += len(batch)
+                self.batches_written += 1
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {
+            "points": self.points_written,
+            "batches": self.batches_written,
+            "retries": self.retries,
+            "elapsed_seconds": round(elapsed, 3),
+            "points_per_second": round(self.points_written / elapsed, 1) if elapsed else 0.0,
+            "request_seconds": round(self.request_seconds, 3),
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            f"{stats['points']} điểm / {stats['batches']} batch trong {stats['elapsed_seconds']:.2f}s "
+            f"({stats['points_per_second']} điểm/s, {stats['retries']} lần thử lại)"
+        )
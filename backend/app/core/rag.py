@@ -1,48 +1,100 @@
 # backend/app/core/rag.py
 
-from typing import List, Tuple, Dict
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Tuple, Dict
 import numpy as np
-from qdrant_client import QdrantClient, models
+from qdrant_client import models
 from qdrant_client.http.models import ScoredPoint
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from tavily import TavilyClient
 
+from .. import crud
 from ..config import settings
-from .llm import get_llm
+from ..db.session import get_async_sessionmaker
+from .registry import (
+    get_dense_embedding_model,
+    get_sparse_embedding_model,
+    get_reranker_model,
+    get_qdrant_client,
+    get_async_qdrant_client,
+    get_async_tavily_client,
+    get_llm_instance,
+)
+from .executor import run_in_inference_executor
+from .batching import MicroBatcher
+from .answer_cache import answer_cache, CachedAnswer, Scope
+from .routing import fast_router, DOCUMENT_SEARCH, WEB_SEARCH
+from .condense import format_history, should_condense, window_history
+from .sparse import encode_sparse, sparse_model_key, uses_sparse_model
+from .bm25 import Bm25IndexWriter, get_bm25_store
+from .fusion import fuse_candidates
+from .qdrant_collection import dense_search_params
+from .reranker import cosine_scores, select_cascade_head
+from .model_backends import embedding_model_key
+from .cache import bump_corpus_version, create_cache_backend, get_corpus_version, hash_key
 from ..schemas.chat import Source
 
-# --- KHỞI TẠO CÁC THÀNH PHẦN MỘT LẦN ---
-try:
-    print("Đang tải các model cho RAG...")
-    dense_embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
-    sparse_embedding_model = SentenceTransformer(settings.SPARSE_VECTOR_MODEL_NAME)
-    reranker_model = CrossEncoder(settings.RERANKER_MODEL_NAME)
-    qdrant_client = QdrantClient(url=settings.QDRANT_URL)
-    llm = get_llm()
-    tavily_client = TavilyClient(api_key=settings.TAVILY_API_KEY)
-    print("Tải model RAG và các client thành công.")
-except Exception as e:
-    print(f"Lỗi nghiêm trọng khi khởi tạo các thành phần RAG: {e}")
-    dense_embedding_model = None
-    sparse_embedding_model = None
-    reranker_model = None
-    qdrant_client = None
-    llm = None
-    tavily_client = None
+# Các model và client được quản lý bởi registry dùng chung (app/core/registry.py),
+# nên chỉ được tải một lần cho mỗi tiến trình, dù rag và ingestion cùng sử dụng.
 
 # ID của người dùng hệ thống/admin
 SYSTEM_ADMIN_USER_ID = 1
 
+# --- MICRO-BATCHING CHO ENCODE VÀ RERANK ---
+# Các request chat đồng thời được gom lại thành một lượt forward cho mỗi model.
+dense_encode_batcher = MicroBatcher(
+    "dense_encode",
+    lambda texts: get_dense_embedding_model().encode(texts),
+    max_batch_size=settings.ENCODE_BATCH_MAX_SIZE,
+    max_wait_ms=settings.MICRO_BATCH_MAX_WAIT_MS,
+)
+sparse_encode_batcher = MicroBatcher(
+    "sparse_encode",
+    lambda texts: encode_sparse(get_sparse_embedding_model(), texts, is_query=True),
+    max_batch_size=settings.ENCODE_BATCH_MAX_SIZE,
+    max_wait_ms=settings.MICRO_BATCH_MAX_WAIT_MS,
+)
+rerank_batcher = MicroBatcher(
+    "rerank",
+    lambda pairs: get_reranker_model().predict(pairs),
+    max_batch_size=settings.RERANK_BATCH_MAX_SIZE,
+    max_wait_ms=settings.MICRO_BATCH_MAX_WAIT_MS,
+)
+
+# --- CACHE CHO CÁC STAGE TRUY XUẤT ---
+# Embedding truy vấn theo (tên model, text) và kết quả đã rerank theo (query, bộ lọc, phiên bản).
+dense_embedding_cache = create_cache_backend(
+    "dense_embedding", settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES, ttl_seconds=None
+)
+sparse_embedding_cache = create_cache_backend(
+    "sparse_embedding", settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES, ttl_seconds=None
+)
+retrieval_cache = create_cache_backend(
+    "retrieval", settings.RETRIEVAL_CACHE_MAX_ENTRIES, ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS
+)
+condensed_query_cache = create_cache_backend(
+    "condensed_query", settings.CONDENSE_CACHE_MAX_ENTRIES, ttl_seconds=settings.CONDENSE_CACHE_TTL_SECONDS
+)
+
+def get_stage_cache_stats() -> List[Dict]:
+    return [c.stats() for c in (dense_embedding_cache, sparse_embedding_cache, retrieval_cache, condensed_query_cache)]
+
+def get_batching_stats() -> List[Dict]:
+    return [b.stats() for b in (dense_encode_batcher, sparse_encode_batcher, rerank_batcher)]
+
 # ==============================================================================
 # ĐỊNH NGHĨA CÁC CÔNG CỤ (TOOLS)
 # ==============================================================================
 
-def document_search_tool(query: str, document_id: int | None = None, user_id: int | None = None) -> Dict:
+async def document_search_tool(
+    query: str, document_id: int | None = None, user_id: int | None = None,
+    dense_query_vector: np.ndarray | None = None
+) -> Dict:
     """
     Công cụ tìm kiếm thông tin trong tài liệu.
     """
     print(f"--- Document Search Tool: query='{query}', doc_id={document_id}, user_id={user_id} ---")
-    context_data = _search_and_rerank_documents(query, document_id, user_id, top_k=5)
+    context_data = await _search_and_rerank_documents(query, document_id, user_id, top_k=5, dense_query_vector=dense_query_vector)
     
     if not context_data:
         return {"context": "Không tìm thấy thông tin liên quan trong các tài liệu được phép truy cập.", "sources": []}
@@ -50,17 +102,18 @@ def document_search_tool(query: str, document_id: int | None = None, user_id: in
     context_text = "\n---\n".join([doc['text'] for doc in context_data])
     sources = [Source(**doc) for doc in context_data]
     
-    return {"context": context_text, "sources": sources}
+    return {"context": context_text, "sources": sources, "top_score": context_data[0].get("score")}
 
-def web_search_tool(query: str) -> Dict:
+async def web_search_tool(query: str) -> Dict:
     """
     Công cụ tìm kiếm thông tin trên internet sử dụng Tavily.
     """
     print(f"--- Web Search Tool: query='{query}' ---")
+    tavily_client = get_async_tavily_client()
     if not tavily_client: 
         return {"context": "Lỗi: Tavily client chưa được khởi tạo.", "sources": []}
     try:
-        response = tavily_client.search(query=query, search_depth="advanced", max_results=3)
+        response = await tavily_client.search(query=query, search_depth="advanced", max_results=3)
         if not response or 'results' not in response or not response['results']:
             return {"context": "Không tìm thấy kết quả nào trên web cho câu hỏi này.", "sources": []}
         context = "\n---\n".join([obj["content"] for obj in response['results']])
@@ -74,26 +127,35 @@ def web_search_tool(query: str) -> Dict:
 # CÁC HÀM HỖ TRỢ
 # ==============================================================================
 
-def _search_and_rerank_documents(
-    query: str, document_id: int | None = None, user_id: int | None = None, top_k: int = 5
-) -> List[Dict]:
+async def _encode_query(
+    query: str, batcher: MicroBatcher, cache, model_name: str
+) -> Any:
     """
-    Hàm nội bộ để thực hiện Hybrid Search và Rerank.
+    Encode một câu truy vấn, tra cache embedding theo (tên model, text) trước.
+    Khi tắt micro-batching, hàm xử lý batch của `batcher` được gọi trực tiếp với batch một câu.
     """
-    if not all([qdrant_client, dense_embedding_model, sparse_embedding_model, reranker_model]):
-        print("Lỗi: Một trong các thành phần RAG (qdrant, models, reranker) chưa được khởi tạo.")
-        return []
+    cache_key = hash_key(model_name, query)
+    if settings.QUERY_EMBEDDING_CACHE_ENABLED:
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            return cached
+    if settings.MICRO_BATCHING_ENABLED:
+        embedding = (await batcher.submit([query]))[0]
+    else:
+        embedding = (await run_in_inference_executor(batcher.process_batch, [query]))[0]
+    if settings.QUERY_EMBEDDING_CACHE_ENABLED:
+        await cache.set(cache_key, embedding)
+    return embedding
 
-    dense_query_vector = dense_embedding_model.encode(query).tolist()
-    sparse_embedding_raw = sparse_embedding_model.encode(query)
-    sparse_indices = np.where(sparse_embedding_raw > 0)[0].tolist()
-    sparse_values = sparse_embedding_raw[sparse_indices].tolist()
-    sparse_query_vector = models.SparseVector(indices=sparse_indices, values=sparse_values)
+async def _encode_dense_query(query: str) -> np.ndarray:
+    return await _encode_query(
+        query, dense_encode_batcher, dense_embedding_cache, embedding_model_key(settings.EMBEDDING_MODEL_NAME),
+    )
 
-    initial_search_limit = top_k * 5
-    dense_request = models.SearchRequest(vector=models.NamedVector(name="dense", vector=dense_query_vector), limit=initial_search_limit, with_payload=True)
-    sparse_request = models.SearchRequest(vector=models.NamedSparseVector(name="text", vector=sparse_query_vector), limit=initial_search_limit, with_payload=True)
+async def _encode_sparse_query(query: str) -> models.SparseVector:
+    return await _encode_query(query, sparse_encode_batcher, sparse_embedding_cache, sparse_model_key())
 
+def _build_search_filter(document_id: int | None, user_id: int | None) -> models.Filter:
     filter_must_conditions = []
     if user_id:
         filter_must_conditions.append(
@@ -108,26 +170,181 @@ def _search_and_rerank_documents(
         filter_must_conditions.append(
             models.FieldCondition(key="document_id", match=models.MatchValue(value=document_id))
         )
+    return models.Filter(must=filter_must_conditions)
+
+def _candidate_vectors():
+    # Cascade cần vector dense của ứng viên để tính điểm bi-encoder, không phải encode lại chunk
+    return ["dense"] if settings.RERANK_CASCADE_ENABLED else False
+
+# Trường payload cần cho rerank và ngữ cảnh trả lời; chỉ được lấy cho các ứng viên sau bước gộp
+CANDIDATE_PAYLOAD_FIELDS = ["text", "document_id", "filename"]
+
+async def _dense_and_sparse_search(
+    query: str, dense_query_vector: np.ndarray | None, final_filter: models.Filter, limit: int
+) -> List[List[ScoredPoint]]:
+    """
+    Nhánh dense và sparse (sparse vector "text") trong một lời gọi search_batch tới Qdrant.
+    Chỉ trả về id và điểm; payload được lấy sau bước gộp (hydrate_candidates).
+    """
+    if dense_query_vector is None:
+        dense_query_vector, sparse_query_vector = await asyncio.gather(
+            _encode_dense_query(query), _encode_sparse_query(query)
+        )
+    else:
+        sparse_query_vector = await _encode_sparse_query(query)
+    dense_query_vector = dense_query_vector.tolist()
+
+    dense_request = models.SearchRequest(vector=models.NamedVector(name="dense", vector=dense_query_vector), limit=limit, with_payload=False, with_vector=False, params=dense_search_params())
+    sparse_request = models.SearchRequest(vector=models.NamedSparseVector(name="text", vector=sparse_query_vector), limit=limit, with_payload=False, with_vector=False)
 
-    final_filter = models.Filter(must=filter_must_conditions)
     dense_request.filter = final_filter
     sparse_request.filter = final_filter
+
+    return await get_async_qdrant_client().search_batch(collection_name=settings.QDRANT_COLLECTION_NAME, requests=[dense_request, sparse_request])
+
+async def _dense_and_bm25_search(
+    query: str, dense_query_vector: np.ndarray | None, final_filter: models.Filter, limit: int,
+    document_id: int | None, user_id: int | None,
+) -> List[List[ScoredPoint]]:
+    """
+    Nhánh sparse bằng chỉ mục BM25 cục bộ (SPARSE_BACKEND="bm25"): không cần model sparse.
+    Cũng chỉ trả về id và điểm như _dense_and_sparse_search.
+    """
+    if dense_query_vector is None:
+        dense_query_vector = await _encode_dense_query(query)
+    # Đồng bộ chỉ mục với journal có thể phải đọc đĩa, nên chạy ngoài event loop
+    dense_results, bm25_hits = await asyncio.gather(
+        get_async_qdrant_client().search(
+            collection_name=settings.QDRANT_COLLECTION_NAME,
+            query_vector=models.NamedVector(name="dense", vector=dense_query_vector.tolist()),
+            query_filter=final_filter, limit=limit, with_payload=False, with_vectors=False,
+            search_params=dense_search_params(),
+        ),
+        asyncio.to_thread(get_bm25_store().search, query, limit, user_id or SYSTEM_ADMIN_USER_ID, document_id),
+    )
+    bm25_results = [ScoredPoint(id=point_id, version=0, score=score) for point_id, score in bm25_hits]
+    return [dense_results, bm25_results]
+
+async def _load_stored_chunks(chunk_ids: List[str]) -> Dict[str, Dict]:
+    async with get_async_sessionmaker()() as db:
+        return await crud.crud_chunk.aget_chunks(db, chunk_ids)
+
+async def hydrate_candidates(points: List[ScoredPoint]) -> List[ScoredPoint]:
+    """
+    Lấy nội dung (text, document_id, filename) cho các ứng viên đã qua bước gộp, giữ nguyên thứ tự và điểm:
+    từ kho chunk (một truy vấn cho cả batch) nếu CHUNK_STORE="postgres", còn lại từ payload Qdrant
+    (CANDIDATE_PAYLOAD_FIELDS, kèm vector dense nếu cascade cần). Ứng viên không còn nội dung
+    (bị xóa giữa lúc search và lúc lấy) bị bỏ qua.
+    """
+    if not points:
+        return []
+    point_ids = [str(point.id) for point in points]
+    stored: Dict[str, Dict] = {}
+    if settings.CHUNK_STORE == "postgres":
+        stored = await _load_stored_chunks(point_ids)
+    # Cascade cần vector của mọi ứng viên; nếu không, Qdrant chỉ được hỏi cho chunk chưa có trong kho
+    fetch_ids = point_ids if settings.RERANK_CASCADE_ENABLED else [pid for pid in point_ids if pid not in stored]
+    records_by_id = {}
+    if fetch_ids:
+        records = await get_async_qdrant_client().retrieve(
+            collection_name=settings.QDRANT_COLLECTION_NAME, ids=fetch_ids,
+            with_payload=CANDIDATE_PAYLOAD_FIELDS, with_vectors=_candidate_vectors(),
+        )
+        records_by_id = {str(record.id): record for record in records}
+    hydrated = []
+    for point, point_id in zip(points, point_ids):
+        record = records_by_id.get(point_id)
+        payload = stored.get(point_id) or (record.payload if record is not None else None)
+        if not payload or "text" not in payload:
+            continue
+        hydrated.append(ScoredPoint(
+            id=point.id, version=point.version, score=point.score,
+            payload=payload, vector=record.vector if record is not None else None,
+        ))
+    return hydrated
+
+async def _cascade_head(query: str, points: List[ScoredPoint], top_k: int) -> List[ScoredPoint]:
+    """
+    Tầng bi-encoder của cascade: cosine giữa query và vector dense của ứng viên (lấy kèm payload),
+    chỉ giữ các ứng viên mà điểm này chưa đủ để loại (xem select_cascade_head).
+    """
+    vectors = [point.vector.get("dense") if isinstance(point.vector, dict) else None for point in points]
+    if not points or any(vector is None for vector in vectors):
+        return points
+    query_vector = await _encode_dense_query(query)
+    head = select_cascade_head(
+        cosine_scores(query_vector, np.array(vectors)), top_k,
+        settings.RERANK_CASCADE_MARGIN, top_k * settings.RERANK_CASCADE_HEAD_PER_RESULT,
+    )
+    print(f"Cascade: {len(points)} ứng viên -> {len(head)} đưa vào cross-encoder.")
+    return [points[i] for i in head]
+
+async def search_candidate_lists(
+    query: str, final_filter: models.Filter, limit: int, document_id: int | None = None,
+    user_id: int | None = None, dense_query_vector: np.ndarray | None = None,
+) -> List[List[ScoredPoint]]:
+    """
+    Chạy các nhánh truy xuất (dense + sparse hoặc BM25), mỗi nhánh trả về tối đa `limit` điểm đã sắp xếp
+    (chỉ id và điểm, xem hydrate_candidates).
+    """
+    if uses_sparse_model():
+        return await _dense_and_sparse_search(query, dense_query_vector, final_filter, limit)
+    return await _dense_and_bm25_search(query, dense_query_vector, final_filter, limit, document_id, user_id)
+
+async def _search_and_rerank_documents(
+    query: str, document_id: int | None = None, user_id: int | None = None, top_k: int = 5,
+    dense_query_vector: np.ndarray | None = None
+) -> List[Dict]:
+    """
+    Hàm nội bộ để thực hiện Hybrid Search và Rerank.
+    Encode và rerank (CPU) chạy trong executor suy luận, truy vấn Qdrant dùng client async,
+    nên không chặn event loop. Có thể truyền sẵn dense_query_vector nếu đã encode trước đó.
+    Kết quả của các nhánh được gộp phía ứng dụng (RRF hoặc tổng có trọng số, FUSION_MODE) và chỉ
+    RERANK_CANDIDATES_PER_RESULT * top_k ứng viên đứng đầu
+    được rerank. Search chỉ trả về id và điểm; payload chỉ được lấy cho các ứng viên này.
+    Kết quả cuối (top_k sau rerank) được cache theo (query, bộ lọc, phiên bản collection).
+    """
+    qdrant_client = get_async_qdrant_client()
+    dense_embedding_model = get_dense_embedding_model()
+    sparse_embedding_model = get_sparse_embedding_model() if uses_sparse_model() else True
+    reranker_model = get_reranker_model()
+    if not all([qdrant_client, dense_embedding_model, sparse_embedding_model, reranker_model]):
+        print("Lỗi: Một trong các thành phần RAG (qdrant, models, reranker) chưa được khởi tạo.")
+        return []
+
+    final_filter = _build_search_filter(document_id, user_id)
     print(f"Áp dụng bộ lọc Qdrant: {final_filter.json(exclude_none=True)}")
 
-    search_results = qdrant_client.search_batch(collection_name=settings.QDRANT_COLLECTION_NAME, requests=[dense_request, sparse_request])
-    
-    retrieved_points: Dict[str, ScoredPoint] = {}
-    for result_set in search_results:
-        for point in result_set:
-            retrieved_points[point.id] = point
+    retrieval_cache_key = None
+    if settings.RETRIEVAL_CACHE_ENABLED:
+        retrieval_cache_key = hash_key(
+            query, final_filter.json(exclude_none=True), top_k,
+            settings.QDRANT_COLLECTION_NAME, await get_corpus_version(user_id or SYSTEM_ADMIN_USER_ID),
+        )
+        cached_results = await retrieval_cache.get(retrieval_cache_key)
+        if cached_results is not None:
+            print("Retrieval cache: trúng, bỏ qua encode/search/rerank.")
+            return cached_results
 
-    if not retrieved_points:
+    initial_search_limit = top_k * 5
+    budget = top_k * settings.RERANK_CANDIDATES_PER_RESULT
+    search_results = await search_candidate_lists(
+        query, final_filter, initial_search_limit, document_id, user_id, dense_query_vector
+    )
+    points_list = fuse_candidates(search_results, budget=budget)
+    print(f"Fusion ({settings.FUSION_MODE}): {sum(len(r) for r in search_results)} kết quả -> {len(points_list)} ứng viên rerank.")
+    points_list = await hydrate_candidates(points_list)
+    if not points_list:
         return []
+    if settings.RERANK_CASCADE_ENABLED:
+        points_list = await _cascade_head(query, points_list, top_k)
 
-    rerank_pairs = [[query, point.payload['text']] for point in retrieved_points.values()]
-    scores = reranker_model.predict(rerank_pairs)
+    rerank_pairs = [[query, point.payload['text']] for point in points_list]
+    if settings.MICRO_BATCHING_ENABLED:
+        scores = await rerank_batcher.submit(rerank_pairs)
+    else:
+        scores = await run_in_inference_executor(reranker_model.predict, rerank_pairs)
     
-    points_list = list(retrieved_points.values())
     scored_points = list(zip(scores, points_list))
     scored_points.sort(key=lambda x: x[0], reverse=True)
     
@@ -136,14 +353,29 @@ def _search_and_rerank_documents(
         final_context_data.append({
             "text": point.payload['text'],
             "document_id": point.payload['document_id'],
-            "filename": point.payload['filename']
+            "filename": point.payload['filename'],
+            "score": float(score)
         })
+    if settings.RETRIEVAL_CACHE_ENABLED:
+        await retrieval_cache.set(retrieval_cache_key, final_context_data)
     return final_context_data
 
-def condense_query_with_history(query: str, history: List[Tuple[str, str]]) -> str:
-    if not history: 
+async def condense_query_with_history(query: str, history: List[Tuple[str, str]]) -> str:
+    """
+    Tạo câu hỏi độc lập từ câu hỏi mới và lịch sử trò chuyện.
+    - Bỏ qua LLM khi không có lịch sử hoặc câu hỏi đã đủ nghĩa (heuristic trong condense.py).
+    - Chỉ đưa các lượt gần nhất trong giới hạn CONDENSE_HISTORY_MAX_TOKENS vào prompt.
+    - Kết quả được cache theo (cửa sổ lịch sử, câu hỏi).
+    """
+    if not should_condense(query, history):
         return query
-    history_str = "\n".join([f"Người dùng: {user_msg}\nTrợ lý: {bot_msg}" for user_msg, bot_msg in history])
+    history_str = format_history(window_history(history, settings.CONDENSE_HISTORY_MAX_TOKENS))
+    cache_key = hash_key(history_str, query)
+    if settings.CONDENSE_CACHE_ENABLED:
+        cached = await condensed_query_cache.get(cache_key)
+        if cached is not None:
+            print(f"Condensed query cache: trúng cho '{query}' -> '{cached}'")
+            return cached
     prompt = f"""Dựa vào lịch sử trò chuyện dưới đây và câu hỏi mới của người dùng, hãy tạo ra một câu hỏi tìm kiếm độc lập, đầy đủ ngữ cảnh. Câu hỏi này sẽ được dùng để truy vấn cơ sở dữ liệu. Hãy đảm bảo nó bao gồm tất cả các chi tiết liên quan từ lịch sử.
 
 Lịch sử trò chuyện:
@@ -153,12 +385,15 @@ Câu hỏi mới: {query}
 
 Câu hỏi độc lập:"""
     print("--- Condensing Query ---")
+    llm = get_llm_instance()
     if not llm: 
         return query
-    response = llm.invoke(prompt)
+    response = await llm.ainvoke(prompt)
     condensed_query = response.content.strip()
     print(f"Câu hỏi đã được rút gọn: {condensed_query}")
     print("------------------------")
+    if settings.CONDENSE_CACHE_ENABLED and condensed_query:
+        await condensed_query_cache.set(cache_key, condensed_query)
     return condensed_query
 
 def build_final_prompt(query: str, context: str) -> str:
@@ -180,7 +415,8 @@ Câu trả lời chi tiết:
 """
     return prompt_template
 
-def delete_vectors_for_document(document_id: int):
+def delete_vectors_for_document(document_id: int, owner_id: int | None = None):
+    qdrant_client = get_qdrant_client()
     if not qdrant_client:
         print("Lỗi: Qdrant client chưa được khởi tạo. Bỏ qua việc xóa vector.")
         return
@@ -196,6 +432,12 @@ def delete_vectors_for_document(document_id: int):
             wait=True
         )
         print(f"Xóa thành công các vector cho document_id: {document_id}")
+        if not uses_sparse_model():
+            bm25_writer = Bm25IndexWriter()
+            bm25_writer.delete_document(document_id)
+            bm25_writer.flush()
+        # Kho tài liệu của owner đã thay đổi: vô hiệu hóa các câu trả lời đã cache
+        bump_corpus_version(owner_id)
     except Exception as e:
         print(f"Lỗi khi xóa vector từ Qdrant cho document_id {document_id}: {e}")
         
@@ -203,46 +445,288 @@ def delete_vectors_for_document(document_id: int):
 # LOGIC AGENT CHÍNH
 # ==============================================================================
 
+class StageTimer:
+    """
+    Ghi lại thời gian (ms) của từng stage trong một lượt chat để trả về trong metadata.
+    Các stage có thể chạy song song; stage bị hủy được ghi vào danh sách "cancelled".
+    """
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.cancelled: List[str] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        finally:
+            self.timings[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def timed(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        with self.stage(name):
+            return await awaitable
+
+    def metadata(self, **extra: Any) -> Dict[str, Any]:
+        return {
+            "execution_mode": settings.CHAT_EXECUTION_MODE,
+            **extra,
+            "timings": {**self.timings, "total_ms": round((time.perf_counter() - self._start) * 1000, 1)},
+            "cancelled_stages": self.cancelled,
+        }
+
+def _cache_scope(document_id: int | None, user_id: int | None) -> Scope:
+    # Cùng quy tắc với bộ lọc Qdrant: khách vãng lai chỉ thấy tài liệu hệ thống
+    return (user_id or SYSTEM_ADMIN_USER_ID, document_id)
+
+async def _lookup_answer_cache(
+    standalone_query: str, scope: Scope, version: Tuple | None
+) -> Tuple[CachedAnswer | None, str | None, np.ndarray | None]:
+    """
+    Tra cache câu trả lời: exact-match trước, sau đó semantic.
+    Trả về (câu trả lời đã cache, tầng trúng cache, dense embedding của câu hỏi nếu đã tính)
+    để embedding được tái sử dụng khi định tuyến và truy xuất.
+    """
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None, None, None
+    cached = answer_cache.get_exact(standalone_query, scope, version)
+    if cached:
+        print(f"Answer cache (exact): trúng cho '{standalone_query}'")
+        return cached, "exact", None
+    if not get_dense_embedding_model():
+        return None, None, None
+    query_embedding = await _encode_dense_query(standalone_query)
+    cached = answer_cache.get_semantic(query_embedding, scope, version)
+    return cached, ("semantic" if cached else None), query_embedding
+
+def _log_route(method: str, tool: str, start: float, detail: str = "") -> None:
+    latency_ms = (time.perf_counter() - start) * 1000
+    print(f"Router ({method}): chọn {tool} sau {latency_ms:.1f}ms {detail}".rstrip())
+
+async def _choose_tool(
+    llm, standalone_query: str, query_embedding: np.ndarray | None,
+    run_document_search: Callable[[], Awaitable[Dict]]
+) -> str:
+    """
+    Chọn công cụ cho câu hỏi không chỉ định tài liệu.
+    - ROUTER_MODE="llm": luôn hỏi LLM như trước.
+    - "local"/"hybrid": phân loại bằng embedding trước; nếu chưa chắc chắn thì kiểm tra
+      độ tin cậy truy xuất (điểm reranker cao nhất). "hybrid" chỉ hỏi LLM khi vẫn chưa chắc,
+      "local" không bao giờ gọi LLM.
+    `run_document_search` trả về kết quả document_search (chạy một lần, dùng lại sau đó).
+    """
+    start = time.perf_counter()
+    if settings.ROUTER_MODE in ("local", "hybrid") and get_dense_embedding_model():
+        if query_embedding is None:
+            query_embedding = await _encode_dense_query(standalone_query)
+        if not fast_router.is_ready():
+            await run_in_inference_executor(fast_router.build_prototypes, get_dense_embedding_model().encode)
+        decision = fast_router.classify(query_embedding)
+        if decision.tool:
+            _log_route("embedding", decision.tool, start, f"(margin={decision.margin:+.3f})")
+            return decision.tool
+
+        # Chưa chắc chắn: nếu tài liệu có đoạn khớp tốt thì chọn document_search
+        top_score = (await run_document_search()).get("top_score")
+        if top_score is not None and top_score >= settings.ROUTER_RERANK_CONFIDENCE:
+            _log_route("retrieval_confidence", DOCUMENT_SEARCH, start, f"(top_score={top_score:.3f})")
+            return DOCUMENT_SEARCH
+        if settings.ROUTER_MODE == "local":
+            _log_route("retrieval_confidence", WEB_SEARCH, start, f"(top_score={top_score})")
+            return WEB_SEARCH
+
+    tool_selection_prompt = f"""Bạn là một Agent định tuyến thông minh...
+Câu hỏi của người dùng: "{standalone_query}"
+Hãy trả lời bằng MỘT TỪ DUY NHẤT: `document_search` hoặc `web_search`."""
+    print("--- Agent đang lựa chọn công cụ ---")
+    tool_choice_response = await llm.ainvoke(tool_selection_prompt)
+    chosen_tool_name = tool_choice_response.content.strip().lower()
+    _log_route("llm", chosen_tool_name, start)
+    return chosen_tool_name
+
+def _cancel_task(task: asyncio.Task) -> None:
+    # Hủy nhánh thua; nếu nhánh đã xong với lỗi thì đọc lỗi để asyncio không cảnh báo
+    if task.done():
+        if not task.cancelled():
+            task.exception()
+        return
+    task.cancel()
+
+def _is_web_choice(chosen_tool_name: str) -> bool:
+    if WEB_SEARCH in chosen_tool_name and DOCUMENT_SEARCH not in chosen_tool_name:
+        return True
+    if DOCUMENT_SEARCH not in chosen_tool_name:
+        print("Lựa chọn không rõ ràng từ LLM, mặc định dùng document_search.")
+    return False
+
+async def _run_agent_tools(
+    llm, standalone_query: str, document_id: int | None, user_id: int | None,
+    query_embedding: np.ndarray | None, timer: StageTimer
+) -> Dict:
+    """
+    Chọn công cụ và chạy công cụ cho câu hỏi đã được rút gọn.
+    Trả về dict gồm "tool", "context" và "sources" của công cụ đã chọn.
+    """
+    if document_id:
+        print(f"Ưu tiên tìm kiếm trong document_id: {document_id} do người dùng chỉ định.")
+        result = await timer.timed("retrieval", document_search_tool(standalone_query, document_id, user_id, query_embedding))
+        return {"tool": DOCUMENT_SEARCH, **result}
+
+    if settings.CHAT_EXECUTION_MODE == "speculative":
+        return await _run_agent_tools_speculatively(llm, standalone_query, user_id, query_embedding, timer)
+
+    document_result: Dict[str, Dict] = {}
+    async def run_document_search() -> Dict:
+        if "result" not in document_result:
+            document_result["result"] = await timer.timed(
+                "retrieval", document_search_tool(standalone_query, None, user_id, query_embedding)
+            )
+        return document_result["result"]
+
+    chosen_tool_name = await timer.timed("route", _choose_tool(llm, standalone_query, query_embedding, run_document_search))
+    if _is_web_choice(chosen_tool_name):
+        return {"tool": WEB_SEARCH, **await timer.timed("web_search", web_search_tool(standalone_query))}
+    return {"tool": DOCUMENT_SEARCH, **await run_document_search()}
+
+async def _run_agent_tools_speculatively(
+    llm, standalone_query: str, user_id: int | None, query_embedding: np.ndarray | None, timer: StageTimer
+) -> Dict:
+    """
+    Chế độ speculative: truy xuất tài liệu (và web search nếu SPECULATIVE_WEB_SEARCH bật)
+    bắt đầu song song với bước định tuyến; nhánh thua bị hủy.
+    Thời gian thực tế ~ max(định tuyến, truy xuất) thay vì tổng của chúng.
+    """
+    if query_embedding is None and get_dense_embedding_model():
+        # Router và truy xuất đều cần embedding: tính một lần trước khi tách nhánh
+        query_embedding = await timer.timed("embed", _encode_dense_query(standalone_query))
+
+    document_task = asyncio.create_task(
+        timer.timed("retrieval", document_search_tool(standalone_query, None, user_id, query_embedding))
+    )
+    web_task = None
+    if settings.SPECULATIVE_WEB_SEARCH:
+        web_task = asyncio.create_task(timer.timed("web_search", web_search_tool(standalone_query)))
+
+    async def run_document_search() -> Dict:
+        # shield: router chờ kết quả nhưng không được hủy task dùng chung
+        return await asyncio.shield(document_task)
+
+    try:
+        chosen_tool_name = await timer.timed("route", _choose_tool(llm, standalone_query, query_embedding, run_document_search))
+    except BaseException:
+        _cancel_task(document_task)
+        if web_task:
+            _cancel_task(web_task)
+        raise
+
+    if _is_web_choice(chosen_tool_name):
+        _cancel_task(document_task)
+        if web_task is None:
+            web_task = asyncio.create_task(timer.timed("web_search", web_search_tool(standalone_query)))
+        return {"tool": WEB_SEARCH, **await web_task}
+    if web_task:
+        _cancel_task(web_task)
+    return {"tool": DOCUMENT_SEARCH, **await document_task}
+
+def _has_usable_context(context: str) -> bool:
+    return bool(context) and "Không tìm thấy" not in context
+
+def _store_answer(
+    standalone_query: str, scope: Scope, version: Tuple | None, tool_result: Dict, answer: str,
+    query_embedding: np.ndarray | None
+) -> None:
+    # Chỉ cache câu trả lời dựa trên tài liệu; kết quả web thay đổi theo thời gian
+    if settings.ANSWER_CACHE_ENABLED and tool_result["tool"] == DOCUMENT_SEARCH and answer:
+        # Lưu theo phiên bản đọc lúc tra cache: tài liệu thay đổi giữa chừng thì câu trả lời này không được dùng lại
+        answer_cache.set(standalone_query, scope, version, answer, tool_result["sources"], query_embedding)
+
+def _build_prompt_from_sources(query: str, sources: List[Source]) -> str:
+    # Chúng ta vẫn gửi context được đánh số để LLM dễ theo dõi, nhưng không yêu cầu nó trích dẫn
+    context_for_prompt = "\n\n".join([f"Thông tin nguồn {i+1}:\n{src.text}" for i, src in enumerate(sources)])
+    return build_final_prompt(query, context_for_prompt)
+
 async def get_agentic_rag_response(
     query: str, history: List[Tuple[str, str]], document_id: int | None = None, user_id: int | None = None
 ) -> Dict:
+    llm = get_llm_instance()
     if not llm:
         return {"answer": "Lỗi: LLM chưa được khởi tạo.", "sources": []}
 
-    standalone_query = condense_query_with_history(query, history)
-
-    chosen_tool_name = ""
-    if document_id:
-        print(f"Ưu tiên tìm kiếm trong document_id: {document_id} do người dùng chỉ định.")
-        chosen_tool_name = "document_search"
-    else:
-        tool_selection_prompt = f"""Bạn là một Agent định tuyến thông minh...
-Câu hỏi của người dùng: "{standalone_query}"
-Hãy trả lời bằng MỘT TỪ DUY NHẤT: `document_search` hoặc `web_search`."""
-        print("--- Agent đang lựa chọn công cụ ---")
-        tool_choice_response = await llm.ainvoke(tool_selection_prompt)
-        chosen_tool_name = tool_choice_response.content.strip().lower()
-        print(f"Agent đã chọn: {chosen_tool_name}")
-
-    if "document_search" in chosen_tool_name:
-        tool_result = document_search_tool(standalone_query, document_id, user_id)
-    elif "web_search" in chosen_tool_name:
-        tool_result = web_search_tool(standalone_query)
-    else:
-        print("Lựa chọn không rõ ràng từ LLM, mặc định dùng document_search.")
-        tool_result = document_search_tool(standalone_query, document_id, user_id)
-
+    timer = StageTimer()
+    standalone_query = await timer.timed("condense", condense_query_with_history(query, history))
+    scope = _cache_scope(document_id, user_id)
+    version = await get_corpus_version(scope[0]) if settings.ANSWER_CACHE_ENABLED else None
+    cached, cache_tier, query_embedding = await timer.timed(
+        "answer_cache", _lookup_answer_cache(standalone_query, scope, version)
+    )
+    if cached:
+        return {"answer": cached.answer, "sources": cached.sources, "metadata": timer.metadata(answer_cache=cache_tier)}
+
+    tool_result = await _run_agent_tools(llm, standalone_query, document_id, user_id, query_embedding, timer)
     context_from_tool = tool_result["context"]
     sources_from_tool = tool_result["sources"]
 
-    if not context_from_tool or "Không tìm thấy" in context_from_tool:
-        return {"answer": context_from_tool, "sources": sources_from_tool}
+    if not _has_usable_context(context_from_tool):
+        return {"answer": context_from_tool, "sources": sources_from_tool, "metadata": timer.metadata(tool=tool_result["tool"])}
 
-    # Chúng ta vẫn gửi context được đánh số để LLM dễ theo dõi, nhưng không yêu cầu nó trích dẫn
-    context_for_prompt = "\n\n".join([f"Thông tin nguồn {i+1}:\n{src.text}" for i, src in enumerate(sources_from_tool)])
-    final_prompt = build_final_prompt(query, context_for_prompt)
+    final_prompt = _build_prompt_from_sources(query, sources_from_tool)
 
     print("Đang gửi prompt cuối cùng đến LLM...")
-    final_response = await llm.ainvoke(final_prompt)
+    final_response = await timer.timed("generation", llm.ainvoke(final_prompt))
+
+    _store_answer(standalone_query, scope, version, tool_result, final_response.content, query_embedding)
+    return {"answer": final_response.content, "sources": sources_from_tool, "metadata": timer.metadata(tool=tool_result["tool"])}
+
+async def stream_agentic_rag_response(
+    query: str, history: List[Tuple[str, str]], document_id: int | None = None, user_id: int | None = None
+) -> AsyncIterator[Dict]:
+    """
+    Phiên bản streaming của get_agentic_rag_response.
+    Phát ra lần lượt các sự kiện:
+    - {"type": "sources", "sources": [...]}: ngay khi truy xuất/rerank xong.
+    - {"type": "token", "content": "..."}: từng phần câu trả lời từ llm.astream.
+    - {"type": "done", "metadata": {...}} khi kết thúc (kèm thời gian từng stage),
+      hoặc {"type": "error", "content": "..."} nếu có lỗi.
+    """
+    llm = get_llm_instance()
+    if not llm:
+        yield {"type": "error", "content": "Lỗi: LLM chưa được khởi tạo."}
+        return
+
+    timer = StageTimer()
+    standalone_query = await timer.timed("condense", condense_query_with_history(query, history))
+    scope = _cache_scope(document_id, user_id)
+    version = await get_corpus_version(scope[0]) if settings.ANSWER_CACHE_ENABLED else None
+    cached, cache_tier, query_embedding = await timer.timed(
+        "answer_cache", _lookup_answer_cache(standalone_query, scope, version)
+    )
+    if cached:
+        yield {"type": "sources", "sources": cached.sources}
+        yield {"type": "token", "content": cached.answer}
+        yield {"type": "done", "metadata": timer.metadata(answer_cache=cache_tier)}
+        return
+
+    tool_result = await _run_agent_tools(llm, standalone_query, document_id, user_id, query_embedding, timer)
+    context_from_tool = tool_result["context"]
+    sources_from_tool = tool_result["sources"]
+    yield {"type": "sources", "sources": sources_from_tool}
+
+    if not _has_usable_context(context_from_tool):
+        yield {"type": "token", "content": context_from_tool}
+        yield {"type": "done", "metadata": timer.metadata(tool=tool_result["tool"])}
+        return
 
-    return {"answer": final_response.content, "sources": sources_from_tool}
\ No newline at end of file
+    final_prompt = _build_prompt_from_sources(query, sources_from_tool)
+
+    print("Đang stream câu trả lời từ LLM...")
+    answer_parts = []
+    with timer.stage("generation"):
+        async for chunk in llm.astream(final_prompt):
+            if chunk.content:
+                answer_parts.append(chunk.content)
+                yield {"type": "token", "content": chunk.content}
+    _store_answer(standalone_query, scope, version, tool_result, "".join(answer_parts), query_embedding)
+    yield {"type": "done", "metadata": timer.metadata(tool=tool_result["tool"])}
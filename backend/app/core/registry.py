@@ -0,0 +1,285 @@
+# backend/app/core/registry.py
+
+import os
+import resource
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+from ..config import settings
+
+# Các nhóm (role) thành phần:
+# - "query": cần cho luồng chat/truy vấn (API server, script đánh giá).
+# - "ingestion": cần cho luồng xử lý tài liệu (tác vụ nền, script ingest).
+QUERY_ROLE = "query"
+INGESTION_ROLE = "ingestion"
+
+
+def _current_rss_mb() -> float:
+    """
+    Trả về bộ nhớ RSS hiện tại của tiến trình (MB).
+    Ưu tiên đọc /proc (Linux), nếu không có thì dùng peak RSS từ getrusage.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss tính bằng KB trên Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _parameter_size_mb(instance: Any) -> float | None:
+    """
+    Ước lượng kích thước trọng số của một model PyTorch (MB), nếu có.
+    """
+    model = getattr(instance, "model", instance)
+    parameters = getattr(model, "parameters", None)
+    if not callable(parameters):
+        return None
+    try:
+        return sum(p.numel() * p.element_size() for p in parameters()) / (1024 * 1024)
+    except Exception:
+        return None
+
+
+class ModelRegistry:
+    """
+    Registry dùng chung cho các model và client trong một tiến trình.
+    Mỗi thành phần chỉ được khởi tạo một lần (lazy) khi được dùng lần đầu,
+    hoặc khi được warm-up trong lifespan của server.
+    """
+
+    def __init__(self) -> None:
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._warmups: Dict[str, Callable[[Any], None]] = {}
+        self._roles: Dict[str, set] = {}
+        self._instances: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        roles: Iterable[str],
+        warmup: Callable[[Any], None] | None = None,
+    ) -> None:
+        self._factories[name] = factory
+        self._roles[name] = set(roles)
+        if warmup:
+            self._warmups[name] = warmup
+
+    def get(self, name: str) -> Any | None:
+        """
+        Lấy thành phần theo tên, khởi tạo nếu chưa có.
+        Trả về None nếu khởi tạo thất bại (lỗi được ghi nhận, không thử lại).
+        """
+        if name in self._instances:
+            return self._instances[name]
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            if name in self._errors:
+                return None
+            factory = self._factories.get(name)
+            if factory is None:
+                raise KeyError(f"Thành phần '{name}' chưa được đăng ký.")
+
+            print(f"Đang khởi tạo thành phần '{name}'...")
+            rss_before = _current_rss_mb()
+            start = time.perf_counter()
+            try:
+                instance = factory()
+            except Exception as e:
+                print(f"Lỗi nghiêm trọng khi khởi tạo thành phần '{name}': {e}")
+                self._errors[name] = str(e)
+                return None
+            load_seconds = time.perf_counter() - start
+
+            self._instances[name] = instance
+            self._stats[name] = {
+                "load_seconds": round(load_seconds, 3),
+                "rss_delta_mb": round(_current_rss_mb() - rss_before, 1),
+                "parameters_mb": _parameter_size_mb(instance),
+                "warmup_seconds": None,
+            }
+            print(f"Khởi tạo '{name}' thành công sau {load_seconds:.2f}s.")
+            return instance
+
+    def warm_up(self, roles: Iterable[str] | None = None) -> None:
+        """
+        Khởi tạo trước các thành phần thuộc các role được chỉ định
+        và chạy một lượt suy luận giả để đo độ trễ lần gọi đầu tiên.
+        """
+        wanted = set(roles) if roles is not None else None
+        for name in self._factories:
+            if wanted is not None and not (self._roles[name] & wanted):
+                continue
+            instance = self.get(name)
+            warmup = self._warmups.get(name)
+            if instance is None or warmup is None:
+                continue
+            start = time.perf_counter()
+            try:
+                warmup(instance)
+                self._stats[name]["warmup_seconds"] = round(time.perf_counter() - start, 3)
+            except Exception as e:
+                print(f"Cảnh báo: warm-up cho '{name}' thất bại: {e}")
+
+    def override(self, name: str, instance: Any) -> None:
+        """
+        Thay thế một thành phần bằng instance có sẵn (dùng cho benchmark/stand-in).
+        """
+        with self._lock:
+            self._instances[name] = instance
+            self._errors.pop(name, None)
+
+    def reset(self, name: str | None = None) -> None:
+        with self._lock:
+            names = [name] if name else list(self._factories)
+            for n in names:
+                self._instances.pop(n, None)
+                self._errors.pop(n, None)
+                self._stats.pop(n, None)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def report(self) -> List[Dict[str, Any]]:
+        """
+        Báo cáo bộ nhớ/độ trễ của từng thành phần đã được tải.
+        """
+        rows = []
+        for name in self._factories:
+            row: Dict[str, Any] = {"name": name, "roles": sorted(self._roles[name])}
+            if name in self._instances:
+                row["status"] = "loaded"
+                row.update(self._stats.get(name, {}))
+            elif name in self._errors:
+                row["status"] = "failed"
+                row["error"] = self._errors[name]
+            else:
+                row["status"] = "not_loaded"
+            rows.append(row)
+        return rows
+
+    def print_report(self) -> None:
+        print("--- Báo cáo các model/client đã tải ---")
+        for row in self.report():
+            if row["status"] != "loaded":
+                print(f"  {row['name']}: {row['status']}")
+                continue
+            params = f"{row['parameters_mb']:.1f}MB" if row.get("parameters_mb") is not None else "n/a"
+            warmup = f"{row['warmup_seconds']:.3f}s" if row.get("warmup_seconds") is not None else "n/a"
+            print(
+                f"  {row['name']}: load={row['load_seconds']:.2f}s, "
+                f"rss+={row['rss_delta_mb']:.1f}MB, params={params}, warmup={warmup}"
+            )
+
+
+# ==============================================================================
+# ĐĂNG KÝ CÁC THÀNH PHẦN
+# ==============================================================================
+
+def _load_dense_model():
+    from sentence_transformers import SentenceTransformer
+    from .model_backends import embedding_backend_options, load_model
+    return load_model(SentenceTransformer, settings.EMBEDDING_MODEL_NAME, **embedding_backend_options())
+
+def _load_sparse_model():
+    from .model_backends import embedding_backend_options, load_model
+    if settings.SPARSE_ENCODING_MODE == "native":
+        try:
+            from sentence_transformers import SparseEncoder
+        except ImportError as e:
+            raise ImportError(
+                "SPARSE_ENCODING_MODE=native cần sentence-transformers>=5.0 (SparseEncoder)."
+            ) from e
+        return load_model(SparseEncoder, settings.SPARSE_VECTOR_MODEL_NAME, **embedding_backend_options())
+    from sentence_transformers import SentenceTransformer
+    return load_model(SentenceTransformer, settings.SPARSE_VECTOR_MODEL_NAME, **embedding_backend_options())
+
+def _load_reranker_model():
+    from .reranker import load_cross_encoder
+    return load_cross_encoder(
+        settings.RERANKER_MODEL_NAME,
+        backend=settings.RERANKER_BACKEND,
+        quantization=settings.RERANKER_ONNX_QUANTIZATION,
+        max_length=settings.RERANKER_MAX_LENGTH or None,
+    )
+
+def _load_qdrant_client():
+    from qdrant_client import QdrantClient
+    return QdrantClient(url=settings.QDRANT_URL, prefer_grpc=settings.QDRANT_PREFER_GRPC)
+
+def _load_async_qdrant_client():
+    from qdrant_client import AsyncQdrantClient
+    return AsyncQdrantClient(url=settings.QDRANT_URL, prefer_grpc=settings.QDRANT_PREFER_GRPC)
+
+def _load_async_tavily_client():
+    from tavily import AsyncTavilyClient
+    return AsyncTavilyClient(api_key=settings.TAVILY_API_KEY)
+
+def _load_pdf_partitioner():
+    # Import unstructured khá nặng (nltk, onnx...), chỉ tiến trình ingest mới cần
+    from unstructured.partition.pdf import partition_pdf
+    return partition_pdf
+
+def _load_llm():
+    from .llm import get_llm
+    llm = get_llm()
+    if llm is None:
+        raise RuntimeError("Không thể khởi tạo LLM. Kiểm tra API key và cấu hình.")
+    return llm
+
+
+registry = ModelRegistry()
+registry.register(
+    "dense_embedding_model", _load_dense_model,
+    roles=[QUERY_ROLE, INGESTION_ROLE],
+    warmup=lambda m: m.encode("warm-up"),
+)
+registry.register(
+    "sparse_embedding_model", _load_sparse_model,
+    # Với SPARSE_BACKEND="bm25" không cần model sparse, không warm-up
+    roles=[QUERY_ROLE, INGESTION_ROLE] if settings.SPARSE_BACKEND != "bm25" else [],
+    warmup=lambda m: m.encode("warm-up"),
+)
+registry.register(
+    "reranker_model", _load_reranker_model,
+    roles=[QUERY_ROLE],
+    warmup=lambda m: m.predict([["warm-up", "warm-up"]]),
+)
+registry.register("qdrant_client", _load_qdrant_client, roles=[QUERY_ROLE, INGESTION_ROLE])
+registry.register("async_qdrant_client", _load_async_qdrant_client, roles=[QUERY_ROLE])
+registry.register("async_tavily_client", _load_async_tavily_client, roles=[QUERY_ROLE])
+registry.register("llm", _load_llm, roles=[QUERY_ROLE])
+registry.register("pdf_partitioner", _load_pdf_partitioner, roles=[INGESTION_ROLE])
+
+
+# Các hàm truy cập tiện lợi
+def get_dense_embedding_model():
+    return registry.get("dense_embedding_model")
+
+def get_sparse_embedding_model():
+    return registry.get("sparse_embedding_model")
+
+def get_reranker_model():
+    return registry.get("reranker_model")
+
+def get_qdrant_client():
+    return registry.get("qdrant_client")
+
+def get_async_qdrant_client():
+    return registry.get("async_qdrant_client")
+
+def get_async_tavily_client():
+    return registry.get("async_tavily_client")
+
+def get_llm_instance():
+    return registry.get("llm")
+
+def get_pdf_partitioner():
+    return registry.get("pdf_partitioner")
@@ -0,0 +1,48 @@
+# backend/app/core/reranker.py
+
+from pathlib import Path
+
+import numpy as np
+
+from ..config import settings
+from .model_backends import load_model
+
+
+def load_cross_encoder(
+    model_name: str,
+    backend: str = "torch",
+    quantization: str = "",
+    max_length: int | None = None,
+    export_dir: str | Path | None = None,
+):
+    """
+    Tải CrossEncoder theo backend (xem app/core/model_backends.py). `max_length` giới hạn số token
+    của cặp (query, chunk): phần chunk vượt quá bị cắt khi tokenize.
+    """
+    from sentence_transformers import CrossEncoder
+
+    return load_model(
+        CrossEncoder, model_name, backend=backend, quantization=quantization,
+        export_dir=export_dir or settings.MODEL_EXPORT_DIR, max_length=max_length,
+    )
+
+
+def cosine_scores(query_vector: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+    return vectors @ query_vector / np.maximum(norms, 1e-12)
+
+
+def select_cascade_head(bi_scores: np.ndarray, top_k: int, margin: float, max_head: int) -> np.ndarray:
+    """
+    Tầng đầu của cascade: chỉ số các ứng viên mà điểm bi-encoder chưa đủ để loại, tức có điểm
+    >= (điểm của ứng viên thứ top_k) - margin, tối đa max(top_k, max_head) ứng viên, giảm dần theo điểm.
+    Ứng viên còn lại bị loại mà không cần chạy cross-encoder.
+    """
+    order = np.argsort(-bi_scores, kind="stable")
+    if len(order) <= top_k:
+        return order
+    threshold = bi_scores[order[top_k - 1]] - margin
+    head = order[bi_scores[order] >= threshold]
+    return head[:max(top_k, max_head)]
@@ -0,0 +1,95 @@
+# backend/app/core/routing.py
+
+import threading
+from dataclasses import dataclass
+from typing import Callable, List
+
+import numpy as np
+
+from ..config import settings
+
+DOCUMENT_SEARCH = "document_search"
+WEB_SEARCH = "web_search"
+
+# Các câu hỏi mẫu cho từng công cụ. Centroid embedding của mỗi nhóm được dùng
+# làm bộ phân loại nearest-centroid, không cần huấn luyện hay gọi LLM.
+DOCUMENT_SEARCH_EXAMPLES: List[str] = [
+    "Tài liệu này nói về nội dung gì?",
+    "Tóm tắt các ý chính của dự án.",
+    "Mục tiêu của dự án là gì?",
+    "Theo tài liệu, ngân sách được phân bổ như thế nào?",
+    "Chương 2 đề cập đến vấn đề gì?",
+    "Các thông số kỹ thuật của hệ thống là gì?",
+    "Summarize the main points of the report.",
+    "What does the document say about the project timeline?",
+    "Who is responsible for this module according to the specification?",
+]
+WEB_SEARCH_EXAMPLES: List[str] = [
+    "Tin tức mới nhất hôm nay là gì?",
+    "Thời tiết Hà Nội ngày mai thế nào?",
+    "Giá vàng hôm nay bao nhiêu?",
+    "Tỷ giá USD hiện tại là bao nhiêu?",
+    "Kết quả trận bóng đá tối qua?",
+    "What is the latest news about the stock market?",
+    "What is the weather forecast for this weekend?",
+    "Who won the election this year?",
+    "Current price of bitcoin",
+]
+
+
+@dataclass
+class RouteDecision:
+    tool: str | None  # None nghĩa là chưa chắc chắn
+    margin: float  # similarity(web) - similarity(document)
+
+
+class FastRouter:
+    """
+    Bộ định tuyến cục bộ dựa trên dense embedding của câu hỏi:
+    so sánh cosine similarity với centroid của các câu hỏi mẫu cho mỗi công cụ.
+    Nếu chênh lệch nhỏ hơn ROUTER_EMBEDDING_MARGIN, quyết định được coi là chưa chắc chắn.
+    """
+
+    def __init__(self) -> None:
+        # (centroid document_search, centroid web_search), gán một lần khi cả hai đã tính xong để
+        # request đọc không khóa (is_ready/classify) không bao giờ thấy trạng thái dở dang
+        self._centroids: tuple[np.ndarray, np.ndarray] | None = None
+        self._lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        return self._centroids is not None
+
+    def build_prototypes(self, encode: Callable[[List[str]], np.ndarray]) -> None:
+        """
+        Tính centroid cho mỗi nhóm câu hỏi mẫu (chạy một lần, trong executor).
+        """
+        with self._lock:
+            if self.is_ready():
+                return
+            document_centroid = _centroid(encode(DOCUMENT_SEARCH_EXAMPLES))
+            web_centroid = _centroid(encode(WEB_SEARCH_EXAMPLES))
+            self._centroids = (document_centroid, web_centroid)
+
+    def classify(self, query_embedding: np.ndarray) -> RouteDecision:
+        document_centroid, web_centroid = self._centroids
+        vector = _unit(np.asarray(query_embedding, dtype=np.float32))
+        margin = float(vector @ web_centroid - vector @ document_centroid)
+        if margin >= settings.ROUTER_EMBEDDING_MARGIN:
+            return RouteDecision(WEB_SEARCH, margin)
+        if margin <= -settings.ROUTER_EMBEDDING_MARGIN:
+            return RouteDecision(DOCUMENT_SEARCH, margin)
+        return RouteDecision(None, margin)
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _centroid(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return _unit(embeddings.mean(axis=0))
+
+
+fast_router = FastRouter()
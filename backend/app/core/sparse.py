@@ -0,0 +1,83 @@
+# backend/app/core/sparse.py
+
+from typing import List, Sequence
+
+import numpy as np
+from qdrant_client import models
+
+from ..config import settings
+from .model_backends import embedding_model_key
+
+# Hai cách tạo sparse vector (SPARSE_ENCODING_MODE):
+# - "legacy": SentenceTransformer.encode trả về ma trận dense (batch x chiều); các phần tử > 0
+#   được giữ làm sparse vector. Tương thích với dữ liệu đã ingest trước đây.
+# - "native": sentence_transformers.SparseEncoder (SPLADE) trả về torch sparse tensor trên
+#   toàn bộ vocabulary, không bao giờ tạo vector dense kích thước vocabulary.
+# Hai chế độ tạo ra không gian vector khác nhau: đổi chế độ cần ingest lại toàn bộ tài liệu.
+
+
+def uses_sparse_model() -> bool:
+    """
+    Nhánh sparse dùng model (sparse vector "text" trong Qdrant) hay chỉ mục BM25 cục bộ (SPARSE_BACKEND).
+    """
+    return settings.SPARSE_BACKEND != "bm25"
+
+
+def sparse_model_key() -> str:
+    """
+    Tên dùng trong khóa cache cho sparse model (phân biệt theo backend suy luận và chế độ encode).
+    """
+    return f"{embedding_model_key(settings.SPARSE_VECTOR_MODEL_NAME)}#{settings.SPARSE_ENCODING_MODE}"
+
+
+def rows_to_sparse_vectors(
+    row_ids: np.ndarray, indices: np.ndarray, values: np.ndarray, n_rows: int
+) -> List[models.SparseVector]:
+    """
+    Chuyển các phần tử khác 0 dạng COO (row_ids đã sắp xếp tăng dần) thành một SparseVector cho mỗi hàng.
+    Ranh giới giữa các hàng được tìm bằng một lần searchsorted cho cả batch.
+    """
+    bounds = np.searchsorted(row_ids, np.arange(n_rows + 1))
+    indices = indices.astype(np.int64, copy=False).tolist()
+    values = values.astype(np.float32, copy=False).tolist()
+    return [
+        models.SparseVector(indices=indices[start:end], values=values[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def dense_rows_to_sparse_vectors(matrix: np.ndarray) -> List[models.SparseVector]:
+    """
+    Chế độ "legacy": giữ các phần tử > 0 của từng hàng, vector hóa trên toàn bộ batch.
+    """
+    matrix = np.atleast_2d(np.asarray(matrix))
+    # flatnonzero + divmod nhanh hơn nhiều so với np.nonzero trên mảng 2 chiều
+    flat_positions = np.flatnonzero(matrix > 0)
+    row_ids, indices = np.divmod(flat_positions, matrix.shape[1])
+    return rows_to_sparse_vectors(row_ids, indices, matrix.ravel()[flat_positions], matrix.shape[0])
+
+
+def sparse_tensor_to_sparse_vectors(tensor) -> List[models.SparseVector]:
+    """
+    Chế độ "native": chuyển torch sparse COO tensor (batch x vocab) thành SparseVector.
+    """
+    tensor = tensor.coalesce()  # sắp xếp theo (hàng, cột), gộp phần tử trùng
+    coo_indices = tensor.indices().cpu().numpy()
+    coo_values = tensor.values().float().cpu().numpy()
+    keep = coo_values > 0
+    return rows_to_sparse_vectors(coo_indices[0][keep], coo_indices[1][keep], coo_values[keep], tensor.shape[0])
+
+
+def encode_sparse(
+    model, texts: Sequence[str], is_query: bool = False, batch_size: int = 32
+) -> List[models.SparseVector]:
+    """
+    Encode một batch text thành SparseVector theo SPARSE_ENCODING_MODE.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    if settings.SPARSE_ENCODING_MODE == "native":
+        encode = getattr(model, "encode_query" if is_query else "encode_document", model.encode)
+        return sparse_tensor_to_sparse_vectors(encode(texts, batch_size=batch_size, convert_to_sparse_tensor=True))
+    return dense_rows_to_sparse_vectors(model.encode(texts, batch_size=batch_size))
@@ -1 +1 @@
-from . import crud_user, crud_document
\ No newline at end of file
+from . import crud_user, crud_document, crud_chunk
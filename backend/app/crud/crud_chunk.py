@@ -0,0 +1,80 @@
+# backend/app/crud/crud_chunk.py
+
+from typing import Dict, List
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .. import models
+
+def upsert_chunks(db: Session, document_id: int, content_hash: str | None, chunks: Dict[str, str]) -> None:
+    """
+    Ghi các chunk {id điểm: text} của một tài liệu. Chunk đã có (id suy ra từ nội dung nên text không đổi)
+    chỉ được gắn content_hash của phiên bản hiện tại.
+    """
+    if not chunks:
+        return
+    statement = insert(models.DocumentChunk)
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.DocumentChunk.id],
+        set_={"content_hash": statement.excluded.content_hash},
+    )
+    db.execute(statement, [
+        {"id": chunk_id, "document_id": document_id, "content_hash": content_hash, "text": text}
+        for chunk_id, text in chunks.items()
+    ])
+    db.commit()
+
+def delete_stale_chunks(db: Session, document_id: int, keep_content_hash: str | None) -> int:
+    """
+    Xóa các chunk của tài liệu không thuộc phiên bản nội dung hiện tại. Trả về số chunk đã xóa.
+    """
+    deleted = (
+        db.query(models.DocumentChunk)
+        .filter(
+            models.DocumentChunk.document_id == document_id,
+            models.DocumentChunk.content_hash.is_distinct_from(keep_content_hash),
+        )
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+def get_chunks(db: Session, chunk_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Lấy text, document_id và filename của nhiều chunk trong một truy vấn. Chunk không có trong kho bị bỏ qua.
+    """
+    if not chunk_ids:
+        return {}
+    rows = (
+        db.query(
+            models.DocumentChunk.id, models.DocumentChunk.text,
+            models.DocumentChunk.document_id, models.Document.filename,
+        )
+        .join(models.Document, models.Document.id == models.DocumentChunk.document_id)
+        .filter(models.DocumentChunk.id.in_(chunk_ids))
+        .all()
+    )
+    return {
+        row.id: {"text": row.text, "document_id": row.document_id, "filename": row.filename}
+        for row in rows
+    }
+
+async def aget_chunks(db: AsyncSession, chunk_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Phiên bản bất đồng bộ của get_chunks (dùng trong luồng chat).
+    """
+    if not chunk_ids:
+        return {}
+    result = await db.execute(
+        select(
+            models.DocumentChunk.id, models.DocumentChunk.text,
+            models.DocumentChunk.document_id, models.Document.filename,
+        )
+        .join(models.Document, models.Document.id == models.DocumentChunk.document_id)
+        .where(models.DocumentChunk.id.in_(chunk_ids))
+    )
+    return {
+        row.id: {"text": row.text, "document_id": row.document_id, "filename": row.filename}
+        for row in result
+    }
@@ -1,16 +1,26 @@
 # backend/app/crud/crud_document.py
 
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List # <-- Đảm bảo đã import List
 from .. import models, schemas
+from ..config import settings
 
-def create_document(db: Session, document_in: schemas.DocumentCreate, owner_id: int) -> models.Document:
-    db_document = models.Document(
+def _new_document(document_in: schemas.DocumentCreate, owner_id: int) -> models.Document:
+    return models.Document(
         filename=document_in.filename,
         filepath=document_in.filepath,
+        content_hash=document_in.content_hash,
         status=models.DocumentStatus.UPLOADING,
         owner_id=owner_id
     )
+
+def create_document(db: Session, document_in: schemas.DocumentCreate, owner_id: int) -> models.Document:
+    db_document = _new_document(document_in, owner_id)
     db.add(db_document)
     db.commit()
     db.refresh(db_document)
@@ -19,6 +29,53 @@ def create_document(db: Session, document_in: schemas.DocumentCreate, owner_id:
 def get_document(db: Session, document_id: int) -> models.Document | None:
     return db.query(models.Document).filter(models.Document.id == document_id).first()
 
+def get_document_by_content_hash(db: Session, owner_id: int, content_hash: str) -> models.Document | None:
+    return (
+        db.query(models.Document)
+        .filter(models.Document.owner_id == owner_id, models.Document.content_hash == content_hash)
+        .order_by(models.Document.id.desc())
+        .first()
+    )
+
+def get_document_by_filename(db: Session, owner_id: int, filename: str) -> models.Document | None:
+    return (
+        db.query(models.Document)
+        .filter(models.Document.owner_id == owner_id, models.Document.filename == filename)
+        .order_by(models.Document.id.desc())
+        .first()
+    )
+
+def _reset_for_requeue(db_document: models.Document, filepath: str | None, content_hash: str | None) -> None:
+    if filepath is not None:
+        db_document.filepath = filepath
+    if content_hash is not None:
+        db_document.content_hash = content_hash
+    db_document.status = models.DocumentStatus.UPLOADING
+    db_document.failure_reason = None
+    db_document.attempts = 0
+    db_document.next_attempt_at = None
+    db_document.progress = 0
+    db_document.pages_processed = 0
+    db_document.page_count = None
+
+def requeue_document(
+    db: Session, db_document: models.Document, filepath: str | None = None, content_hash: str | None = None
+) -> models.Document:
+    """
+    Đưa một tài liệu đã có về lại hàng đợi ingest, tùy chọn với file/phiên bản nội dung mới.
+    Các chunk không đổi được giữ nguyên trong Qdrant (xem ingest_document).
+    """
+    _reset_for_requeue(db_document, filepath, content_hash)
+    db.commit()
+    db.refresh(db_document)
+    return db_document
+
+def update_document_content_hash(db: Session, document_id: int, content_hash: str) -> None:
+    db.query(models.Document).filter(models.Document.id == document_id).update(
+        {"content_hash": content_hash}, synchronize_session=False
+    )
+    db.commit()
+
 def update_document_status(
     db: Session, document_id: int, status: models.DocumentStatus, reason: str | None = None
 ) -> models.Document | None:
@@ -42,4 +99,269 @@ def get_documents_by_owner(db: Session, owner_id: int) -> List[models.Document]:
     """
     Lấy danh sách tất cả các tài liệu của một người dùng.
     """
-    return db.query(models.Document).filter(models.Document.owner_id == owner_id).order_by(models.Document.created_at.desc()).all()
\ No newline at end of file
+    return db.query(models.Document).filter(models.Document.owner_id == owner_id).order_by(models.Document.created_at.desc()).all()
+
+# ==============================================================================
+# PHIÊN BẢN BẤT ĐỒNG BỘ (AsyncSession, dùng trong các endpoint async)
+# ==============================================================================
+
+async def acreate_document(db: AsyncSession, document_in: schemas.DocumentCreate, owner_id: int) -> models.Document:
+    db_document = _new_document(document_in, owner_id)
+    db.add(db_document)
+    await db.commit()
+    await db.refresh(db_document)
+    return db_document
+
+async def aget_document(db: AsyncSession, document_id: int) -> models.Document | None:
+    return await db.get(models.Document, document_id)
+
+async def aget_document_by_content_hash(db: AsyncSession, owner_id: int, content_hash: str) -> models.Document | None:
+    result = await db.execute(
+        select(models.Document)
+        .where(models.Document.owner_id == owner_id, models.Document.content_hash == content_hash)
+        .order_by(models.Document.id.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+async def arequeue_document(
+    db: AsyncSession, db_document: models.Document, filepath: str | None = None, content_hash: str | None = None
+) -> models.Document:
+    _reset_for_requeue(db_document, filepath, content_hash)
+    await db.commit()
+    await db.refresh(db_document)
+    return db_document
+
+async def adelete_document(db: AsyncSession, document_id: int) -> models.Document | None:
+    db_document = await aget_document(db, document_id)
+    if db_document:
+        await db.delete(db_document)
+        await db.commit()
+    return db_document
+
+async def aget_corpus_marker(db: AsyncSession, owner_id: int) -> tuple[int, datetime | None]:
+    """
+    Dấu thay đổi kho tài liệu của owner (số tài liệu, thời điểm cập nhật gần nhất), dùng làm một phần
+    phiên bản corpus của cache khi tài liệu được ingest ở tiến trình khác (xem cache.get_corpus_version).
+    """
+    result = await db.execute(
+        select(func.count(), func.max(func.coalesce(models.Document.updated_at, models.Document.created_at)))
+        .where(models.Document.owner_id == owner_id)
+    )
+    count, last_changed = result.one()
+    return count, last_changed
+
+# ==============================================================================
+# DANH SÁCH TÀI LIỆU (PHÂN TRANG KEYSET)
+# ==============================================================================
+# Trang sau bắt đầu ngay sau (created_at, id) của tài liệu cuối trang trước, nên mỗi trang là một lần
+# quét đoạn index (owner_id, [status,] created_at, id) dài limit + 1, bất kể trang sâu đến đâu.
+# Chỉ đọc các cột của DocumentResponse (không đọc failure_reason, không tạo object ORM).
+
+DOCUMENT_LIST_COLUMNS = (
+    models.Document.id,
+    models.Document.filename,
+    models.Document.filepath,
+    models.Document.status,
+    models.Document.progress,
+    models.Document.created_at,
+)
+
+def encode_document_cursor(created_at: datetime, document_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), document_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_document_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Giải mã con trỏ do encode_document_cursor tạo ra; ValueError nếu con trỏ không hợp lệ.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, document_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(document_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Con trỏ phân trang không hợp lệ: {cursor}") from e
+
+async def aget_documents_page(
+    db: AsyncSession, owner_id: int, limit: int,
+    after: tuple[datetime, int] | None = None, status: models.DocumentStatus | None = None,
+) -> tuple[list, tuple[datetime, int] | None]:
+    """
+    Lấy một trang tài liệu của người dùng, mới nhất trước. Trả về (các dòng, vị trí bắt đầu trang sau
+    hoặc None nếu đã hết).
+    """
+    query = select(*DOCUMENT_LIST_COLUMNS).where(models.Document.owner_id == owner_id)
+    if status is not None:
+        query = query.where(models.Document.status == status)
+    if after is not None:
+        query = query.where(tuple_(models.Document.created_at, models.Document.id) < tuple_(*after))
+    query = query.order_by(models.Document.created_at.desc(), models.Document.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].created_at, rows[-1].id)
+
+# ==============================================================================
+# HÀNG ĐỢI INGEST (DỰA TRÊN BẢNG documents)
+# ==============================================================================
+# Tài liệu ở trạng thái UPLOADING là job đang chờ. Worker nhận job bằng
+# SELECT ... FOR UPDATE SKIP LOCKED nên nhiều worker có thể chạy song song mà không nhận trùng.
+
+def _claim(db: Session, query, worker_id: str) -> models.Document | None:
+    db_document = query.with_for_update(skip_locked=True).first()
+    if db_document:
+        now = datetime.now(timezone.utc)
+        db_document.status = models.DocumentStatus.PROCESSING
+        db_document.attempts = (db_document.attempts or 0) + 1
+        db_document.locked_by = worker_id
+        db_document.locked_at = now
+        db_document.next_attempt_at = None
+        db.commit()
+        db.refresh(db_document)
+    else:
+        db.rollback()
+    return db_document
+
+def claim_next_document(db: Session, worker_id: str) -> models.Document | None:
+    """
+    Nhận job cũ nhất đang chờ và đã đến thời điểm thử lại.
+    """
+    now = datetime.now(timezone.utc)
+    query = (
+        db.query(models.Document)
+        .filter(models.Document.status == models.DocumentStatus.UPLOADING)
+        .filter((models.Document.next_attempt_at.is_(None)) | (models.Document.next_attempt_at <= now))
+        .order_by(models.Document.created_at, models.Document.id)
+    )
+    return _claim(db, query, worker_id)
+
+def claim_document(db: Session, document_id: int, worker_id: str) -> models.Document | None:
+    """
+    Nhận một job cụ thể (dùng khi xử lý trực tiếp, không qua worker).
+    Trả về None nếu tài liệu không còn ở trạng thái chờ (đã có worker khác nhận).
+    """
+    query = db.query(models.Document).filter(
+        models.Document.id == document_id,
+        models.Document.status == models.DocumentStatus.UPLOADING,
+    )
+    return _claim(db, query, worker_id)
+
+def update_document_progress(
+    db: Session, document_id: int, progress: int,
+    pages_processed: int | None = None, page_count: int | None = None
+) -> None:
+    """
+    Cập nhật tiến độ (và checkpoint số trang đã xử lý); đồng thời làm mới heartbeat (locked_at) của worker.
+    """
+    values = {"progress": progress, "locked_at": datetime.now(timezone.utc)}
+    if pages_processed is not None:
+        values["pages_processed"] = pages_processed
+    if page_count is not None:
+        values["page_count"] = page_count
+    db.query(models.Document).filter(models.Document.id == document_id).update(values, synchronize_session=False)
+    db.commit()
+
+def heartbeat_document_jobs(db: Session, document_ids: List[int], worker_id: str) -> None:
+    """
+    Làm mới heartbeat (locked_at) của các job worker đang xử lý, độc lập với tiến độ: một batch trang chậm
+    không làm job bị coi là treo và bị xử lý lại. updated_at giữ nguyên (chỉ đổi khi nội dung/tiến độ đổi).
+    """
+    if not document_ids:
+        return
+    db.query(models.Document).filter(
+        models.Document.id.in_(document_ids),
+        models.Document.status == models.DocumentStatus.PROCESSING,
+        models.Document.locked_by == worker_id,
+    ).update(
+        {"locked_at": datetime.now(timezone.utc), "updated_at": models.Document.updated_at},
+        synchronize_session=False,
+    )
+    db.commit()
+
+def _get_held_job(db: Session, document_id: int, worker_id: str) -> models.Document | None:
+    """
+    Khóa và trả về job nếu nó vẫn PROCESSING và do `worker_id` giữ; None nếu job đã bị đưa lại hàng đợi
+    (và có thể đã được worker khác nhận), đã xong hoặc đã lỗi.
+    """
+    return (
+        db.query(models.Document)
+        .filter(
+            models.Document.id == document_id,
+            models.Document.status == models.DocumentStatus.PROCESSING,
+            models.Document.locked_by == worker_id,
+        )
+        .with_for_update()
+        .first()
+    )
+
+def release_document_job(db: Session, document_id: int, worker_id: str, reason: str) -> models.Document | None:
+    """
+    Trả lại một job mà tiến trình xử lý chết giữa chừng (ví dụ hết bộ nhớ), tính là một lần thử thất bại.
+    Bỏ qua nếu job không còn do worker này giữ (đã xong, đã lỗi hoặc đã bị đưa lại hàng đợi).
+    """
+    return fail_document_job(db, document_id, worker_id, reason, retry=True)
+
+def complete_document_job(db: Session, document_id: int, worker_id: str) -> models.Document | None:
+    """
+    Đánh dấu job hoàn tất. Trả về None (không thay đổi gì) nếu job không còn do worker này giữ.
+    """
+    db_document = _get_held_job(db, document_id, worker_id)
+    if not db_document:
+        db.rollback()
+        return None
+    db_document.status = models.DocumentStatus.COMPLETED
+    db_document.failure_reason = None
+    db_document.progress = 100
+    db_document.locked_by = None
+    db_document.locked_at = None
+    db.commit()
+    db.refresh(db_document)
+    return db_document
+
+def fail_document_job(
+    db: Session, document_id: int, worker_id: str, reason: str, retry: bool = True
+) -> models.Document | None:
+    """
+    Ghi nhận lỗi của một job. Nếu còn lượt thử (INGESTION_MAX_ATTEMPTS), job quay lại hàng đợi
+    với thời gian chờ tăng theo cấp số nhân; nếu không, tài liệu chuyển sang FAILED.
+    Trả về None (không thay đổi gì) nếu job không còn do worker này giữ.
+    """
+    db_document = _get_held_job(db, document_id, worker_id)
+    if not db_document:
+        db.rollback()
+        return None
+    attempts = db_document.attempts or 0
+    if retry and attempts < settings.INGESTION_MAX_ATTEMPTS:
+        delay = settings.INGESTION_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+        db_document.status = models.DocumentStatus.UPLOADING
+        db_document.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+    else:
+        db_document.status = models.DocumentStatus.FAILED
+    db_document.failure_reason = reason
+    db_document.locked_by = None
+    db_document.locked_at = None
+    db.commit()
+    db.refresh(db_document)
+    return db_document
+
+def requeue_stuck_documents(db: Session, stale_after_seconds: float) -> List[int]:
+    """
+    Đưa các tài liệu PROCESSING không còn heartbeat (worker bị crash/khởi động lại)
+    về lại hàng đợi. Trả về danh sách document_id đã được đưa lại.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_after_seconds)
+    stuck = (
+        db.query(models.Document)
+        .filter(models.Document.status == models.DocumentStatus.PROCESSING)
+        .filter((models.Document.locked_at.is_(None)) | (models.Document.locked_at < cutoff))
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for db_document in stuck:
+        db_document.status = models.DocumentStatus.UPLOADING
+        db_document.locked_by = None
+        db_document.locked_at = None
+        db_document.next_attempt_at = None
+    db.commit()
+    return [db_document.id for db_document in stuck]
@@ -1,4 +1,7 @@
 # backend/app/crud/crud_user.py
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from .. import models, schemas
 from ..core.security import get_password_hash
@@ -12,4 +15,19 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+# --- Phiên bản bất đồng bộ (AsyncSession, dùng trong các endpoint async) ---
+
+async def aget_user_by_email(db: AsyncSession, email: str) -> models.User | None:
+    result = await db.execute(select(models.User).where(models.User.email == email).limit(1))
+    return result.scalars().first()
+
+async def acreate_user(db: AsyncSession, user: schemas.UserCreate) -> models.User:
+    # bcrypt tốn CPU (hàng trăm ms), không chạy trên event loop
+    hashed_password = await asyncio.to_thread(get_password_hash, user.password)
+    db_user = models.User(email=user.email, hashed_password=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
@@ -1,7 +1,38 @@
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from .base_class import Base
 from .session import engine
 
+# create_all không thêm cột mới vào bảng đã tồn tại.
+# Các cột được bổ sung sau này được thêm bằng ALTER TABLE ... IF NOT EXISTS (PostgreSQL).
+_ADDED_COLUMNS = {
+    "documents": [
+        "attempts INTEGER NOT NULL DEFAULT 0",
+        "next_attempt_at TIMESTAMP WITH TIME ZONE",
+        "progress INTEGER NOT NULL DEFAULT 0",
+        "locked_by VARCHAR",
+        "locked_at TIMESTAMP WITH TIME ZONE",
+        "page_count INTEGER",
+        "pages_processed INTEGER NOT NULL DEFAULT 0",
+        "content_hash VARCHAR(64)",
+    ],
+}
+
+_ADDED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_documents_owner_id_created_at_id ON documents (owner_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_documents_owner_id_status_created_at_id ON documents (owner_id, status, created_at, id)",
+]
+
+def _add_missing_columns() -> None:
+    with engine.begin() as connection:
+        for table, columns in _ADDED_COLUMNS.items():
+            for column in columns:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column}"))
+        for statement in _ADDED_INDEXES:
+            connection.execute(text(statement))
+
 def init_db(db: Session) -> None:
     # Tạo tất cả các bảng trong database
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from ..config import settings
 
@@ -7,4 +8,49 @@ from ..config import settings
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
 
 # Tạo một lớp SessionLocal, mỗi instance của lớp này sẽ là một phiên làm việc với database
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# ==============================================================================
+# ENGINE BẤT ĐỒNG BỘ (API)
+# ==============================================================================
+# Các endpoint async dùng AsyncSession để truy vấn không chặn event loop.
+# Engine được tạo ở lần dùng đầu tiên, nên worker/script (chỉ dùng SessionLocal) không cần asyncpg.
+
+_async_engine = None
+_async_sessionmaker = None
+
+
+def async_database_url() -> str:
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+    url = make_url(settings.DATABASE_URL)
+    if url.drivername in ("postgresql", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
+def get_async_sessionmaker():
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        _async_engine = create_async_engine(
+            async_database_url(),
+            pool_size=settings.DATABASE_POOL_SIZE,
+            max_overflow=settings.DATABASE_MAX_OVERFLOW,
+            pool_timeout=settings.DATABASE_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DATABASE_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=True,
+        )
+        # expire_on_commit=False: object trả về từ endpoint vẫn đọc được thuộc tính sau commit
+        # mà không phát sinh truy vấn ngầm (không được phép với AsyncSession)
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_sessionmaker
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_sessionmaker = None
@@ -1,15 +1,25 @@
 # backend/app/main.py
 
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
 # Các import cần thiết cho logic chính
-from .core.llm import get_llm
-from .db.session import SessionLocal
+from .config import settings
+from .core.registry import (
+    registry, get_llm_instance, get_async_qdrant_client, get_dense_embedding_model, QUERY_ROLE, INGESTION_ROLE
+)
+from .core.routing import fast_router
+from .core.condense import load_token_encoder
+from .core.executor import shutdown_inference_executor
+from .core.rag import get_batching_stats, get_stage_cache_stats
+from .core.answer_cache import answer_cache
+from .db.session import SessionLocal, dispose_async_engine
 from .db.init_db import init_db
 from .core.ingestion import ensure_qdrant_collection_exists
 from .api.v1.endpoints import documents, chat, auth 
+from .api.deps import get_auth_cache_stats
 from fastapi import APIRouter # Đảm bảo APIRouter được import
 
 # Sử dụng Lifespan context manager để xử lý các tác vụ khởi động và tắt
@@ -22,8 +32,20 @@ async def lifespan(app: FastAPI):
     print("Đang khởi tạo Qdrant collection...")
     ensure_qdrant_collection_exists()
     print("Khởi tạo Qdrant collection thành công.")
+    print(f"Đang warm-up các model (chế độ: {settings.MODEL_LOADING_MODE})...")
+    if settings.MODEL_LOADING_MODE == "lazy" or settings.INGESTION_MODE == "queue":
+        # Ở chế độ "queue", tài liệu được xử lý bởi worker riêng nên API chỉ cần thành phần truy vấn
+        registry.warm_up([QUERY_ROLE])
+    else:
+        registry.warm_up([QUERY_ROLE, INGESTION_ROLE])
+    registry.print_report()
+    if settings.ROUTER_MODE != "llm" and get_dense_embedding_model():
+        print("Đang chuẩn bị bộ định tuyến cục bộ...")
+        fast_router.build_prototypes(get_dense_embedding_model().encode)
+    # tiktoken có thể tải file BPE qua mạng lần đầu: chạy ngoài event loop
+    await asyncio.to_thread(load_token_encoder)
     print("Đang khởi tạo LLM...")
-    app.state.llm = get_llm()
+    app.state.llm = get_llm_instance()
     if app.state.llm is None:
         # Trong môi trường production, bạn có thể muốn ghi log lỗi thay vì raise
         # Hoặc có một cơ chế retry/fallback
@@ -34,6 +56,10 @@ async def lifespan(app: FastAPI):
     print("--- Server đã sẵn sàng ---")
     yield
     print("--- Server đang tắt ---")
+    if registry.is_loaded("async_qdrant_client"):
+        await get_async_qdrant_client().close()
+    await dispose_async_engine()
+    shutdown_inference_executor()
 
 # Khởi tạo ứng dụng FastAPI với lifespan
 # Bỏ hoàn toàn openapi_extra
@@ -58,6 +84,7 @@ app.add_middleware(
     allow_credentials=True, # Cho phép gửi cookie (nếu có)
     allow_methods=["*"],    # Cho phép tất cả các phương thức (GET, POST, PUT, DELETE, OPTIONS, ...)
     allow_headers=["*"],    # Cho phép tất cả các header
+    expose_headers=["X-Next-Cursor"],  # Cho phép frontend đọc con trỏ phân trang của GET /documents/
 )
 # ----------------------------------
 
@@ -74,4 +101,30 @@ app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/", tags=["Root"])
 async def read_root():
-    return {"message": "Chào mừng đến với RAG Fullstack API! Truy cập /docs để xem tài liệu API."}
\ No newline at end of file
+    return {"message": "Chào mừng đến với RAG Fullstack API! Truy cập /docs để xem tài liệu API."}
+
+@app.get("/health/models", tags=["Root"])
+async def read_model_report():
+    """
+    Báo cáo trạng thái, thời gian tải và bộ nhớ của các model/client trong tiến trình.
+    """
+    return {"mode": settings.MODEL_LOADING_MODE, "components": registry.report()}
+
+@app.get("/health/batching", tags=["Root"])
+async def read_batching_stats():
+    """
+    Thống kê micro-batching (số request, số batch, kích thước batch trung bình).
+    """
+    return {"enabled": settings.MICRO_BATCHING_ENABLED, "batchers": get_batching_stats()}
+
+@app.get("/health/cache", tags=["Root"])
+async def read_cache_stats():
+    """
+    Thống kê cache câu trả lời (trúng exact/semantic), cache của từng stage truy xuất
+    (embedding truy vấn dense/sparse, kết quả đã rerank) và cache người dùng đã xác thực.
+    """
+    return {
+        "answer_cache": {"enabled": settings.ANSWER_CACHE_ENABLED, **answer_cache.stats()},
+        "stage_caches": get_stage_cache_stats(),
+        "auth_user_cache": get_auth_cache_stats(),
+    }
\ No newline at end of file
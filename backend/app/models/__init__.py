@@ -1,4 +1,5 @@
 # backend/app/models/__init__.py
 
 from .user import User
-from .document import Document, DocumentStatus
\ No newline at end of file
+from .document import Document, DocumentStatus
+from .chunk import DocumentChunk
@@ -0,0 +1,18 @@
+# backend/app/models/chunk.py
+
+from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from ..db.base_class import Base
+
+class DocumentChunk(Base):
+    """
+    Nội dung một chunk (kho chunk, CHUNK_STORE="postgres").
+    Id trùng với id điểm trong Qdrant; payload Qdrant chỉ giữ các trường dùng để lọc.
+    """
+    __tablename__ = "document_chunks"
+
+    id = Column(String(36), primary_key=True)
+    # Xóa tài liệu thì các chunk bị xóa theo (ON DELETE CASCADE)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    # Phiên bản nội dung gần nhất có chunk này (giống payload "content_hash" trong Qdrant)
+    content_hash = Column(String(64), nullable=True)
+    text = Column(Text, nullable=False)
@@ -1,7 +1,7 @@
 # backend/app/models/document.py
 
 import enum
-from sqlalchemy import Column, Integer, String, DateTime, func, Enum, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, func, Enum, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from ..db.base_class import Base
 
@@ -16,10 +16,17 @@ class Document(Base):
     Model SQLAlchemy đại diện cho một tài liệu được upload.
     """
     __tablename__ = "documents"
+    __table_args__ = (
+        # Danh sách tài liệu của người dùng, phân trang keyset theo (created_at, id), có hoặc không lọc trạng thái
+        Index("ix_documents_owner_id_created_at_id", "owner_id", "created_at", "id"),
+        Index("ix_documents_owner_id_status_created_at_id", "owner_id", "status", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True, nullable=False)
     filepath = Column(String, unique=True, nullable=False)
+    # SHA-256 nội dung file: bỏ qua upload/ingest lại khi file không thay đổi
+    content_hash = Column(String(64), index=True, nullable=True)
     
     status = Column(
         Enum(DocumentStatus, name="documentstatus_enum", create_constraint=True), 
@@ -28,6 +35,16 @@ class Document(Base):
     )
     
     failure_reason = Column(Text, nullable=True)
+
+    # Trạng thái job ingest trong hàng đợi (UPLOADING = đang chờ xử lý)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)  # Thời điểm sớm nhất được thử lại
+    progress = Column(Integer, nullable=False, default=0, server_default="0")  # Phần trăm hoàn thành (0-100)
+    locked_by = Column(String, nullable=True)  # Worker đang xử lý
+    locked_at = Column(DateTime(timezone=True), nullable=True)  # Heartbeat gần nhất của worker
+    # Checkpoint của pipeline ingest streaming: số trang đầu tiên đã nằm trọn trong Qdrant
+    page_count = Column(Integer, nullable=True)
+    pages_processed = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
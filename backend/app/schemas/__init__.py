@@ -1,4 +1,4 @@
 from .token import Token, TokenData
 from .user import UserCreate, UserResponse
 from .document import DocumentCreate, DocumentResponse
-from .chat import ChatRequest, ChatResponse, Source
\ No newline at end of file
+from .chat import ChatRequest, ChatResponse, ChatStreamEvent, Source
\ No newline at end of file
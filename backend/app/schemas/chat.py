@@ -1,7 +1,7 @@
 # backend/app/schemas/chat.py
 
 from pydantic import BaseModel, Field
-from typing import List, Tuple
+from typing import Any, Dict, List, Literal, Tuple
 
 # ==============================================================================
 # SCHEMAS CHO YÊU CẦU (REQUEST)
@@ -51,4 +51,21 @@ class ChatResponse(BaseModel):
     Schema cho phản hồi cuối cùng của API chat, bao gồm cả câu trả lời và nguồn trích dẫn.
     """
     answer: str = Field(..., description="Câu trả lời do LLM tạo ra, có thể chứa các trích dẫn dạng [Nguồn x].")
-    sources: List[Source] = Field(..., description="Danh sách các nguồn (chunks) đã được sử dụng để tạo ra câu trả lời.")
\ No newline at end of file
+    sources: List[Source] = Field(..., description="Danh sách các nguồn (chunks) đã được sử dụng để tạo ra câu trả lời.")
+    metadata: Dict[str, Any] | None = Field(
+        default=None,
+        description="Thông tin thực thi: công cụ đã dùng, tầng cache trúng (nếu có), thời gian từng stage (ms)."
+    )
+
+class ChatStreamEvent(BaseModel):
+    """
+    Schema cho một sự kiện trong phản hồi streaming (NDJSON, mỗi dòng một sự kiện).
+    - "sources": danh sách nguồn, gửi ngay sau khi truy xuất và rerank xong.
+    - "token": một phần câu trả lời do LLM sinh ra.
+    - "done": kết thúc câu trả lời, kèm `metadata` (thời gian từng stage).
+    - "error": có lỗi xảy ra, `content` chứa thông báo lỗi.
+    """
+    type: Literal["sources", "token", "done", "error"] = Field(..., description="Loại sự kiện.")
+    content: str | None = Field(default=None, description="Nội dung token hoặc thông báo lỗi.")
+    sources: List[Source] | None = Field(default=None, description="Danh sách nguồn (chỉ có ở sự kiện 'sources').")
+    metadata: Dict[str, Any] | None = Field(default=None, description="Metadata thực thi (chỉ có ở sự kiện 'done').")
\ No newline at end of file
@@ -7,11 +7,13 @@ class DocumentBase(BaseModel):
 
 class DocumentCreate(DocumentBase):
     filepath: str
+    content_hash: str | None = None
 
 class DocumentResponse(DocumentBase):
     id: int
     filepath: str
     status: DocumentStatus
+    progress: int = 0
     created_at: datetime
 
     class Config:
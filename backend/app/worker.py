@@ -0,0 +1,165 @@
+# backend/app/worker.py
+
+# Worker xử lý hàng đợi ingest tài liệu, chạy độc lập với tiến trình API:
+#   python -m app.worker                     # chạy worker
+#   python -m app.worker --concurrency 4     # 4 tiến trình xử lý song song
+#   python -m app.worker --requeue-stuck     # đưa các job PROCESSING bị treo về hàng đợi rồi thoát
+#
+# Tiến trình chính chỉ nhận job từ PostgreSQL (SELECT ... FOR UPDATE SKIP LOCKED) và phân phát;
+# việc đọc PDF và tạo embedding chạy trong một ProcessPoolExecutor, mỗi tiến trình con tải model một lần.
+# Có thể chạy nhiều worker trên nhiều máy cùng lúc.
+
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List
+
+from .config import settings
+from .crud import crud_document
+from .db.session import SessionLocal
+from .db.init_db import init_db
+
+
+def _init_worker_process() -> None:
+    """
+    Khởi tạo một tiến trình con: tải trước các thành phần ingest (dense, sparse, qdrant, partition_pdf).
+    """
+    from .core.ingestion import ensure_qdrant_collection_exists
+    from .core.registry import registry, INGESTION_ROLE
+
+    registry.warm_up([INGESTION_ROLE])
+    registry.print_report()
+    ensure_qdrant_collection_exists()
+
+
+def _process_job(document_id: int, worker_id: str) -> bool:
+    from .core.ingestion import run_ingestion_job
+
+    return run_ingestion_job(document_id, worker_id)
+
+
+def requeue_stuck(stale_after_seconds: float) -> None:
+    db = SessionLocal()
+    try:
+        requeued = crud_document.requeue_stuck_documents(db, stale_after_seconds)
+    finally:
+        db.close()
+    if requeued:
+        print(f"WORKER: Đưa {len(requeued)} job bị treo về hàng đợi: {requeued}")
+
+
+def _new_pool(concurrency: int) -> ProcessPoolExecutor:
+    # "spawn": tiến trình con không kế thừa trạng thái (kết nối DB, luồng) của tiến trình chính
+    context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=concurrency, mp_context=context, initializer=_init_worker_process)
+
+
+def _release_jobs(document_ids: List[int], worker_id: str, reason: str) -> None:
+    db = SessionLocal()
+    try:
+        for document_id in document_ids:
+            if crud_document.release_document_job(db, document_id, worker_id, reason):
+                print(f"WORKER: Trả lại document ID {document_id}: {reason}")
+    finally:
+        db.close()
+
+
+def _heartbeat(document_ids: List[int], worker_id: str) -> None:
+    db = SessionLocal()
+    try:
+        crud_document.heartbeat_document_jobs(db, document_ids, worker_id)
+    finally:
+        db.close()
+
+
+def run_worker(concurrency: int, poll_interval: float) -> None:
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"--- Ingestion worker {worker_id} khởi động ({concurrency} tiến trình) ---")
+    init_db(db=SessionLocal())
+
+    in_flight: Dict[Future, int] = {}
+    last_requeue_check = 0.0
+    last_heartbeat = time.monotonic()
+    pool = _new_pool(concurrency)
+    try:
+        while True:
+            now = time.monotonic()
+            if now - last_requeue_check > settings.INGESTION_JOB_STALE_SECONDS / 4:
+                requeue_stuck(settings.INGESTION_JOB_STALE_SECONDS)
+                last_requeue_check = now
+            # Heartbeat từ tiến trình chính trong khi job đang chạy (tiến trình con chỉ cập nhật sau mỗi batch trang)
+            if in_flight and now - last_heartbeat > settings.INGESTION_HEARTBEAT_SECONDS:
+                _heartbeat(list(in_flight.values()), worker_id)
+                last_heartbeat = now
+
+            broken = False
+            # Nhận job mới khi còn tiến trình rảnh
+            while len(in_flight) < concurrency:
+                db = SessionLocal()
+                try:
+                    db_document = crud_document.claim_next_document(db, worker_id)
+                finally:
+                    db.close()
+                if not db_document:
+                    break
+                print(f"WORKER: Nhận document ID {db_document.id} (lần thử {db_document.attempts})")
+                try:
+                    in_flight[pool.submit(_process_job, db_document.id, worker_id)] = db_document.id
+                except BrokenProcessPool:
+                    _release_jobs([db_document.id], worker_id, "Tiến trình xử lý bị dừng đột ngột.")
+                    broken = True
+                    break
+
+            if in_flight and not broken:
+                done, _ = wait(list(in_flight), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    document_id = in_flight.pop(future)
+                    try:
+                        future.result()
+                    except BrokenProcessPool:
+                        # Một tiến trình con chết (ví dụ hết bộ nhớ khi đọc PDF): mọi job trong pool đều hỏng
+                        in_flight[future] = document_id
+                        broken = True
+                    except Exception as e:
+                        print(f"WORKER: Tiến trình xử lý document ID {document_id} lỗi: {e}")
+                        _release_jobs([document_id], worker_id, f"Lỗi không mong muốn khi xử lý: {e}")
+            elif not in_flight:
+                time.sleep(poll_interval)
+
+            if broken:
+                # Không biết job nào làm chết tiến trình: trả lại mọi job đang chạy (tính một lần thử,
+                # file gây lỗi liên tục sẽ chuyển sang FAILED sau INGESTION_MAX_ATTEMPTS) và tạo lại pool
+                print("WORKER: Pool tiến trình xử lý bị hỏng, tạo lại pool.")
+                _release_jobs(list(in_flight.values()), worker_id, "Tiến trình xử lý bị dừng đột ngột (có thể do hết bộ nhớ).")
+                in_flight.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _new_pool(concurrency)
+    except KeyboardInterrupt:
+        print("--- Ingestion worker đang dừng (chờ các job đang chạy) ---")
+        pool.shutdown(wait=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Worker xử lý hàng đợi ingest tài liệu.")
+    parser.add_argument("--concurrency", type=int, default=settings.INGESTION_WORKER_CONCURRENCY,
+                        help="Số tiến trình xử lý tài liệu song song.")
+    parser.add_argument("--poll-interval", type=float, default=settings.INGESTION_POLL_INTERVAL_SECONDS,
+                        help="Khoảng thời gian (giây) giữa các lần kiểm tra hàng đợi.")
+    parser.add_argument("--requeue-stuck", action="store_true",
+                        help="Đưa các job PROCESSING bị treo về hàng đợi rồi thoát.")
+    parser.add_argument("--stale-seconds", type=float, default=settings.INGESTION_JOB_STALE_SECONDS,
+                        help="Job PROCESSING không có heartbeat lâu hơn số giây này được coi là bị treo.")
+    args = parser.parse_args()
+
+    if args.requeue_stuck:
+        requeue_stuck(args.stale_seconds)
+        return
+    run_worker(args.concurrency, args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
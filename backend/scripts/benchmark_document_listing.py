@@ -0,0 +1,217 @@
+# backend/scripts/benchmark_document_listing.py
+
+# Benchmark danh sách tài liệu (GET /documents/) cho một người dùng có rất nhiều tài liệu (mặc định 100k):
+# - trước đây: đọc toàn bộ tài liệu (object ORM đầy đủ, kể cả failure_reason), sắp xếp theo created_at
+# - phân trang keyset (crud_document.aget_documents_page): trang đầu, đi hết mọi trang bằng con trỏ,
+#   so với OFFSET ở trang sâu, và trang đầu khi lọc theo trạng thái
+# --compare-index đo thêm khi chưa có index (owner_id, [status,] created_at, id).
+# Cần PostgreSQL (DATABASE_URL) và asyncpg; tài liệu benchmark thuộc một người dùng riêng,
+# ở trạng thái COMPLETED/FAILED (worker không nhận), và bị xóa với --cleanup.
+#
+# Ví dụ:
+#   poetry run python scripts/benchmark_document_listing.py --documents 100000 --compare-index
+#   poetry run python scripts/benchmark_document_listing.py --cleanup
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import func, insert, select, text
+
+from app import crud, models, schemas
+from app.db.init_db import init_db
+from app.db.session import SessionLocal, engine, dispose_async_engine, get_async_sessionmaker
+
+BENCHMARK_EMAIL = "listing-benchmark@example.com"
+COMPOSITE_INDEXES = {
+    "ix_documents_owner_id_created_at_id": "(owner_id, created_at, id)",
+    "ix_documents_owner_id_status_created_at_id": "(owner_id, status, created_at, id)",
+}
+
+
+def seed(args) -> tuple[int, int]:
+    db = SessionLocal()
+    try:
+        init_db(db)
+        owner = crud.crud_user.get_user_by_email(db, email=BENCHMARK_EMAIL)
+        if owner is None:
+            owner = crud.crud_user.create_user(db, user=schemas.UserCreate(email=BENCHMARK_EMAIL, password="listing-benchmark-password"))
+        existing = db.scalar(select(func.count()).select_from(models.Document).where(models.Document.owner_id == owner.id))
+        rng = random.Random(args.seed)
+        start_time = datetime.now(timezone.utc) - timedelta(days=365)
+        for batch_start in range(existing, args.documents, args.batch_size):
+            rows = []
+            for i in range(batch_start, min(batch_start + args.batch_size, args.documents)):
+                failed = rng.random() < args.failed_ratio
+                rows.append({
+                    "filename": f"tai-lieu-{i}.pdf",
+                    "filepath": f"storage/listing-benchmark/{owner.id}_{i}.pdf",
+                    "status": models.DocumentStatus.FAILED if failed else models.DocumentStatus.COMPLETED,
+                    "failure_reason": ("Traceback (most recent call last):\n" * 40) if failed else None,
+                    "progress": 0 if failed else 100,
+                    # Nhiều tài liệu cùng created_at (upload hàng loạt) để kiểm tra id làm khóa phụ
+                    "created_at": start_time + timedelta(seconds=i // 3),
+                    "owner_id": owner.id,
+                })
+            db.execute(insert(models.Document), rows)
+            db.commit()
+            print(f"  đã tạo {batch_start + len(rows)}/{args.documents} tài liệu")
+        db.execute(text("ANALYZE documents"))
+        db.commit()
+        return owner.id, max(existing, args.documents)
+    finally:
+        db.close()
+
+
+def cleanup() -> None:
+    db = SessionLocal()
+    try:
+        owner = crud.crud_user.get_user_by_email(db, email=BENCHMARK_EMAIL)
+        if owner:
+            db.query(models.Document).filter(models.Document.owner_id == owner.id).delete(synchronize_session=False)
+            db.delete(owner)
+            db.commit()
+            print("Đã xóa dữ liệu benchmark.")
+    finally:
+        db.close()
+
+
+def set_composite_indexes(enabled: bool) -> None:
+    with engine.begin() as connection:
+        for name, columns in COMPOSITE_INDEXES.items():
+            if enabled:
+                connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON documents {columns}"))
+            else:
+                connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        connection.execute(text("ANALYZE documents"))
+
+
+async def timed(repeats: int, run: Callable[[], Awaitable[int]]) -> tuple[float, int]:
+    """
+    Chạy `run` nhiều lần, trả về (trung vị ms, số byte JSON của phản hồi).
+    """
+    durations, size = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        size = await run()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), size
+
+
+def response_bytes(rows) -> int:
+    documents = [schemas.DocumentResponse.model_validate(row).model_dump(mode="json") for row in rows]
+    return len(json.dumps(documents).encode("utf-8"))
+
+
+async def measure(owner_id: int, total: int, args) -> None:
+    session = get_async_sessionmaker()
+
+    async def full_listing() -> int:
+        async with session() as db:
+            result = await db.execute(
+                select(models.Document).where(models.Document.owner_id == owner_id).order_by(models.Document.created_at.desc())
+            )
+            return response_bytes(result.scalars().all())
+
+    async def first_page(status=None) -> int:
+        async with session() as db:
+            rows, _ = await crud.crud_document.aget_documents_page(db, owner_id, args.limit, status=status)
+            return response_bytes(rows)
+
+    async def offset_page() -> int:
+        async with session() as db:
+            result = await db.execute(
+                select(*crud.crud_document.DOCUMENT_LIST_COLUMNS)
+                .where(models.Document.owner_id == owner_id)
+                .order_by(models.Document.created_at.desc(), models.Document.id.desc())
+                .offset(max(0, total - args.limit)).limit(args.limit)
+            )
+            return response_bytes(result.all())
+
+    rows = [
+        ("toàn bộ danh sách (trước đây)", await timed(args.repeats, full_listing)),
+        (f"keyset trang đầu (limit={args.limit})", await timed(args.repeats, first_page)),
+        ("OFFSET trang cuối", await timed(args.repeats, offset_page)),
+        ("keyset trang đầu, status=FAILED", await timed(args.repeats, lambda: first_page(models.DocumentStatus.FAILED))),
+    ]
+    for label, (ms, size) in rows:
+        print(f"  {label:<34} {ms:>9.1f} ms {size / 1024:>10.1f} KiB")
+
+    # Đi hết mọi trang bằng con trỏ: độ trễ mỗi trang không tăng theo độ sâu
+    latencies: List[float] = []
+    after, pages = None, 0
+    async with session() as db:
+        while True:
+            start = time.perf_counter()
+            page_rows, after = await crud.crud_document.aget_documents_page(db, owner_id, args.limit, after=after)
+            latencies.append((time.perf_counter() - start) * 1000)
+            pages += 1
+            if after is None or pages >= args.max_pages:
+                break
+    print(
+        f"  keyset {pages} trang liên tiếp: trung vị {statistics.median(latencies):.2f} ms, "
+        f"trang cuối {latencies[-1]:.2f} ms, max {max(latencies):.2f} ms"
+    )
+
+    if args.explain:
+        async with session() as db:
+            midpoint = await db.execute(
+                select(models.Document.created_at, models.Document.id)
+                .where(models.Document.owner_id == owner_id)
+                .order_by(models.Document.created_at.desc(), models.Document.id.desc())
+                .offset(total // 2).limit(1)
+            )
+            created_at, document_id = midpoint.one()
+            plan = await db.execute(
+                text(
+                    "EXPLAIN (ANALYZE, BUFFERS) SELECT id, filename, filepath, status, progress, created_at FROM documents "
+                    "WHERE owner_id = :owner_id AND (created_at, id) < (:created_at, :id) "
+                    "ORDER BY created_at DESC, id DESC LIMIT :limit"
+                ),
+                {"owner_id": owner_id, "created_at": created_at, "id": document_id, "limit": args.limit + 1},
+            )
+            for (line,) in plan:
+                print(f"    {line}")
+
+
+async def main(args) -> None:
+    if args.cleanup:
+        cleanup()
+        return
+    print(f"Chuẩn bị {args.documents} tài liệu cho {BENCHMARK_EMAIL}...")
+    owner_id, total = seed(args)
+    try:
+        if args.compare_index:
+            set_composite_indexes(False)
+            print("Không có index (owner_id, [status,] created_at, id):")
+            await measure(owner_id, total, args)
+            set_composite_indexes(True)
+        print("Có index (owner_id, [status,] created_at, id):")
+        await measure(owner_id, total, args)
+    finally:
+        set_composite_indexes(True)
+        await dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark danh sách tài liệu: toàn bộ so với phân trang keyset.")
+    parser.add_argument("--documents", type=int, default=100000, help="Số tài liệu của người dùng benchmark.")
+    parser.add_argument("--failed-ratio", type=float, default=0.02, help="Tỷ lệ tài liệu FAILED (có failure_reason dài).")
+    parser.add_argument("--limit", type=int, default=100, help="Số tài liệu mỗi trang.")
+    parser.add_argument("--max-pages", type=int, default=100000, help="Số trang tối đa khi đi hết danh sách.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--compare-index", action="store_true", help="Đo thêm khi chưa có index ghép.")
+    parser.add_argument("--explain", action="store_true", help="In EXPLAIN ANALYZE của truy vấn keyset ở giữa danh sách.")
+    parser.add_argument("--cleanup", action="store_true", help="Xóa người dùng và tài liệu benchmark rồi thoát.")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
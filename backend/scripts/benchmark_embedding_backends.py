@@ -0,0 +1,85 @@
+# backend/scripts/benchmark_embedding_backends.py
+
+# So sánh thông lượng encode (CPU) của các backend suy luận cho model embedding (app/core/model_backends.py):
+# - query: độ trễ encode một câu truy vấn (p50/p95) và một micro-batch ENCODE_BATCH_MAX_SIZE câu, như luồng chat.
+# - bulk: số chunk/giây khi encode `--num-texts` chunk với từng batch size, như luồng ingest.
+# Mỗi cấu hình là "backend[:quantization]" kết hợp với một mức số luồng. Kiểm tra độ lệch so với torch
+# bằng scripts/check_embedding_equivalence.py.
+#
+# Ví dụ:
+#   poetry run python scripts/benchmark_embedding_backends.py \
+#       --variants torch onnx onnx:avx512_vnni openvino openvino:int8 --threads 0 4 --batch-sizes 16 32 64
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings
+from app.core.model_backends import load_model
+from check_embedding_equivalence import load_texts, model_class_for
+
+
+def latencies_ms(run: Callable[[], object], repeats: int) -> List[float]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main(args) -> None:
+    model_name = settings.EMBEDDING_MODEL_NAME if args.model == "dense" else settings.SPARSE_VECTOR_MODEL_NAME
+    model_class = model_class_for(args.model)
+    texts = load_texts(args.texts, args.num_texts)
+    queries = [text[:120] for text in texts[:args.num_queries]]
+    micro_batch = queries[:settings.ENCODE_BATCH_MAX_SIZE]
+    print(f"Model {model_name} ({args.model}), {len(texts)} chunk, {len(queries)} truy vấn")
+    header = f"{'cấu hình':<26} {'1 câu p50':>10} {'p95':>7} {f'batch {len(micro_batch)} ms':>12}"
+    header += "".join(f" {f'bs={size} /s':>10}" for size in args.batch_sizes)
+    print(header)
+
+    for variant in args.variants:
+        backend, _, quantization = variant.partition(":")
+        for threads in args.threads:
+            model = load_model(
+                model_class, model_name, backend=backend, quantization=quantization,
+                num_threads=threads, export_dir=settings.MODEL_EXPORT_DIR,
+            )
+            model.encode(micro_batch)  # warm-up
+            single = []
+            for query in queries:
+                single.extend(latencies_ms(lambda: model.encode([query]), 1))
+            batched = latencies_ms(lambda: model.encode(micro_batch), args.repeats)
+            name = f"{variant} threads={threads or 'auto'}"
+            row = (
+                f"{name:<26} {statistics.median(single):>10.1f} "
+                f"{float(np.percentile(single, 95)):>7.1f} {statistics.median(batched):>12.1f}"
+            )
+            for size in args.batch_sizes:
+                start = time.perf_counter()
+                model.encode(texts, batch_size=size)
+                row += f" {len(texts) / (time.perf_counter() - start):>10.1f}"
+            print(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark thông lượng encode của các backend embedding trên CPU.")
+    parser.add_argument("--model", choices=["dense", "sparse"], default="dense")
+    parser.add_argument("--variants", nargs="+", default=["torch", "onnx"],
+                        help='Backend: "torch", "onnx", "openvino", có thể kèm ":<quantization>" (ví dụ onnx:avx2).')
+    parser.add_argument("--threads", type=int, nargs="+", default=[settings.EMBEDDING_NUM_THREADS],
+                        help="Các mức số luồng suy luận (0: mặc định của backend).")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[settings.EMBEDDING_ENCODE_BATCH_SIZE])
+    parser.add_argument("--texts", default=None, help="File text (mỗi dòng một chunk). Bỏ trống: câu mẫu.")
+    parser.add_argument("--num-texts", type=int, default=1024, help="Số chunk cho phần bulk.")
+    parser.add_argument("--num-queries", type=int, default=100, help="Số truy vấn cho phần query.")
+    parser.add_argument("--repeats", type=int, default=20, help="Số lần đo micro-batch.")
+    main(parser.parse_args())
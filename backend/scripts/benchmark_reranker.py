@@ -0,0 +1,146 @@
+# backend/scripts/benchmark_reranker.py
+
+# So sánh độ trễ (CPU) và NDCG@k của các cấu hình reranker (app/core/reranker.py):
+# backend torch / onnx / onnx lượng tử hóa int8, các mức RERANKER_MAX_LENGTH, và cascade bi-encoder.
+# - Dữ liệu: file JSONL, mỗi dòng {"query": ..., "passages": [...], "labels": [...] (tùy chọn, độ liên quan
+#   của từng passage)}; dòng chỉ có "query" (hoặc text thuần) thì lấy ứng viên từ Qdrant như pipeline chat.
+# - Không có "labels": cấu hình đầu tiên (mặc định torch, max_length đầu tiên) làm tham chiếu, NDCG@k đo
+#   mức giữ nguyên thứ hạng top_k của tham chiếu.
+#
+# Ví dụ:
+#   poetry run python scripts/benchmark_reranker.py --queries queries.jsonl \
+#       --variants torch onnx onnx:avx512_vnni --max-lengths 512 256 --cascade
+
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings
+from app.core.reranker import cosine_scores, load_cross_encoder, select_cascade_head
+
+
+def ndcg_at_k(ranking: List[int], gains: Dict[int, float], k: int) -> float:
+    dcg = sum(gains.get(i, 0.0) / math.log2(rank + 2) for rank, i in enumerate(ranking[:k]))
+    ideal = sorted(gains.values(), reverse=True)[:k]
+    idcg = sum(gain / math.log2(rank + 2) for rank, gain in enumerate(ideal))
+    return dcg / idcg if idcg else 0.0
+
+
+def load_items(path: str) -> List[Dict]:
+    items = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line:
+            items.append(json.loads(line) if line.startswith("{") else {"query": line})
+    return items
+
+
+async def fetch_passages(items: List[Dict], top_k: int) -> None:
+    """
+    Lấy ứng viên rerank từ Qdrant (cùng bước truy xuất và gộp như pipeline chat) cho các dòng chưa có passages.
+    """
+    from app.core.fusion import fuse_candidates
+    from app.core.rag import _build_search_filter, hydrate_candidates, search_candidate_lists
+
+    for item in items:
+        if "passages" in item:
+            continue
+        document_id, user_id = item.get("document_id"), item.get("user_id")
+        result_lists = await search_candidate_lists(
+            item["query"], _build_search_filter(document_id, user_id), top_k * 5, document_id, user_id
+        )
+        candidates = await hydrate_candidates(
+            fuse_candidates(result_lists, budget=top_k * settings.RERANK_CANDIDATES_PER_RESULT)
+        )
+        item["passages"] = [point.payload["text"] for point in candidates]
+
+
+def rank_with(model, item: Dict, top_k: int, cascade: Dict | None) -> tuple[List[int], float, int]:
+    """
+    Trả về (thứ tự passage, thời gian ms, số cặp đã chạy cross-encoder).
+    """
+    passages = item["passages"]
+    start = time.perf_counter()
+    indices = np.arange(len(passages))
+    if cascade is not None:
+        # Vector passage có sẵn trong Qdrant ở pipeline thật nên được tính trước, ngoài phần đo thời gian
+        bi_scores = cosine_scores(cascade["encoder"].encode(item["query"]), item["passage_vectors"])
+        indices = select_cascade_head(bi_scores, top_k, cascade["margin"], top_k * cascade["head_per_result"])
+    scores = model.predict([[item["query"], passages[i]] for i in indices])
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    order = [int(indices[i]) for i in np.argsort(-np.asarray(scores), kind="stable")]
+    return order, elapsed_ms, len(indices)
+
+
+def main(args) -> None:
+    items = load_items(args.queries)
+    if any("passages" not in item for item in items):
+        asyncio.run(fetch_passages(items, args.top_k))
+    items = [item for item in items if item.get("passages")]
+    if not items:
+        raise SystemExit("Không có truy vấn nào có ứng viên để rerank.")
+
+    cascade = None
+    if args.cascade:
+        from sentence_transformers import SentenceTransformer
+
+        encoder = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
+        for item in items:
+            item["passage_vectors"] = encoder.encode(item["passages"])
+        cascade = {"encoder": encoder, "margin": args.cascade_margin, "head_per_result": args.cascade_head_per_result}
+
+    gains_per_item: List[Dict[int, float]] | None = None
+    if all("labels" in item for item in items):
+        gains_per_item = [{i: float(label) for i, label in enumerate(item["labels"]) if label} for item in items]
+
+    print(f"{len(items)} truy vấn, trung bình {statistics.mean(len(i['passages']) for i in items):.1f} passage/truy vấn")
+    print(f"{'cấu hình':<28} {'p50 ms':>8} {'p95 ms':>8} {'cặp':>6} {f'NDCG@{args.top_k}':>9}")
+    configurations = [
+        (variant, max_length, use_cascade)
+        for variant in args.variants
+        for max_length in args.max_lengths
+        for use_cascade in ([False, True] if cascade else [False])
+    ]
+    for variant, max_length, use_cascade in configurations:
+        backend, _, quantization = variant.partition(":")
+        model = load_cross_encoder(
+            settings.RERANKER_MODEL_NAME, backend=backend, quantization=quantization, max_length=max_length or None
+        )
+        model.predict([["warm-up", "warm-up"]])
+        latencies, pairs, rankings = [], [], []
+        for item in items:
+            order, elapsed_ms, n_pairs = rank_with(model, item, args.top_k, cascade if use_cascade else None)
+            latencies.append(elapsed_ms)
+            pairs.append(n_pairs)
+            rankings.append(order)
+        if gains_per_item is None:
+            # Tham chiếu: thứ hạng của cấu hình đầu tiên, độ liên quan giảm dần theo hạng trong top_k
+            gains_per_item = [{i: float(args.top_k - rank) for rank, i in enumerate(order[:args.top_k])} for order in rankings]
+        ndcg = statistics.mean(ndcg_at_k(order, gains, args.top_k) for order, gains in zip(rankings, gains_per_item))
+        name = f"{variant} len={max_length or 'model'}" + (" cascade" if use_cascade else "")
+        p95 = float(np.percentile(latencies, 95))
+        print(f"{name:<28} {statistics.median(latencies):>8.1f} {p95:>8.1f} {statistics.mean(pairs):>6.1f} {ndcg:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark độ trễ và NDCG@k của các cấu hình reranker trên CPU.")
+    parser.add_argument("--queries", required=True, help="File JSONL (query, passages, labels) hoặc danh sách truy vấn.")
+    parser.add_argument("--variants", nargs="+", default=["torch", "onnx"],
+                        help='Backend cần so sánh: "torch", "onnx" hoặc "onnx:<quantization>" (ví dụ onnx:avx512_vnni).')
+    parser.add_argument("--max-lengths", type=int, nargs="+", default=[settings.RERANKER_MAX_LENGTH],
+                        help="Các mức max_length (0: theo model).")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--cascade", action="store_true", help="Đo thêm từng cấu hình với cascade bi-encoder.")
+    parser.add_argument("--cascade-margin", type=float, default=settings.RERANK_CASCADE_MARGIN)
+    parser.add_argument("--cascade-head-per-result", type=int, default=settings.RERANK_CASCADE_HEAD_PER_RESULT)
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+# backend/scripts/build_bm25_index.py
+
+# Xây lại chỉ mục BM25 cục bộ (SPARSE_BACKEND="bm25") từ các chunk đã có trong Qdrant (text lấy từ kho chunk
+# hoặc payload).
+# Dùng khi chuyển một kho tài liệu sẵn có sang nhánh BM25, khi đổi cách tách term
+# (BM25_USE_BIGRAMS, BM25_FOLD_DIACRITICS) hoặc khi chỉ mục trên đĩa bị mất.
+# Nên chạy khi không có job ingest nào đang chạy: thao tác ghi trong lúc xây lại sẽ bị bỏ qua.
+#
+# Ví dụ:
+#   poetry run python scripts/build_bm25_index.py
+#   poetry run python scripts/build_bm25_index.py --query "học phí đại học" --owner-id 1
+
+import argparse
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app import crud
+from app.config import settings
+from app.db.session import SessionLocal
+from app.core.bm25 import Bm25Index, get_bm25_store, tokenize
+from app.core.registry import get_qdrant_client
+
+
+def build(args) -> None:
+    qdrant_client = get_qdrant_client()
+    if not qdrant_client:
+        raise SystemExit("Không khởi tạo được Qdrant client.")
+
+    index = Bm25Index()
+    start = time.perf_counter()
+    offset = None
+    db = SessionLocal()
+    try:
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=settings.QDRANT_COLLECTION_NAME,
+                limit=args.batch_size, offset=offset,
+                with_payload=["text", "document_id", "owner_id", "content_hash"], with_vectors=False,
+            )
+            # Text nằm trong kho chunk (CHUNK_STORE="postgres"), hoặc trong payload với dữ liệu cũ
+            stored = crud.crud_chunk.get_chunks(db, [str(point.id) for point in points]) if settings.CHUNK_STORE == "postgres" else {}
+            for point in points:
+                payload = point.payload or {}
+                text = stored[str(point.id)]["text"] if str(point.id) in stored else payload.get("text", "")
+                index.upsert(
+                    str(point.id), payload["document_id"], payload["owner_id"],
+                    payload.get("content_hash"), dict(Counter(tokenize(text))),
+                )
+            print(f"Đã đọc {index.alive_count} chunk...")
+            if offset is None:
+                break
+    finally:
+        db.close()
+    print(f"Xây chỉ mục xong sau {time.perf_counter() - start:.1f}s: {index.stats()}")
+    get_bm25_store().replace(index)
+
+
+def query(args) -> None:
+    store = get_bm25_store()
+    store.refresh()
+    start = time.perf_counter()
+    hits = store.search(args.query, args.limit, owner_id=args.owner_id)
+    print(f"{len(hits)} kết quả trong {(time.perf_counter() - start) * 1e6:.0f}µs:")
+    for point_id, score in hits:
+        print(f"  {score:8.3f}  {point_id}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Xây lại chỉ mục BM25 cục bộ từ Qdrant.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Số điểm mỗi lần scroll Qdrant.")
+    parser.add_argument("--query", default=None, help="Chỉ chạy thử một truy vấn trên chỉ mục hiện có.")
+    parser.add_argument("--owner-id", type=int, default=None, help="Lọc theo owner_id khi chạy thử truy vấn.")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.query:
+        query(args)
+    else:
+        build(args)
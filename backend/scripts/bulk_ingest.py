@@ -0,0 +1,290 @@
+# backend/scripts/bulk_ingest.py
+
+# Ingest hàng loạt nhiều file PDF song song:
+# - Đọc PDF (partition_pdf) theo từng nhóm trang trong một process pool.
+# - Chunk của mọi tài liệu được gom vào cùng một hàng đợi embed để batch của encoder luôn đầy.
+# - Upsert vào Qdrant bằng nhiều request song song.
+# - In báo cáo thông lượng (trang/s, chunk/s, vector/s) khi kết thúc.
+#
+# Ví dụ:
+#   poetry run python scripts/bulk_ingest.py scripts/system_documents --parse-workers 4
+#   poetry run python scripts/bulk_ingest.py a.pdf b.pdf --owner-email me@example.com
+
+import argparse
+import multiprocessing
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app import crud
+from app.config import settings
+from app.core.bm25 import Bm25IndexWriter
+from app.core.cache import bump_corpus_version
+from app.core.embedding_store import EmbeddingCacheStats
+from app.core.ingestion import (
+    build_point,
+    delete_stale_chunks,
+    encode_chunks,
+    ensure_qdrant_collection_exists,
+    file_sha256,
+    get_page_count,
+    index_chunks_bm25,
+    parse_and_split_page_range,
+    select_new_chunks,
+    store_chunks,
+)
+from app.core.qdrant_writer import QdrantBatchWriter
+from app.core.registry import get_dense_embedding_model, get_sparse_embedding_model, get_qdrant_client
+from app.core.sparse import uses_sparse_model
+from app.db.init_db import init_db
+from app.db.session import SessionLocal
+from app.models.document import Document, DocumentStatus
+from app.schemas.document import DocumentCreate
+from app.schemas.user import UserCreate
+
+DEFAULT_SOURCE_PATH = Path(__file__).resolve().parent / "system_documents"
+
+
+@dataclass
+class DocumentState:
+    document: Document
+    page_count: int
+    ranges_total: int
+    ranges_done: int = 0
+    chunks: int = 0
+    failed: str | None = None
+
+
+@dataclass
+class Throughput:
+    documents: int = 0
+    pages: int = 0
+    chunks: int = 0
+    vectors: int = 0
+    encode_seconds: float = 0.0
+    upsert_requests: int = 0
+    cache_stats: EmbeddingCacheStats = field(default_factory=EmbeddingCacheStats)
+
+
+def collect_pdf_files(paths: List[str]) -> List[Path]:
+    files: List[Path] = []
+    for raw in paths:
+        path = Path(raw)
+        files.extend(sorted(path.glob("*.pdf")) if path.is_dir() else [path])
+    return files
+
+
+def prepare_documents(db, files: List[Path], owner_id: int, storage_dir: Path, worker_id: str) -> List[Document]:
+    """
+    Tạo/cập nhật record Document cho từng file và nhận job (để worker hàng đợi không xử lý trùng).
+    File không đổi (cùng SHA-256, đã COMPLETED) được bỏ qua.
+    """
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    documents = []
+    for pdf_file in files:
+        content_hash = file_sha256(str(pdf_file))
+        db_document = crud.crud_document.get_document_by_filename(db, owner_id=owner_id, filename=pdf_file.name)
+        if db_document and db_document.content_hash == content_hash and db_document.status == DocumentStatus.COMPLETED:
+            print(f"Bỏ qua (không thay đổi): {pdf_file.name}")
+            continue
+        if db_document and db_document.status == DocumentStatus.PROCESSING:
+            print(f"Bỏ qua (đang được xử lý ở nơi khác): {pdf_file.name}")
+            continue
+
+        target_filepath = storage_dir / pdf_file.name
+        if pdf_file.resolve() != target_filepath.resolve():
+            shutil.copyfile(pdf_file, target_filepath)
+        if db_document:
+            db_document = crud.crud_document.requeue_document(
+                db, db_document, filepath=str(target_filepath), content_hash=content_hash
+            )
+        else:
+            db_document = crud.crud_document.create_document(
+                db=db,
+                document_in=DocumentCreate(filename=pdf_file.name, filepath=str(target_filepath), content_hash=content_hash),
+                owner_id=owner_id,
+            )
+        claimed = crud.crud_document.claim_document(db, db_document.id, worker_id)
+        if claimed:
+            documents.append(claimed)
+    return documents
+
+
+class BulkIngestor:
+    """
+    Điều phối ba giai đoạn chạy chồng lên nhau: đọc PDF (process pool), embed (luồng chính,
+    batch gom từ nhiều tài liệu) và upsert (QdrantBatchWriter, song song có giới hạn).
+    Số tác vụ đang chờ ở mỗi giai đoạn bị giới hạn nên bộ nhớ không tăng theo số lượng tài liệu.
+    """
+
+    def __init__(self, args, stats: Throughput, db):
+        self.args = args
+        self.stats = stats
+        self.db = db
+        self.pending_chunks: List[Tuple[DocumentState, str, str]] = []
+        self.writer = QdrantBatchWriter(
+            get_qdrant_client(), batch_size=args.upsert_batch_size, parallelism=args.upsert_parallelism
+        )
+        self.bm25_writer = None if uses_sparse_model() else Bm25IndexWriter()
+
+    def add_chunks(self, state: DocumentState, chunks: List[str]) -> None:
+        store_chunks(self.db, state.document, chunks)
+        if self.bm25_writer is not None:
+            # Id BM25 chưa có trong Qdrant chỉ bị bỏ qua khi lấy payload, nên không cần chờ upsert
+            index_chunks_bm25(state.document, chunks, self.bm25_writer)
+            self.bm25_writer.flush()
+        # Chỉ các chunk chưa có trong Qdrant mới cần embed
+        for offset in range(0, len(chunks), self.args.embed_batch_size):
+            new_chunks = select_new_chunks(state.document, chunks[offset:offset + self.args.embed_batch_size])
+            self.pending_chunks.extend((state, point_id, chunk) for point_id, chunk in new_chunks.items())
+        while len(self.pending_chunks) >= self.args.embed_batch_size:
+            self.flush_embeddings(self.args.embed_batch_size)
+
+    def flush_embeddings(self, limit: int | None = None) -> None:
+        batch = self.pending_chunks[:limit] if limit else self.pending_chunks
+        self.pending_chunks = self.pending_chunks[len(batch):]
+        if not batch:
+            return
+        start = time.perf_counter()
+        dense_embeddings, sparse_vectors = encode_chunks([chunk for _, _, chunk in batch], self.stats.cache_stats)
+        self.stats.encode_seconds += time.perf_counter() - start
+        self.writer.add([
+            build_point(state.document, point_id, chunk, dense_embedding, sparse_vector)
+            for (state, point_id, chunk), dense_embedding, sparse_vector
+            in zip(batch, dense_embeddings, sparse_vectors)
+        ])
+
+    def finish(self) -> None:
+        self.flush_embeddings()
+        self.writer.close()
+        self.stats.vectors = self.writer.points_written
+        self.stats.upsert_requests = self.writer.batches_written
+
+
+def run(args) -> None:
+    worker_id = f"bulk:{multiprocessing.current_process().pid}"
+    sparse_ready = get_sparse_embedding_model() if uses_sparse_model() else True
+    if not all([get_dense_embedding_model(), sparse_ready, get_qdrant_client()]):
+        raise SystemExit("Không khởi tạo được model embedding hoặc Qdrant client.")
+    ensure_qdrant_collection_exists()
+
+    db = SessionLocal()
+    init_db(db)
+    try:
+        owner = crud.crud_user.get_user_by_email(db, email=args.owner_email)
+        if not owner:
+            print(f"Tạo người dùng: {args.owner_email}")
+            owner = crud.crud_user.create_user(db, user=UserCreate(email=args.owner_email, password="a_very_strong_system_password"))
+
+        documents = prepare_documents(
+            db, collect_pdf_files(args.paths), owner.id, Path(args.storage_dir), worker_id
+        )
+        if not documents:
+            print("Không có tài liệu nào cần ingest.")
+            return
+
+        states = {}
+        tasks: List[Tuple[DocumentState, int, int]] = []
+        for document in documents:
+            page_count = get_page_count(document.filepath)
+            ranges = [
+                (first_page, min(first_page + args.pages_per_batch, page_count))
+                for first_page in range(0, page_count, args.pages_per_batch)
+            ]
+            states[document.id] = DocumentState(document, page_count, ranges_total=len(ranges))
+            tasks.extend((states[document.id], first_page, end_page) for first_page, end_page in ranges)
+        print(f"Ingest {len(documents)} tài liệu, {len(tasks)} nhóm trang với {args.parse_workers} tiến trình đọc PDF.")
+
+        stats = Throughput(documents=len(documents))
+        ingestor = BulkIngestor(args, stats, db)
+        start = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.parse_workers, mp_context=context) as parse_pool:
+            in_flight: Dict[Future, Tuple[DocumentState, int, int]] = {}
+            task_iter = iter(tasks)
+            while True:
+                # Giữ tối đa 2 tác vụ đọc PDF cho mỗi tiến trình để kết quả không dồn ứ trong bộ nhớ
+                while len(in_flight) < args.parse_workers * 2:
+                    task = next(task_iter, None)
+                    if task is None:
+                        break
+                    state, first_page, end_page = task
+                    in_flight[parse_pool.submit(parse_and_split_page_range, state.document.filepath, first_page, end_page)] = task
+                if not in_flight:
+                    break
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    state, first_page, end_page = in_flight.pop(future)
+                    if state.failed:
+                        continue
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        state.failed = str(e)
+                        print(f"LỖI khi đọc {state.document.filename} (trang {first_page + 1}-{end_page}): {e}")
+                        continue
+                    state.ranges_done += 1
+                    state.chunks += len(chunks)
+                    stats.pages += end_page - first_page
+                    stats.chunks += len(chunks)
+                    ingestor.add_chunks(state, chunks)
+                    crud.crud_document.update_document_progress(
+                        db, state.document.id, min(99, int(state.ranges_done / state.ranges_total * 100))
+                    )
+        ingestor.finish()
+        elapsed = time.perf_counter() - start
+
+        for state in states.values():
+            document = state.document
+            if state.failed:
+                crud.crud_document.fail_document_job(db, document.id, worker_id, reason=state.failed, retry=False)
+            elif state.chunks == 0:
+                crud.crud_document.fail_document_job(db, document.id, worker_id, reason="No content to process", retry=False)
+            else:
+                delete_stale_chunks(db, document)
+                if ingestor.bm25_writer is not None:
+                    ingestor.bm25_writer.delete_document(document.id, keep_content_hash=document.content_hash)
+                crud.crud_document.update_document_progress(
+                    db, document.id, 99, pages_processed=state.page_count, page_count=state.page_count
+                )
+                crud.crud_document.complete_document_job(db, document.id, worker_id)
+        if ingestor.bm25_writer is not None:
+            ingestor.bm25_writer.flush()
+        bump_corpus_version(owner.id)
+    finally:
+        db.close()
+
+    failed = sum(1 for state in states.values() if state.failed or state.chunks == 0)
+    print("\n--- Báo cáo thông lượng ---")
+    print(f"Tài liệu: {stats.documents} ({failed} lỗi) trong {elapsed:.1f}s")
+    print(f"Trang:    {stats.pages:>8} ({stats.pages / elapsed:.2f} trang/s)")
+    print(f"Chunk:    {stats.chunks:>8} ({stats.chunks / elapsed:.2f} chunk/s)")
+    print(f"Vector:   {stats.vectors:>8} ({stats.vectors / elapsed:.2f} vector/s, {stats.upsert_requests} request upsert)")
+    print(f"Qdrant upsert: {ingestor.writer.report()}")
+    print(f"Thời gian embed: {stats.encode_seconds:.1f}s")
+    if stats.cache_stats.lookups:
+        print(f"Cache embedding: {stats.cache_stats.report()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest hàng loạt file PDF song song.")
+    parser.add_argument("paths", nargs="*", default=[str(DEFAULT_SOURCE_PATH)], help="File PDF hoặc thư mục chứa PDF.")
+    parser.add_argument("--owner-email", default="system@example.com", help="Email người sở hữu tài liệu (tạo mới nếu chưa có).")
+    parser.add_argument("--storage-dir", default=str(Path("storage") / "system_docs"), help="Thư mục lưu bản sao các file.")
+    parser.add_argument("--parse-workers", type=int, default=max(1, (multiprocessing.cpu_count() or 2) - 1),
+                        help="Số tiến trình đọc PDF song song.")
+    parser.add_argument("--pages-per-batch", type=int, default=settings.INGESTION_PAGES_PER_BATCH,
+                        help="Số trang mỗi tác vụ đọc PDF.")
+    parser.add_argument("--embed-batch-size", type=int, default=settings.INGESTION_EMBED_BATCH_SIZE,
+                        help="Số chunk (gom từ nhiều tài liệu) mỗi lượt encode.")
+    parser.add_argument("--upsert-batch-size", type=int, default=settings.QDRANT_UPSERT_BATCH_SIZE,
+                        help="Số điểm mỗi request upsert.")
+    parser.add_argument("--upsert-parallelism", type=int, default=settings.QDRANT_UPSERT_PARALLELISM,
+                        help="Số request upsert song song.")
+    run(parser.parse_args())
@@ -0,0 +1,143 @@
+# backend/scripts/check_embedding_equivalence.py
+
+# Kiểm tra độ lệch embedding của một backend suy luận (onnx/openvino, có thể lượng tử hóa int8) so với
+# torch fp32 trên cùng model, trước khi đổi EMBEDDING_BACKEND/EMBEDDING_QUANTIZATION (app/core/model_backends.py).
+# - Độ lệch: cosine giữa vector tham chiếu và vector của backend cho cùng một text.
+# - Thứ hạng: mỗi text làm truy vấn trên các text còn lại, đo tỉ lệ top_k láng giềng giữ nguyên.
+# Thoát với mã 1 nếu vượt ngưỡng, nên dùng được trong CI/triển khai.
+#
+# Ví dụ:
+#   poetry run python scripts/check_embedding_equivalence.py --backend onnx --quantization avx512_vnni
+#   poetry run python scripts/check_embedding_equivalence.py --model sparse --backend openvino --texts chunks.txt
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings
+from app.core.model_backends import load_model
+
+SAMPLE_TEXTS = [
+    "Hợp đồng lao động phải được giao kết bằng văn bản và làm thành hai bản.",
+    "Người lao động có quyền đơn phương chấm dứt hợp đồng nếu báo trước 30 ngày.",
+    "Thuế giá trị gia tăng được tính trên giá bán chưa có thuế của hàng hóa, dịch vụ.",
+    "Doanh nghiệp phải nộp báo cáo tài chính năm trong thời hạn 90 ngày kể từ khi kết thúc năm tài chính.",
+    "Học sinh được miễn học phí ở bậc tiểu học tại các trường công lập.",
+    "Bệnh nhân cần nhịn ăn ít nhất 8 giờ trước khi xét nghiệm đường huyết lúc đói.",
+    "Mạng nơ-ron tích chập thường được dùng cho các bài toán phân loại ảnh.",
+    "Quy trình tuyển dụng gồm sàng lọc hồ sơ, phỏng vấn và đánh giá năng lực.",
+    "Giá vàng trong nước tăng mạnh theo xu hướng của thị trường thế giới.",
+    "Retrieval-augmented generation kết hợp tìm kiếm tài liệu với mô hình ngôn ngữ lớn.",
+    "Khách hàng có thể đổi trả sản phẩm trong vòng 7 ngày nếu còn nguyên tem mác.",
+    "Nhiệt độ trung bình mùa hè ở Hà Nội khoảng 30 độ C, độ ẩm cao.",
+]
+
+
+def load_texts(path: str | None, num_texts: int) -> List[str]:
+    """
+    Text từ file (mỗi dòng một text) hoặc các câu mẫu được ghép lại để có đủ `num_texts` text khác nhau.
+    """
+    if path:
+        texts = [line.strip() for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+        return texts[:num_texts]
+    texts = []
+    for i in range(num_texts):
+        first = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+        second = SAMPLE_TEXTS[(i * 7 + 3) % len(SAMPLE_TEXTS)]
+        texts.append(first if i < len(SAMPLE_TEXTS) else f"{first} {second} (mục {i})")
+    return texts
+
+
+def encode_matrix(model, texts: List[str], batch_size: int) -> np.ndarray:
+    """
+    Encode thành ma trận numpy float32; kết quả sparse (SparseEncoder) được chuyển sang dạng dense trên vocabulary.
+    """
+    result = model.encode(texts, batch_size=batch_size)
+    if hasattr(result, "to_dense"):
+        result = result.to_dense()
+    if hasattr(result, "cpu"):
+        result = result.cpu().numpy()
+    return np.asarray(result, dtype=np.float32)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def neighbor_overlap(reference: np.ndarray, candidate: np.ndarray, top_k: int) -> float:
+    """
+    Trung bình tỉ lệ top_k láng giềng (theo cosine, bỏ chính nó) giống nhau giữa hai tập vector.
+    """
+    overlaps = []
+    for vectors in (reference, candidate):
+        similarities = vectors @ vectors.T
+        np.fill_diagonal(similarities, -np.inf)
+        overlaps.append(np.argsort(-similarities, axis=1, kind="stable")[:, :top_k])
+    return float(np.mean([len(set(a) & set(b)) / top_k for a, b in zip(*overlaps)]))
+
+
+def model_class_for(kind: str):
+    if kind == "sparse" and settings.SPARSE_ENCODING_MODE == "native":
+        from sentence_transformers import SparseEncoder
+        return SparseEncoder
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer
+
+
+def main(args) -> int:
+    model_name = settings.EMBEDDING_MODEL_NAME if args.model == "dense" else settings.SPARSE_VECTOR_MODEL_NAME
+    model_class = model_class_for(args.model)
+    texts = load_texts(args.texts, args.num_texts)
+    top_k = min(args.top_k, len(texts) - 1)
+    if top_k < 1:
+        raise SystemExit("Cần ít nhất 2 text.")
+
+    reference = normalize(encode_matrix(load_model(model_class, model_name), texts, args.batch_size))
+    candidate_model = load_model(
+        model_class, model_name, backend=args.backend, quantization=args.quantization,
+        num_threads=args.threads, export_dir=settings.MODEL_EXPORT_DIR,
+    )
+    candidate = normalize(encode_matrix(candidate_model, texts, args.batch_size))
+
+    cosines = np.sum(reference * candidate, axis=1)
+    overlap = neighbor_overlap(reference, candidate, top_k)
+    name = args.backend + (f":{args.quantization}" if args.quantization else "")
+    print(f"Model {model_name} ({args.model}), {len(texts)} text, torch fp32 vs {name}")
+    print(f"cosine: min={cosines.min():.5f} p1={np.percentile(cosines, 1):.5f} mean={cosines.mean():.5f}")
+    print(f"top-{top_k} láng giềng giữ nguyên: {overlap:.3f}")
+
+    failures = []
+    if cosines.min() < args.min_cosine:
+        failures.append(f"cosine nhỏ nhất {cosines.min():.5f} < {args.min_cosine}")
+    if cosines.mean() < args.min_mean_cosine:
+        failures.append(f"cosine trung bình {cosines.mean():.5f} < {args.min_mean_cosine}")
+    if overlap < args.min_neighbor_overlap:
+        failures.append(f"top-{top_k} láng giềng {overlap:.3f} < {args.min_neighbor_overlap}")
+    for failure in failures:
+        print(f"KHÔNG ĐẠT: {failure}")
+    if not failures:
+        print("ĐẠT")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kiểm tra độ lệch embedding của backend onnx/openvino so với torch fp32.")
+    parser.add_argument("--model", choices=["dense", "sparse"], default="dense",
+                        help="EMBEDDING_MODEL_NAME (dense) hay SPARSE_VECTOR_MODEL_NAME (sparse).")
+    parser.add_argument("--backend", default=settings.EMBEDDING_BACKEND, help='"onnx" hoặc "openvino".')
+    parser.add_argument("--quantization", default=settings.EMBEDDING_QUANTIZATION,
+                        help='Lượng tử hóa int8 ("avx512_vnni", "avx2"... với onnx; "int8" với openvino).')
+    parser.add_argument("--threads", type=int, default=settings.EMBEDDING_NUM_THREADS)
+    parser.add_argument("--texts", default=None, help="File text (mỗi dòng một chunk). Bỏ trống: câu mẫu.")
+    parser.add_argument("--num-texts", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_ENCODE_BATCH_SIZE)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Ngưỡng cosine nhỏ nhất cho mọi text.")
+    parser.add_argument("--min-mean-cosine", type=float, default=0.995)
+    parser.add_argument("--min-neighbor-overlap", type=float, default=0.9)
+    sys.exit(main(parser.parse_args()))
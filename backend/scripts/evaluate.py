@@ -13,22 +13,34 @@ from ragas.metrics import (
     ContextRelevance,
 )
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 import os
 import sys
 from pathlib import Path
 
 # Thêm đường dẫn để import các module từ app
-sys.path.append(str(Path(__file__).parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 # Import các hàm xử lý RAG và cấu hình
-from app.core.rag import _search_and_rerank_documents, build_final_prompt_with_citation
+from app.core.rag import _search_and_rerank_documents, build_final_prompt
+from app.core.registry import registry, get_dense_embedding_model, QUERY_ROLE
 from app.config import settings
 from unstructured.partition.pdf import partition_pdf # Import để đọc file PDF
 
 # Cấu hình API key cho LangChain từ biến môi trường
 os.environ["GOOGLE_API_KEY"] = settings.GOOGLE_API_KEY
 
+class RegistryEmbeddings(Embeddings):
+    """
+    Bọc dense embedding model trong registry để RAGAs dùng chung,
+    thay vì tải thêm một bản HuggingFaceEmbeddings thứ hai.
+    """
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_dense_embedding_model().encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_dense_embedding_model().encode(text).tolist()
+
 # --- CÁC HÀM TIỆN ÍCH CHO VIỆC ĐÁNH GIÁ ---
 def generate_test_questions(text: str, llm: ChatGoogleGenerativeAI, num_questions: int = 1) -> List[str]:
     """
@@ -49,13 +61,13 @@ async def gather_rag_outputs(questions: List[str], document_id: int, llm: ChatGo
     results = []
     print("Đang thu thập kết quả từ pipeline RAG...")
     for q in questions:
-        context_data = _search_and_rerank_documents(query=q, document_id=document_id)
+        context_data = await _search_and_rerank_documents(query=q, document_id=document_id)
         contexts_text = [doc['text'] for doc in context_data]
         if not contexts_text:
             answer = "Không tìm thấy thông tin."
         else:
             context_for_prompt = "\n\n".join([f"Nguồn [{i+1}]:\n{src['text']}" for i, src in enumerate(context_data)])
-            prompt = build_final_prompt_with_citation(q, context_for_prompt)
+            prompt = build_final_prompt(q, context_for_prompt)
             response = await llm.ainvoke(prompt)
             answer = response.content
         results.append({"question": q, "answer": answer, "contexts": contexts_text})
@@ -73,7 +85,9 @@ async def main(filepath: str, document_id: int):
     print("Đang khởi tạo LLM và Embedding Model cho RAGAs...")
     try:
         gemini_llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", convert_system_message_to_human=True)
-        ragas_embeddings = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL_NAME)
+        registry.warm_up([QUERY_ROLE])
+        registry.print_report()
+        ragas_embeddings = RegistryEmbeddings()
     except Exception as e:
         print(f"Lỗi khởi tạo LLM hoặc Embedding: {e}")
         return
@@ -2,6 +2,7 @@
 
 # Import các thư viện cần thiết
 import asyncio
+import shutil
 from pathlib import Path
 import sys
 import os
@@ -11,8 +12,10 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 # Import các module liên quan đến database, xử lý tài liệu, và schema
 from app.db.session import SessionLocal
-from app.core.ingestion import process_document_and_embed, ensure_qdrant_collection_exists
-from app.crud.crud_document import create_document
+from app.core.ingestion import process_document_and_embed, ensure_qdrant_collection_exists, file_sha256
+from app.core.registry import registry, INGESTION_ROLE
+from app.crud.crud_document import create_document, get_document_by_filename, requeue_document
+from app.models.document import DocumentStatus
 from app.schemas.document import DocumentCreate
 
 # Import các module liên quan đến user (tạo user admin nếu chưa có)
@@ -33,9 +36,9 @@ async def ingest_all_system_documents():
     STORAGE_PATH_FOR_SYSTEM_DOCS.mkdir(parents=True, exist_ok=True)
 
     # Khởi tạo các thành phần cần thiết (vì script độc lập)
-
-    from app.core.llm import get_llm # Tải LLM để các module khác có thể dùng
-    get_llm()
+    # Script chỉ ingest nên không cần tải reranker, LLM hay Tavily.
+    registry.warm_up([INGESTION_ROLE])
+    registry.print_report()
     
     db = SessionLocal()
     try:
@@ -52,28 +55,43 @@ async def ingest_all_system_documents():
         # Lấy id của user hệ thống để gán owner_id cho tài liệu
         system_owner_id = admin_user.id
 
-        # Lặp qua tất cả các file PDF trong thư mục tài liệu hệ thống
+        # Lặp qua tất cả các file PDF trong thư mục tài liệu hệ thống.
+        # File không đổi (cùng SHA-256) được bỏ qua; file đã sửa chỉ embed lại các chunk thay đổi.
+        counts = {"unchanged": 0, "updated": 0, "new": 0}
         for pdf_file in SYSTEM_DOCS_PATH.glob("*.pdf"):
+            content_hash = file_sha256(str(pdf_file))
+            db_document = get_document_by_filename(db, owner_id=system_owner_id, filename=pdf_file.name)
+            if (
+                db_document
+                and db_document.content_hash == content_hash
+                and db_document.status == DocumentStatus.COMPLETED
+            ):
+                print(f"Bỏ qua (không thay đổi): {pdf_file.name}")
+                counts["unchanged"] += 1
+                continue
+
             print(f"Đang xử lý file hệ thống: {pdf_file.name}")
-            
             # Sao chép file vào thư mục storage (giống luồng upload)
             # Điều này đảm bảo đường dẫn trong DB là nhất quán
             target_filepath = STORAGE_PATH_FOR_SYSTEM_DOCS / pdf_file.name
-            with pdf_file.open("rb") as src, target_filepath.open("wb") as dst:
-                dst.write(src.read())
+            shutil.copyfile(pdf_file, target_filepath)
 
-            # Tạo record trong database
-            doc_create = DocumentCreate(filename=pdf_file.name, filepath=str(target_filepath))
-            # Sử dụng owner_id của admin hoặc để None
-            db_document = create_document(db=db, document_in=doc_create, owner_id=system_owner_id) 
+            if db_document:
+                db_document = requeue_document(db, db_document, filepath=str(target_filepath), content_hash=content_hash)
+                counts["updated"] += 1
+            else:
+                doc_create = DocumentCreate(filename=pdf_file.name, filepath=str(target_filepath), content_hash=content_hash)
+                db_document = create_document(db=db, document_in=doc_create, owner_id=system_owner_id)
+                counts["new"] += 1
             
-            print(f"Đã tạo record cho {pdf_file.name} với ID: {db_document.id}, owner_id: {system_owner_id}")
+            print(f"Record cho {pdf_file.name}: ID {db_document.id}, owner_id: {system_owner_id}")
 
-            # Chạy tác vụ nền (trong trường hợp này, chúng ta chạy trực tiếp vì đây là script)
-            # Bạn có thể muốn chạy process_document_and_embed trong một tiến trình riêng nếu có nhiều file
+            # Chạy trực tiếp vì đây là script
             await asyncio.to_thread(process_document_and_embed, document_id=db_document.id)
             print(f"Hoàn tất ingest cho file: {pdf_file.name}")
 
+        print(f"Tổng kết: {counts['new']} mới, {counts['updated']} cập nhật, {counts['unchanged']} không thay đổi.")
+
     finally:
         db.close()
     
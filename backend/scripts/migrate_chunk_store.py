@@ -0,0 +1,84 @@
+# backend/scripts/migrate_chunk_store.py
+
+# Chuyển text của các chunk đã ingest (payload "text" trong Qdrant) sang kho chunk (bảng document_chunks,
+# CHUNK_STORE="postgres"), và với --strip-payload, xóa "text"/"filename" khỏi payload Qdrant để giảm RAM.
+# Có thể chạy lại nhiều lần (upsert theo id điểm); chunk của tài liệu không còn trong PostgreSQL bị bỏ qua.
+# Trong lúc chuyển, chat vẫn hoạt động: chunk chưa có trong kho được lấy từ payload.
+#
+# Ví dụ:
+#   poetry run python scripts/migrate_chunk_store.py
+#   poetry run python scripts/migrate_chunk_store.py --strip-payload
+
+import argparse
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app import crud
+from app.config import settings
+from app.db.init_db import init_db
+from app.db.session import SessionLocal
+from app.core.registry import get_qdrant_client
+
+
+def main(args) -> None:
+    qdrant_client = get_qdrant_client()
+    if not qdrant_client:
+        raise SystemExit("Không khởi tạo được Qdrant client.")
+
+    db = SessionLocal()
+    init_db(db)
+    known_documents: Dict[int, bool] = {}
+    moved = skipped = stripped = 0
+    start = time.perf_counter()
+    offset = None
+    try:
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=settings.QDRANT_COLLECTION_NAME,
+                limit=args.batch_size, offset=offset,
+                with_payload=["text", "document_id", "content_hash"], with_vectors=False,
+            )
+            by_document: Dict[tuple, Dict[str, str]] = defaultdict(dict)
+            for point in points:
+                payload = point.payload or {}
+                if "text" not in payload:
+                    continue
+                document_id = payload["document_id"]
+                if document_id not in known_documents:
+                    known_documents[document_id] = crud.crud_document.get_document(db, document_id) is not None
+                if not known_documents[document_id]:
+                    skipped += 1
+                    continue
+                by_document[(document_id, payload.get("content_hash"))][str(point.id)] = payload["text"]
+
+            for (document_id, content_hash), chunks in by_document.items():
+                crud.crud_chunk.upsert_chunks(db, document_id, content_hash, chunks)
+                moved += len(chunks)
+            # Chỉ xóa khỏi payload sau khi text đã nằm trong kho
+            migrated_ids = [chunk_id for chunks in by_document.values() for chunk_id in chunks]
+            if args.strip_payload and migrated_ids:
+                qdrant_client.delete_payload(
+                    collection_name=settings.QDRANT_COLLECTION_NAME,
+                    keys=["text", "filename"], points=migrated_ids, wait=True,
+                )
+                stripped += len(migrated_ids)
+            print(f"Đã chuyển {moved} chunk ({skipped} bỏ qua, {stripped} payload đã thu gọn)...")
+            if offset is None:
+                break
+    finally:
+        db.close()
+    print(f"Hoàn tất sau {time.perf_counter() - start:.1f}s: {moved} chunk trong kho, {skipped} chunk bỏ qua.")
+    if settings.CHUNK_STORE != "postgres":
+        print('Lưu ý: CHUNK_STORE chưa là "postgres", pipeline vẫn đọc/ghi text trong payload.')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chuyển text chunk từ payload Qdrant sang kho chunk PostgreSQL.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Số điểm mỗi lần scroll Qdrant.")
+    parser.add_argument("--strip-payload", action="store_true", help='Xóa "text" và "filename" khỏi payload sau khi chuyển.')
+    main(parser.parse_args())
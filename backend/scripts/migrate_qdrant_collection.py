@@ -0,0 +1,75 @@
+# backend/scripts/migrate_qdrant_collection.py
+
+# Áp dụng layout collection (app/core/qdrant_collection.py) cho một collection Qdrant đã có:
+# payload index owner_id/document_id, HNSW theo tenant, lượng tử hóa vector dense, vector dense trên đĩa.
+# Mặc định lấy layout từ Settings (QDRANT_*); các tùy chọn dòng lệnh ghi đè từng phần.
+# Không cần ingest lại: Qdrant tối ưu lại các segment ở nền và vẫn phục vụ search trong lúc đó.
+#
+# Ví dụ:
+#   poetry run python scripts/migrate_qdrant_collection.py --dry-run
+#   poetry run python scripts/migrate_qdrant_collection.py --tenant-hnsw --quantization scalar --wait
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from qdrant_client import models
+
+from app.config import settings
+from app.core.qdrant_collection import CollectionLayout, apply_layout
+from app.core.registry import get_qdrant_client
+
+
+def wait_until_optimized(qdrant_client, collection_name: str, poll_seconds: float) -> None:
+    start = time.perf_counter()
+    while True:
+        info = qdrant_client.get_collection(collection_name=collection_name)
+        print(
+            f"  trạng thái {info.status.value}: {info.indexed_vectors_count or 0}/{info.points_count or 0} "
+            f"vector đã index, {info.segments_count} segment"
+        )
+        if info.status == models.CollectionStatus.GREEN:
+            break
+        time.sleep(poll_seconds)
+    print(f"Tối ưu xong sau {time.perf_counter() - start:.0f}s.")
+
+
+def main(args) -> None:
+    qdrant_client = get_qdrant_client()
+    if not qdrant_client:
+        raise SystemExit("Không khởi tạo được Qdrant client.")
+
+    layout = CollectionLayout.from_settings()
+    for field in ("payload_indexes", "tenant_hnsw", "hnsw_m", "quantization", "dense_on_disk"):
+        if getattr(args, field) is not None:
+            setattr(layout, field, getattr(args, field))
+    print(f"Collection '{args.collection}', layout mong muốn: {layout}")
+
+    changes = apply_layout(qdrant_client, args.collection, layout, dry_run=args.dry_run)
+    if not changes:
+        print("Collection đã đúng layout, không có gì thay đổi.")
+        return
+    print("Sẽ áp dụng:" if args.dry_run else "Đã áp dụng:")
+    for change in changes:
+        print(f"  - {change}")
+    if args.wait and not args.dry_run:
+        wait_until_optimized(qdrant_client, args.collection, args.poll_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Áp dụng payload index, HNSW theo tenant và lượng tử hóa cho collection Qdrant.")
+    parser.add_argument("--collection", default=settings.QDRANT_COLLECTION_NAME)
+    parser.add_argument("--payload-indexes", dest="payload_indexes", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--tenant-hnsw", dest="tenant_hnsw", action=argparse.BooleanOptionalAction, default=None,
+                        help="HNSW theo tenant (m=0, payload_m) thay cho graph toàn cục.")
+    parser.add_argument("--hnsw-m", dest="hnsw_m", type=int, default=None)
+    parser.add_argument("--quantization", choices=["", "scalar", "binary"], default=None,
+                        help='Lượng tử hóa vector dense ("" để tắt).')
+    parser.add_argument("--dense-on-disk", dest="dense_on_disk", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in các thay đổi sẽ áp dụng.")
+    parser.add_argument("--wait", action="store_true", help="Chờ Qdrant tối ưu lại xong (trạng thái green).")
+    parser.add_argument("--poll-seconds", type=float, default=5.0)
+    main(parser.parse_args())
@@ -1,11 +1,10 @@
 'use client';
 
 import { useState, Dispatch, SetStateAction } from 'react';
-import { Message, Document } from '@/types/chat';
+import { Message, Document, ChatStreamEvent } from '@/types/chat';
 import MessageList from './MessageList';
 import InputBox from './InputBox';
 import WelcomeMessage from './WelcomeMessage';
-import axios from 'axios';
 import { v4 as uuidv4 } from 'uuid';
 import { useAuthStore } from '@/store/authStore';
 import toast from 'react-hot-toast';
@@ -20,6 +19,8 @@ interface ChatAreaProps {
 
 export default function ChatArea({ document, messages, setConversations }: ChatAreaProps) {
   const [isLoading, setIsLoading] = useState(false);
+  // true khi đã nhận được token đầu tiên: ẩn chỉ báo "Đang trả lời..." nhưng vẫn khóa ô nhập
+  const [isStreaming, setIsStreaming] = useState(false);
   const { token } = useAuthStore();
 
   const handleSendMessage = async (query: string) => {
@@ -54,27 +55,66 @@ export default function ChatArea({ document, messages, setConversations }: ChatA
           return acc;
         }, []);
 
-      const response = await axios.post(
-        `${process.env.NEXT_PUBLIC_API_URL}/chat/`,
-        { query, history: historyForAPI, document_id: document.id },
-        { headers: { Authorization: `Bearer ${token}` } }
-      );
-
+      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: `Bearer ${token}`,
+        },
+        body: JSON.stringify({ query, history: historyForAPI, document_id: document.id }),
+      });
+
+      if (!response.ok || !response.body) {
+        const errorBody = await response.json().catch(() => null);
+        throw new Error(errorBody?.detail || 'Lỗi khi gọi API. Vui lòng thử lại.');
+      }
+
+      // Tạo sẵn tin nhắn của bot, sau đó cập nhật dần khi nhận được nguồn và từng token
       const botMessage: Message = {
         id: uuidv4(),
-        text: response.data.answer,
+        text: '',
         sender: 'bot',
-        sources: response.data.sources,
+        sources: [],
         responseTo: userMessage.id,
       };
+      const updateBotMessage = (patch: Partial<Message>) => {
+        Object.assign(botMessage, patch);
+        setConversations(prev => ({
+          ...prev,
+          [document.id]: [...updatedMessages, { ...botMessage }],
+        }));
+      };
 
-      setConversations(prev => ({
-        ...prev,
-        [document.id]: [...updatedMessages, botMessage],
-      }));
+      // Đọc phản hồi NDJSON: mỗi dòng là một ChatStreamEvent
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      const handleEvent = (event: ChatStreamEvent) => {
+        if (event.type === 'sources') {
+          updateBotMessage({ sources: event.sources ?? [] });
+        } else if (event.type === 'token') {
+          setIsStreaming(true);
+          updateBotMessage({ text: botMessage.text + (event.content ?? '') });
+        } else if (event.type === 'error') {
+          throw new Error(event.content || 'Lỗi khi tạo câu trả lời.');
+        }
+      };
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() ?? '';
+        for (const line of lines) {
+          if (line.trim()) handleEvent(JSON.parse(line));
+        }
+      }
+      if (buffer.trim()) handleEvent(JSON.parse(buffer));
 
     } catch (error: any) {
-      const detailError = error.response?.data?.detail || 'Lỗi khi gọi API. Vui lòng thử lại.';
+      const detailError = error.message || 'Lỗi khi gọi API. Vui lòng thử lại.';
       toast.error(detailError);
 
       const errorMessage: Message = {
@@ -90,6 +130,7 @@ export default function ChatArea({ document, messages, setConversations }: ChatA
       }));
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -113,7 +154,7 @@ export default function ChatArea({ document, messages, setConversations }: ChatA
         </div>
       )}
 
-      {isLoading && (
+      {isLoading && !isStreaming && (
         <div className="flex items-center justify-start p-4 ml-4">
           <div className="bg-gradient-to-r from-blue-100 to-blue-50 border border-blue-200 p-3 rounded-xl flex items-center space-x-2 shadow animate-pulse">
             <FiLoader className="w-5 h-5 text-blue-400 animate-spin" />
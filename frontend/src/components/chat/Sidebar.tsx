@@ -2,7 +2,7 @@
 
 import { useAuthStore } from '@/store/authStore';
 import { useRouter } from 'next/navigation';
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import toast from 'react-hot-toast';
 import { Document } from '@/types/chat';
@@ -25,6 +25,9 @@ interface SidebarProps {
   selectedDocumentId: number | null;
 }
 
+// Số tài liệu mỗi trang khi tải danh sách (tối đa DOCUMENT_LIST_MAX_LIMIT của backend)
+const DOCUMENT_PAGE_SIZE = 100;
+
 export default function Sidebar({ onSelectDocument, onNewChat, selectedDocumentId }: SidebarProps) {
   const { logout, token } = useAuthStore();
   const router = useRouter();
@@ -32,14 +35,39 @@ export default function Sidebar({ onSelectDocument, onNewChat, selectedDocumentI
   const [documents, setDocuments] = useState<Document[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [docToDelete, setDocToDelete] = useState<Document | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  // Ref (không phải state) vì fetchDocuments còn được gọi từ setInterval với closure của lần render đầu
+  const loadedExtraPagesRef = useRef(false);
+
+  // Lấy một trang tài liệu; con trỏ của trang tiếp theo nằm trong header X-Next-Cursor
+  const fetchDocumentPage = async (cursor?: string) => {
+    const response = await axios.get<Document[]>(`${process.env.NEXT_PUBLIC_API_URL}/documents/`, {
+      headers: { Authorization: `Bearer ${token}` },
+      params: { limit: DOCUMENT_PAGE_SIZE, cursor },
+    });
+    const next = response.headers["x-next-cursor"];
+    return { page: response.data, next: typeof next === "string" && next ? next : null };
+  };
 
-  const fetchDocuments = async () => {
+  // Làm mới danh sách: chỉ tải lại trang đầu, các trang sau được tải khi người dùng yêu cầu.
+  // Khi tự động cập nhật trạng thái (keepLoadedPages), các trang đã tải thêm được giữ nguyên
+  // (con trỏ keyset vẫn hợp lệ); còn lại danh sách trở về trang đầu.
+  const fetchDocuments = async (keepLoadedPages = false) => {
     if (!token) return;
     try {
-      const response = await axios.get(`${process.env.NEXT_PUBLIC_API_URL}/documents/`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setDocuments(response.data);
+      const { page, next } = await fetchDocumentPage();
+      if (keepLoadedPages && loadedExtraPagesRef.current) {
+        const pageIds = new Set(page.map((doc) => doc.id));
+        setDocuments((current) => [
+          ...page,
+          ...current.slice(DOCUMENT_PAGE_SIZE).filter((doc) => !pageIds.has(doc.id)),
+        ]);
+      } else {
+        loadedExtraPagesRef.current = false;
+        setDocuments(page);
+        setNextCursor(next);
+      }
     } catch (error) {
       console.error("Failed to fetch documents:", error);
       toast.error("Không thể tải danh sách tài liệu.");
@@ -48,11 +76,27 @@ export default function Sidebar({ onSelectDocument, onNewChat, selectedDocumentI
     }
   };
 
+  const loadMoreDocuments = async () => {
+    if (!token || !nextCursor || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      const { page, next } = await fetchDocumentPage(nextCursor);
+      loadedExtraPagesRef.current = true;
+      setDocuments((current) => [...current, ...page]);
+      setNextCursor(next);
+    } catch (error) {
+      console.error("Failed to fetch more documents:", error);
+      toast.error("Không thể tải thêm tài liệu.");
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     if (token) {
       fetchDocuments();
       const intervalId = setInterval(() => {
-        fetchDocuments();
+        fetchDocuments(true);
       }, 10000);
       return () => clearInterval(intervalId);
     }
@@ -129,7 +173,8 @@ export default function Sidebar({ onSelectDocument, onNewChat, selectedDocumentI
               <FiLoader className="animate-spin text-blue-200" size={28}/>
             </div>
           ) : documents.length > 0 ? (
-            documents.map((doc) => {
+            <>
+            {documents.map((doc) => {
               const isSelectable = doc.status === 'COMPLETED';
               return (
                 <div
@@ -149,6 +194,9 @@ export default function Sidebar({ onSelectDocument, onNewChat, selectedDocumentI
                   <div className="flex items-center truncate">
                     {renderDocStatusIcon(doc.status)}
                     <span className="truncate">{doc.filename}</span>
+                    {doc.status === 'PROCESSING' && doc.progress ? (
+                      <span className="ml-2 text-xs text-yellow-300 shrink-0">{doc.progress}%</span>
+                    ) : null}
                   </div>
                   <button 
                     onClick={(e) => handleDeleteClick(doc, e)}
@@ -159,7 +207,18 @@ export default function Sidebar({ onSelectDocument, onNewChat, selectedDocumentI
                   </button>
                 </div>
               )
-            })
+            })}
+            {nextCursor && (
+              <button
+                onClick={loadMoreDocuments}
+                disabled={isLoadingMore}
+                className="w-full flex items-center justify-center text-sm text-blue-200 hover:bg-blue-800 py-2 rounded-xl transition-all duration-150 disabled:opacity-60"
+              >
+                {isLoadingMore ? <FiLoader className="animate-spin mr-2" /> : null}
+                Tải thêm tài liệu
+              </button>
+            )}
+            </>
           ) : (
             <div className="text-center text-base text-blue-200 mt-6 p-4 border border-dashed border-blue-400 rounded-xl bg-blue-900/30">
               <FiInfo className="mx-auto mb-2" size={28} />
@@ -13,9 +13,18 @@ export interface Message {
   responseTo?: string; // ID của tin nhắn mà tin nhắn này đang trả lời
 }
 
+// Một sự kiện trong phản hồi streaming của /chat/stream (NDJSON)
+export interface ChatStreamEvent {
+  type: 'sources' | 'token' | 'done' | 'error';
+  content?: string;
+  sources?: Source[];
+  metadata?: Record<string, unknown>;
+}
+
 export interface Document {
   id: number;
   filename: string;
   status: 'UPLOADING' | 'PROCESSING' | 'COMPLETED' | 'FAILED';
+  progress?: number;
   created_at: string;
 }
\ No newline at end of file